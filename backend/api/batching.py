@@ -0,0 +1,140 @@
+"""
+Batch resolvers that compute per-row serializer values for a whole page of
+objects in a constant number of queries. Views build them once and hand them
+to the serializers through the serializer context.
+"""
+from collections import defaultdict
+
+from django.db.models import Prefetch, Q
+
+from .models import Likes, Collects, Comments, Users
+
+
+def prefetch_users(lookup, viewer):
+    """
+    Prefetch the users at `lookup` annotated with follow stats for `viewer`
+    (see UsersQuerySet.with_follow_stats), so UserSerializer renders embedded
+    authors without per-row queries.
+    """
+    return Prefetch(
+        lookup,
+        queryset=Users.objects.with_follow_stats(viewer).select_related('profile'),
+    )
+
+
+class PostEngagement:
+    """
+    The viewer's like/save state for a page of posts (counts are stored on
+    the posts themselves). Covers the given posts and their child (day) posts,
+    since PostSerializer nests those under `childPosts`.
+    """
+
+    def __init__(self, post_ids, liked_ids, saved_ids):
+        self.post_ids = set(post_ids)
+        self.liked_ids = liked_ids
+        self.saved_ids = saved_ids
+
+    def covers(self, post):
+        return post.id in self.post_ids or post.parent_post_id in self.post_ids
+
+    def is_liked(self, post):
+        return post.id in self.liked_ids
+
+    def is_saved(self, post):
+        return post.id in self.saved_ids
+
+
+def resolve_post_engagement(post_ids, user):
+    """
+    Resolve PostSerializer's is_liked and is_saved for `post_ids` (and their
+    child posts) in at most two queries.
+    """
+    post_ids = [post_id for post_id in post_ids if post_id is not None]
+    scope = Q(post_id__in=post_ids) | Q(post__parent_post_id__in=post_ids)
+
+    liked_ids, saved_ids = set(), set()
+    if user is not None and user.is_authenticated:
+        liked_ids = set(Likes.objects.filter(scope, user=user)
+                        .values_list('post_id', flat=True))
+        saved_ids = set(Collects.objects.filter(scope, user=user)
+                        .values_list('post_id', flat=True))
+
+    return PostEngagement(post_ids, liked_ids, saved_ids)
+
+
+class CommentThreads:
+    """
+    Every comment on a page of posts (and their child posts), indexed by post
+    and by parent comment so serializers can assemble nested replies in memory.
+    """
+
+    def __init__(self, post_ids, comments, liked_ids):
+        self.post_ids = set(post_ids)
+        self.liked_ids = liked_ids
+        self.top_level = defaultdict(list)
+        self.replies = defaultdict(list)
+        for comment in comments:
+            if comment.reply_to_id is None:
+                self.top_level[comment.post_id].append(comment)
+            else:
+                self.replies[comment.reply_to_id].append(comment)
+        self.covered_post_ids = self.post_ids | {
+            comment.post_id for comment in comments}
+
+    def covers_post(self, post):
+        return post.id in self.post_ids or post.parent_post_id in self.post_ids
+
+    def covers(self, comment):
+        return comment.post_id in self.covered_post_ids
+
+    def top_level_for(self, post):
+        return self.top_level.get(post.id, [])
+
+    def replies_for(self, comment):
+        return self.replies.get(comment.id, [])
+
+    def is_liked(self, comment):
+        return comment.id in self.liked_ids
+
+
+def resolve_comment_threads(post_ids, user):
+    """
+    Fetch the full comment trees of `post_ids` (and their child posts) in one
+    query, plus the viewer's like state in one more, regardless of how many
+    comments or nesting levels there are.
+    """
+    post_ids = [post_id for post_id in post_ids if post_id is not None]
+    comments = list(
+        Comments.objects.filter(
+            Q(post_id__in=post_ids) | Q(post__parent_post_id__in=post_ids))
+        .prefetch_related(prefetch_users('user', user), 'mentioned_users')
+        .order_by('created_at', 'id')
+    )
+    comment_ids = [comment.id for comment in comments]
+
+    liked_ids = set()
+    if comment_ids and user is not None and user.is_authenticated:
+        liked_ids = set(Likes.objects.filter(comment_id__in=comment_ids, user=user)
+                        .values_list('comment_id', flat=True))
+
+    return CommentThreads(post_ids, comments, liked_ids)
+
+
+def post_serializer_context(request, posts):
+    """Serializer context for a page of posts with engagement and comments batched."""
+    post_ids = [post.id for post in posts]
+    user = getattr(request, 'user', None)
+    return {
+        'request': request,
+        'post_engagement': resolve_post_engagement(post_ids, user),
+        'comment_threads': resolve_comment_threads(post_ids, user),
+    }
+
+
+def comment_serializer_context(request, post_ids):
+    """Serializer context for the comment threads of `post_ids`."""
+    return {
+        'request': request,
+        'comment_threads': resolve_comment_threads(
+            post_ids, getattr(request, 'user', None)),
+    }
@@ -0,0 +1,48 @@
+"""
+Denormalized counters: engagement on Posts and Comments, unread
+notifications on Users.
+
+Counters are adjusted with single-row F() updates whenever a Likes,
+Collects, Comments or Notifications row is created, deleted or read (see
+signals.py and notifications.py), so reads never need COUNT queries.
+reconcile() recomputes them from the source tables to repair any drift.
+"""
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Collects, Comments, Likes, Notifications, Posts, Users
+
+
+def adjust(model, pk, field, delta):
+    """Atomically add `delta` to `field` of one row, never going below zero."""
+    if pk is None:
+        return
+    model.objects.filter(pk=pk).update(
+        **{field: Greatest(F(field) + delta, Value(0), output_field=IntegerField())})
+
+
+def _count_of(model, fk, **filters):
+    """Correlated subquery counting `model` rows pointing at the outer row."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{fk: OuterRef('pk')}, **filters)
+            .order_by().values(fk).annotate(total=Count('pk')).values('total')
+        ),
+        Value(0),
+    )
+
+
+def reconcile():
+    """Recompute every counter from the source tables. Returns rows updated per table."""
+    posts = Posts.objects.update(
+        likes_count=_count_of(Likes, 'post'),
+        saves_count=_count_of(Collects, 'post'),
+        comments_count=_count_of(Comments, 'post'),
+    )
+    comments = Comments.objects.update(
+        likes_count=_count_of(Likes, 'comment'),
+    )
+    users = Users.objects.update(
+        unread_notifications_count=_count_of(Notifications, 'recipient', is_read=False),
+    )
+    return {'posts': posts, 'comments': comments, 'users': users}
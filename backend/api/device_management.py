@@ -1,32 +1,56 @@
 # device_management.py
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from firebase_admin import messaging
 from .models import Device
 
 
 class DeviceManager:
     @staticmethod
-    def clean_invalid_tokens(user):
-        """Remove invalid device tokens for a user"""
-        devices = Device.objects.filter(user=user)
-        for device in devices:
-            try:
-                # Try to send a test message
-                message = messaging.Message(
-                    data={'type': 'validation'},
-                    token=device.token
-                )
-                messaging.send(message, dry_run=True)
-            except Exception as e:
-                if 'SenderId mismatch' in str(e):
-                    print(
-                        f"Removing token with mismatched sender ID for user {user.username}: {device.token[:20]}...")
-                    device.delete()
-                elif 'registration-token-not-registered' in str(e).lower():
-                    print(
-                        f"Removing unregistered token for user {user.username}: {device.token[:20]}...")
-                    device.delete()
-                else:
-                    print(f"Error validating token: {str(e)}")
+    def record_send_results(result):
+        """
+        Update device health from a FirebaseManager.send_notification result:
+        successes reset the failure count, permanent rejections invalidate the
+        token and other failures are counted. Three UPDATEs at most.
+        """
+        if not result:
+            return
+        now = timezone.now()
+
+        if result.get('successful_tokens'):
+            Device.objects.filter(token__in=result['successful_tokens']).update(
+                last_success_at=now, failure_count=0)
+
+        failed = result.get('failed_tokens', [])
+        invalid = [f['token'] for f in failed if f['invalid']]
+        transient = [f['token'] for f in failed if not f['invalid']]
+        if invalid:
+            Device.objects.filter(token__in=invalid, invalidated_at__isnull=True).update(
+                invalidated_at=now, failure_count=F('failure_count') + 1)
+        if transient:
+            Device.objects.filter(token__in=transient).update(
+                failure_count=F('failure_count') + 1)
+
+    @staticmethod
+    def prune_dead_tokens():
+        """
+        Delete, in bulk, devices that were invalidated, failed too many times in
+        a row, or have not received a push for DEVICE_TOKEN_STALE_DAYS.
+        Returns the number of devices removed.
+        """
+        stale_before = timezone.now() - timedelta(days=settings.DEVICE_TOKEN_STALE_DAYS)
+        deleted, _ = Device.objects.annotate(
+            last_seen=Coalesce('last_success_at', 'created_at')
+        ).filter(
+            Q(invalidated_at__isnull=False) |
+            Q(failure_count__gte=settings.DEVICE_MAX_FAILURES) |
+            Q(last_seen__lt=stale_before)
+        ).delete()
+        return deleted
 
     @staticmethod
     def register_device(user, token):
@@ -45,8 +69,11 @@ class DeviceManager:
                 defaults={'user': user}
             )
 
-            if not created and device.user != user:
+            if not created and (device.user != user or device.invalidated_at or device.failure_count):
+                # Re-registration vouches for the token again
                 device.user = user
+                device.invalidated_at = None
+                device.failure_count = 0
                 device.save()
 
             return True, "Device registered successfully"
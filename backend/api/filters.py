@@ -0,0 +1,37 @@
+"""Shared query-string filters for the post feeds (global, nearby, follow)."""
+from .models import normalize_category
+
+
+def preprocess_filter_values(raw):
+    """
+    Split a comma-separated query value and normalize each item the same way
+    Posts.normalized_category is stored (no spaces/symbols, lowercase).
+    """
+    processed = []
+    for value in (raw or '').split(','):
+        value = normalize_category(value.strip())
+        if value:  # Add only if not empty
+            processed.append(value)
+    return processed
+
+
+def filter_posts(queryset, request, prefix=''):
+    """
+    Apply the `travel_types` and `periods` query params to a queryset.
+    `prefix` is the lookup path to the post, e.g. 'post__' for timeline entries.
+    """
+    travel_types = preprocess_filter_values(
+        request.query_params.get('travel_types', ''))
+    periods = preprocess_filter_values(
+        request.query_params.get('periods', ''))
+
+    # Filter by travel types if provided
+    if travel_types:
+        queryset = queryset.filter(
+            **{f'{prefix}normalized_category__in': travel_types})
+
+    # Filter by periods if provided
+    if periods:
+        queryset = queryset.filter(**{f'{prefix}period__in': periods})
+
+    return queryset
@@ -1,12 +1,29 @@
 # firebase_utils.py
 import firebase_admin
+import requests
 from firebase_admin import credentials, messaging
 from django.conf import settings
+from django.utils.module_loading import import_string
 import json
 import os
 
+# FCM accepts at most this many tokens per multicast call
+FCM_BATCH_SIZE = 500
+
+# Per-token error codes (FCM v1) meaning the token will never work again.
+# INVALID_ARGUMENT is left out: FCM also returns it for a malformed message
+# (e.g. an oversized data payload), which says nothing about the token, so
+# it only counts as a failed send.
+INVALID_TOKEN_ERRORS = {'UNREGISTERED', 'SENDER_ID_MISMATCH'}
+
+
+class FirebaseAdminTransport:
+    """
+    Sends batches through the Firebase Admin SDK.
+    send_batch() returns one entry per token: None on success, otherwise
+    {'code': <FCM error code>, 'message': str}.
+    """
 
-class FirebaseManager:
     def __init__(self):
         try:
             if not firebase_admin._apps:
@@ -22,8 +39,6 @@ class FirebaseManager:
                     cred_json = json.load(f)
                     print(
                         f"Initializing Firebase for project: {cred_json.get('project_id')}")
-                    print(
-                        f"Using service account: {cred_json.get('client_email')}")
 
                 cred = credentials.Certificate(cred_path)
                 self.app = firebase_admin.initialize_app(cred, {
@@ -33,69 +48,111 @@ class FirebaseManager:
                     f"Firebase Admin SDK initialized successfully for project: {self.app.project_id}")
             else:
                 self.app = firebase_admin.get_app()
-                print(f"Using existing Firebase app: {self.app.project_id}")
 
         except Exception as e:
             print(f"Error initializing Firebase: {str(e)}")
             raise
 
+    @staticmethod
+    def _error_code(exc):
+        if isinstance(exc, messaging.UnregisteredError):
+            return 'UNREGISTERED'
+        if isinstance(exc, messaging.SenderIdMismatchError):
+            return 'SENDER_ID_MISMATCH'
+        return str(getattr(exc, 'code', 'UNKNOWN')).upper()
+
+    def send_batch(self, tokens, title, body, data):
+        message = messaging.MulticastMessage(
+            notification=messaging.Notification(title=title, body=body),
+            data=data,
+            tokens=tokens,
+        )
+        response = messaging.send_each_for_multicast(message, app=self.app)
+        return [
+            None if result.success else {
+                'code': self._error_code(result.exception),
+                'message': str(result.exception),
+            }
+            for result in response.responses
+        ]
+
+
+class HTTPTransport:
+    """
+    Posts each batch as a single JSON request to `FCM_ENDPOINT`/batch.
+    Used with the fake FCM server in api/tests/fake_fcm.py, or any relay
+    speaking the same protocol:
+        request:  {"tokens": [...], "notification": {"title", "body"}, "data": {...}}
+        response: {"results": [{"name": ...} | {"error": {"code", "message"}}, ...]}
+    """
+
+    def __init__(self, endpoint=None, timeout=10):
+        self.endpoint = (endpoint or settings.FCM_ENDPOINT).rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def send_batch(self, tokens, title, body, data):
+        response = self.session.post(f"{self.endpoint}/batch", json={
+            'tokens': tokens,
+            'notification': {'title': title, 'body': body},
+            'data': data,
+        }, timeout=self.timeout)
+        response.raise_for_status()
+        return [result.get('error') for result in response.json()['results']]
+
+
+class FirebaseManager:
+    """
+    Sends push notifications through the transport named by settings.FCM_TRANSPORT,
+    one call per FCM_BATCH_SIZE tokens.
+    """
+
+    def __init__(self, transport=None):
+        self.transport = transport or import_string(settings.FCM_TRANSPORT)()
+
     def send_notification(self, tokens, title, body, data=None):
+        """
+        Send one notification to every token.
+        Returns counts plus `successful_tokens` and `failed_tokens`
+        ([{'token', 'error', 'invalid'}]), where `invalid` marks tokens FCM
+        rejected permanently.
+        """
         if not tokens:
             print("❌ No tokens provided for notification")
             return
 
-        try:
-            print(f"📨 Sending notification to {len(tokens)} devices")
-            print(f"🎯 Firebase Project ID: {self.app.project_id}")
-            print(f"📝 Notification Title: {title}")
-            print(f"📩 Notification Body: {body}")
-            print(f"🔹 Data Payload: {json.dumps(data, indent=2)}")
-
-            # Ensure data is string-based
-            if data:
-                data = {str(k): str(v) for k, v in data.items()}
-
-            success_count = 0
-            failure_count = 0
-            failed_tokens = []
-
-            for token in tokens:
-                try:
-                    print(f"📩 Sending to token: {token[:20]}...")
-
-                    message = messaging.Message(
-                        notification=messaging.Notification(
-                            title=title,
-                            body=body
-                        ),
-                        data=data or {},
-                        token=token
-                    )
-
-                    response = messaging.send(message, app=self.app)
-                    print(f"✅ Message sent successfully. Response: {response}")
-                    success_count += 1
-
-                except Exception as e:
-                    print(f"❌ Error sending to token {token[:20]}: {str(e)}")
-                    failure_count += 1
-                    failed_tokens.append({
+        # Ensure data is string-based
+        data = {str(k): str(v) for k, v in (data or {}).items()}
+        tokens = list(tokens)
+
+        result = {
+            'success_count': 0,
+            'failure_count': 0,
+            'successful_tokens': [],
+            'failed_tokens': [],
+        }
+
+        for start in range(0, len(tokens), FCM_BATCH_SIZE):
+            batch = tokens[start:start + FCM_BATCH_SIZE]
+            try:
+                errors = self.transport.send_batch(batch, title, body, data)
+            except Exception as e:
+                # Transport failure says nothing about the tokens themselves
+                print(f"❌ Error sending batch of {len(batch)}: {str(e)}")
+                errors = [{'code': 'UNAVAILABLE', 'message': str(e)}] * len(batch)
+
+            for token, error in zip(batch, errors):
+                if error is None:
+                    result['success_count'] += 1
+                    result['successful_tokens'].append(token)
+                else:
+                    result['failure_count'] += 1
+                    result['failed_tokens'].append({
                         'token': token,
-                        'error': str(e)
+                        'error': error.get('message', ''),
+                        'invalid': error.get('code') in INVALID_TOKEN_ERRORS,
                     })
 
-            result = {
-                'success_count': success_count,
-                'failure_count': failure_count,
-                'failed_tokens': failed_tokens
-            }
-
-            print(f"📊 Firebase Notification Result: {json.dumps(result, indent=2)}")
-            return result
-
-        except Exception as e:
-            print(f"❌ Error in send_notification: {str(e)}")
-            return {'error': str(e)}
-
-
-
+        print(f"📊 Sent '{title}' to {len(tokens)} devices: "
+              f"{result['success_count']} ok, {result['failure_count']} failed")
+        return result
@@ -0,0 +1,153 @@
+"""
+Image pipeline shared by the upload tasks and MediaStorage.
+
+An upload is decoded once, oriented from its EXIF data and capped at
+IMAGE_MAX_WIDTH. Each smaller width in IMAGE_VARIANT_WIDTHS is then resized
+from the previous, larger one, and every size is encoded in each of
+IMAGE_VARIANT_FORMATS. The resulting keys are recorded as
+
+    {'jpeg': {'320': key, '640': key, '1024': key, '1600': key},
+     'webp': {...}}
+
+where the largest width is the capped original. Serializers turn this map
+into srcset URLs so clients can pick the smallest adequate file.
+
+A tiny blurred JPEG of IMAGE_PLACEHOLDER_WIDTH pixels is also rendered as a
+data URI, small enough to ship inline so tiles are painted before any
+variant has loaded.
+"""
+import hashlib
+from collections import namedtuple
+import base64
+from io import BytesIO
+
+from django.conf import settings
+from PIL import Image, ImageFilter, ImageOps
+
+from .s3 import get_s3_client
+
+# format -> (Pillow format, content type, file extension)
+FORMATS = {
+    'jpeg': ('JPEG', 'image/jpeg', 'jpg'),
+    'webp': ('WEBP', 'image/webp', 'webp'),
+}
+
+# Upload types decode() can open; anything else (SVG, HEIC, ...) is refused up front
+DECODABLE_CONTENT_TYPES = {'image/jpeg', 'image/png', 'image/webp', 'image/gif'}
+
+# Variant keys never change content, so clients and CDNs may cache forever
+VARIANT_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+Variant = namedtuple('Variant', 'format width height data')
+ProcessedImage = namedtuple('ProcessedImage', 'variants width height primary_key placeholder')
+
+
+def content_hash(image_bytes):
+    """SHA-256 hex digest identifying an upload by its bytes."""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def decode(image_bytes):
+    """Open uploaded bytes as an upright RGB image."""
+    img = ImageOps.exif_transpose(Image.open(BytesIO(image_bytes)))
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    return img
+
+
+def _resize(img, width):
+    height = max(1, round(img.height * width / img.width))
+    return img.resize((width, height), Image.Resampling.LANCZOS)
+
+
+def render_variants(img, widths=None, formats=None, max_width=None):
+    """
+    Encode `img` at every configured width and format. Widths not smaller
+    than the (capped) image are skipped.
+    Returns a list of Variant, largest first.
+    """
+    widths = settings.IMAGE_VARIANT_WIDTHS if widths is None else widths
+    formats = settings.IMAGE_VARIANT_FORMATS if formats is None else formats
+    max_width = max_width or settings.IMAGE_MAX_WIDTH
+
+    sizes = [img if img.width <= max_width else _resize(img, max_width)]
+    for width in sorted(widths, reverse=True):
+        if width < sizes[-1].width:
+            sizes.append(_resize(sizes[-1], width))
+
+    variants = []
+    for size in sizes:
+        for fmt in formats:
+            pil_format, _, _ = FORMATS[fmt]
+            buffer = BytesIO()
+            size.save(buffer, format=pil_format,
+                      quality=settings.IMAGE_QUALITY[fmt], optimize=True)
+            variants.append(Variant(fmt, size.width, size.height, buffer.getvalue()))
+    return variants
+
+
+def placeholder(img, width=None):
+    """A low-quality `width` pixel wide JPEG of `img` as a data URI."""
+    width = width or settings.IMAGE_PLACEHOLDER_WIDTH
+    height = max(1, round(img.height * width / img.width))
+    # reducing_gap shrinks by whole factors first, which keeps this cheap
+    small = img.resize((width, height), Image.Resampling.BILINEAR, reducing_gap=2.0)
+    buffer = BytesIO()
+    small.filter(ImageFilter.GaussianBlur(1)).save(buffer, format='JPEG', quality=40)
+    return 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def store_variants(variants, stem, bucket=None):
+    """
+    Upload `variants` as `<stem>_<width>.<ext>` and return the
+    {format: {width: key}} map.
+    """
+    bucket = bucket or settings.MEDIA_BUCKET_NAME
+    s3 = get_s3_client()
+    keys = {}
+    for variant in variants:
+        _, content_type, ext = FORMATS[variant.format]
+        key = f"{stem}_{variant.width}.{ext}"
+        s3.put_object(
+            Bucket=bucket, Key=key, Body=variant.data,
+            ContentType=content_type, CacheControl=VARIANT_CACHE_CONTROL)
+        keys.setdefault(variant.format, {})[str(variant.width)] = key
+    return keys
+
+
+def delete_variants(keys, bucket=None):
+    """Delete every object of a {format: {width: key}} map."""
+    bucket = bucket or settings.MEDIA_BUCKET_NAME
+    s3 = get_s3_client()
+    for by_width in keys.values():
+        for key in by_width.values():
+            s3.delete_object(Bucket=bucket, Key=key)
+
+
+def _pick(keys, fmt, choose):
+    by_width = keys.get(fmt) or next(iter(keys.values()), {})
+    return by_width[choose(by_width, key=int)] if by_width else None
+
+
+def largest(keys, fmt='jpeg'):
+    """Key of the widest variant of `fmt` in a {format: {width: key}} map."""
+    return _pick(keys, fmt, max)
+
+
+def smallest(keys, fmt='jpeg'):
+    """Key of the narrowest variant of `fmt` in a {format: {width: key}} map."""
+    return _pick(keys, fmt, min)
+
+
+def process(image_bytes, stem, bucket=None, with_placeholder=True, **options):
+    """
+    Decode `image_bytes` once, render and upload its variants under `stem`
+    and, unless `with_placeholder` is false, render its placeholder (None
+    otherwise). `options` are passed to render_variants().
+    """
+    img = decode(image_bytes)
+    variants = render_variants(img, **options)
+    keys = store_variants(variants, stem, bucket=bucket)
+    return ProcessedImage(
+        keys, variants[0].width, variants[0].height, largest(keys),
+        placeholder(img) if with_placeholder else None)
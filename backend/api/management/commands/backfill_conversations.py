@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Max, Min, Q
+
+from api.models import Conversation, Message
+
+
+class Command(BaseCommand):
+    help = ('Creates Conversation rows for messages sent before conversations existed. Each '
+            "participant's read watermark is set just below the oldest message they had not read, "
+            'taken from the deprecated Message.is_read field, so run this before that field is removed.')
+
+    def handle(self, *args, **options):
+        pairs = set()
+        for sender_id, receiver_id in (Message.objects.filter(conversation__isnull=True)
+                                       .values_list('sender_id', 'receiver_id').distinct()):
+            pairs.add(tuple(sorted((sender_id, receiver_id))))
+
+        for user_a_id, user_b_id in pairs:
+            conversation = Conversation.objects.for_pair(user_a_id, user_b_id)
+            messages = Message.objects.filter(
+                Q(sender_id=user_a_id, receiver_id=user_b_id)
+                | Q(sender_id=user_b_id, receiver_id=user_a_id))
+            messages.filter(conversation__isnull=True).update(conversation=conversation)
+
+            last_message = messages.order_by('-timestamp', '-id').first()
+            last_id = messages.aggregate(last_id=Max('id'))['last_id']
+            # receiver_id -> id of the oldest message they have not read
+            first_unread = dict(messages.filter(is_read=False).values('receiver_id')
+                                .annotate(first_id=Min('id')).values_list('receiver_id', 'first_id'))
+
+            read_state = {}
+            for side, user_id in (('user_a', user_a_id), ('user_b', user_b_id)):
+                if user_id not in first_unread:
+                    watermark, unread = last_id, 0
+                else:
+                    # Last message before the first unread one; everything after it counts as unread
+                    watermark = messages.filter(
+                        id__lt=first_unread[user_id]).aggregate(id=Max('id'))['id'] or 0
+                    unread = messages.filter(
+                        receiver_id=user_id, id__gt=watermark).aggregate(n=Count('id'))['n']
+                read_state[f'{side}_last_read_message_id'] = watermark
+                read_state[f'{side}_unread_count'] = unread
+
+            Conversation.objects.filter(pk=conversation.pk).update(
+                last_message=last_message,
+                last_activity_at=last_message.timestamp,
+                **read_state,
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Backfilled {len(pairs)} conversations'))
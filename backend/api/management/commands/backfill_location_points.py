@@ -0,0 +1,37 @@
+from django.contrib.gis.geos import Point
+from django.core.management.base import BaseCommand
+
+from api.models import Location
+
+
+class Command(BaseCommand):
+    help = 'Populates Location.point from latitude/longitude for rows where it is missing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        missing = Location.objects.filter(
+            point__isnull=True,
+            latitude__isnull=False,
+            longitude__isnull=False,
+        ).only('id', 'latitude', 'longitude')
+
+        batch = []
+        updated = 0
+        for location in missing.iterator(chunk_size=batch_size):
+            location.point = Point(
+                float(location.longitude), float(location.latitude), srid=4326)
+            batch.append(location)
+            if len(batch) >= batch_size:
+                Location.objects.bulk_update(batch, ['point'])
+                updated += len(batch)
+                batch = []
+
+        if batch:
+            Location.objects.bulk_update(batch, ['point'])
+            updated += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Backfilled point for {updated} locations'))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Posts, normalize_category
+
+
+class Command(BaseCommand):
+    help = 'Populates Posts.normalized_category for rows written before the column existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        posts = Posts.objects.only('id', 'category', 'normalized_category')
+
+        batch = []
+        updated = 0
+        for post in posts.iterator(chunk_size=batch_size):
+            normalized = normalize_category(post.category)
+            if post.normalized_category == normalized:
+                continue
+            post.normalized_category = normalized
+            batch.append(post)
+            if len(batch) >= batch_size:
+                Posts.objects.bulk_update(batch, ['normalized_category'])
+                updated += len(batch)
+                batch = []
+
+        if batch:
+            Posts.objects.bulk_update(batch, ['normalized_category'])
+            updated += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Backfilled normalized_category for {updated} posts'))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Notifications
+
+
+class Command(BaseCommand):
+    help = ('Seeds Notifications.recent_actor_ids with the sender for rows written before the '
+            'column existed, so coalescing does not count the original sender twice')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        notifications = Notifications.objects.filter(
+            recent_actor_ids=[], sender__isnull=False).only('id', 'sender_id', 'recent_actor_ids')
+
+        batch = []
+        updated = 0
+        for notification in notifications.iterator(chunk_size=batch_size):
+            notification.recent_actor_ids = [notification.sender_id]
+            batch.append(notification)
+            if len(batch) >= batch_size:
+                Notifications.objects.bulk_update(batch, ['recent_actor_ids'])
+                updated += len(batch)
+                batch = []
+
+        if batch:
+            Notifications.objects.bulk_update(batch, ['recent_actor_ids'])
+            updated += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Backfilled recent_actor_ids for {updated} notifications'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Follow
+from api.timeline import backfill_follow
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds materialized home timelines from existing follow relationships'
+
+    def handle(self, *args, **kwargs):
+        follows = Follow.objects.values_list('follower_id', 'following_id')
+        written = 0
+        for follower_id, following_id in follows.iterator():
+            written += backfill_follow(follower_id, following_id)
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {written} timeline entries'))
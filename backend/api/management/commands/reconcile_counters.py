@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from api.counters import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Recomputes denormalized like/save/comment counters and unread notification counts'
+
+    def handle(self, *args, **kwargs):
+        updated = reconcile()
+        self.stdout.write(self.style.SUCCESS(
+            f"Reconciled {updated['posts']} posts, {updated['comments']} comments "
+            f"and {updated['users']} users"))
@@ -1,15 +1,75 @@
-from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.contrib.auth.models import AbstractUser, UserManager
+from django.db import models, transaction
 from django.core.validators import FileExtensionValidator
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 from django.contrib.gis.geos import Point
 from django.contrib.gis.db import models
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.db.models import (
+    BooleanField, Case, Count, Exists, F, OuterRef, Q, Subquery, Value, When)
+from django.db.models.functions import Coalesce, Greatest
+import heapq
+import re
 
 
-class Users(AbstractUser):
+def normalize_category(value):
+    """Canonical form of a category for filtering, e.g. 'Road Trip' -> 'roadtrip'."""
+    return re.sub(r'[^\w]', '', value or '').lower()
+
+
+class CounterFieldsMixin:
+    """
+    Keeps save() from writing COUNTER_FIELDS. Those columns are only changed
+    with F() updates (see api/counters.py), so writing back the value loaded
+    into memory would undo increments made since. Pass them in update_fields
+    explicitly to overwrite them.
+    """
+    COUNTER_FIELDS = ()
+
+    def save(self, *args, **kwargs):
+        if (not self._state.adding and kwargs.get('update_fields') is None
+                and not kwargs.get('force_insert')):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.COUNTER_FIELDS
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+
+class UsersQuerySet(models.QuerySet):
+    def with_follow_stats(self, viewer=None):
+        """
+        Annotate followers_count, following_count and is_following (whether
+        `viewer` follows each user) as correlated subqueries, so a list of
+        users is serialized without per-row COUNT/EXISTS queries.
+        """
+        def count_of(fk):
+            return Coalesce(
+                Subquery(
+                    Follow.objects.filter(**{fk: OuterRef('pk')})
+                    .order_by().values(fk).annotate(total=Count('pk')).values('total')
+                ),
+                Value(0),
+            )
+
+        if viewer is not None and viewer.is_authenticated:
+            is_following = Exists(Follow.objects.filter(
+                follower=viewer, following=OuterRef('pk')))
+        else:
+            is_following = Value(False, output_field=BooleanField())
+
+        return self.annotate(
+            followers_count=count_of('following'),
+            following_count=count_of('follower'),
+            is_following=is_following,
+        )
+
+
+class Users(CounterFieldsMixin, AbstractUser):
     """
     Users model that extends the AbstractUser model to include additional fields and functionality.
     Attributes:
@@ -20,6 +80,9 @@ class Users(AbstractUser):
         updated_at (DateTimeField): Timestamp when the user was last updated, automatically set.
         REQUIRED_FIELDS (list): List of fields required for user creation, includes 'email'.
         following (ManyToManyField): Many-to-many relationship to self through the Follow model, representing users this user is following.
+        unread_notifications_count (PositiveIntegerField): Denormalized number of unread notifications, never
+                                                           written by save() (see CounterFieldsMixin).
+        objects (UserManager): Default manager; querysets support with_follow_stats(viewer).
     Meta:
         db_table (str): Name of the database table.
         indexes (list): List of database indexes for the model.
@@ -36,9 +99,14 @@ class Users(AbstractUser):
     # Automatically set when created
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Maintained alongside Notifications writes (see api/notifications.py)
+    unread_notifications_count = models.PositiveIntegerField(default=0, editable=False)
+    COUNTER_FIELDS = ('unread_notifications_count',)
 
     REQUIRED_FIELDS = ['email']
 
+    objects = UserManager.from_queryset(UsersQuerySet)()
+
     following = models.ManyToManyField(
         'self',
         through='Follow',
@@ -69,7 +137,7 @@ class Location(models.Model):
         address (CharField): Full address of the location
         latitude (DecimalField): Latitude coordinate
         longitude (DecimalField): Longitude coordinate
-        point (PointField): Geographic point representation
+        point (PointField): Geographic point representation (WGS84 geography, GiST indexed)
         created_at (DateTimeField): Timestamp of creation
     """
     place_id = models.CharField(max_length=255, unique=True)
@@ -77,13 +145,16 @@ class Location(models.Model):
     address = models.CharField(max_length=512)
     latitude = models.DecimalField(max_digits=9, decimal_places=6)
     longitude = models.DecimalField(max_digits=9, decimal_places=6)
-    point = models.PointField(null=True, blank=True)
+    # Geography so distances are in meters; spatial_index builds the GiST index
+    point = models.PointField(
+        geography=True, srid=4326, spatial_index=True, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def save(self, *args, **kwargs):
         # Create point field from lat/long if not set
-        if self.latitude and self.longitude and not self.point:
-            self.point = Point(float(self.longitude), float(self.latitude))
+        if self.latitude is not None and self.longitude is not None and not self.point:
+            self.point = Point(float(self.longitude),
+                               float(self.latitude), srid=4326)
         super().save(*args, **kwargs)
 
     class Meta:
@@ -98,7 +169,7 @@ class Location(models.Model):
         return self.name
 
 
-class Posts(models.Model):
+class Posts(CounterFieldsMixin, models.Model):
     """
     Represents a post created by a user.
     Attributes:
@@ -111,6 +182,14 @@ class Posts(models.Model):
         updated_at (DateTimeField): The timestamp when the post was last updated.
         status (CharField): The publication status of the post, can be 'draft' or 'published'.
         visibility (CharField): The visibility of the post, can be 'public', 'private', or 'friends'.
+        normalized_category (CharField): Lowercased category without spaces or symbols, set on save.
+        likes_count (PositiveIntegerField): Denormalized number of likes, maintained by signals.
+        saves_count (PositiveIntegerField): Denormalized number of collects, maintained by signals.
+        comments_count (PositiveIntegerField): Denormalized number of comments and replies, maintained by signals.
+                                               The counters are never written by save() (see CounterFieldsMixin).
+        media_status (CharField): Progress of the post's image processing: 'pending' while tasks run, then
+                                  'ready', 'partial' (some images failed) or 'failed'. On a multi-day
+                                  parent post it covers the images of its day posts too.
     Meta:
         db_table (str): The name of the database table.
         indexes (list): The list of indexes for the model.
@@ -138,6 +217,12 @@ class Posts(models.Model):
         ('private', 'Private'),
         ('friends', 'Friends Only'),
     ]
+    MEDIA_STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('partial', 'Partially Processed'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
     id = models.BigAutoField(primary_key=True)
     user = models.ForeignKey(
         Users, on_delete=models.CASCADE, related_name="posts")
@@ -167,6 +252,9 @@ class Posts(models.Model):
         max_length=20,
         help_text="Category of the post, e.g., 'Adventure', 'Hiking'."
     )
+    # Stored at write time so feed filters can use an index
+    normalized_category = models.CharField(
+        max_length=20, blank=True, default='', editable=False)
 
     period = models.CharField(
         max_length=20,
@@ -182,6 +270,15 @@ class Posts(models.Model):
         'self', on_delete=models.CASCADE, null=True, blank=True, related_name="child_posts"
     )
 
+    # Engagement counters, kept in sync by signals (see reconcile_counters)
+    likes_count = models.PositiveIntegerField(default=0)
+    saves_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
+    COUNTER_FIELDS = ('likes_count', 'saves_count', 'comments_count')
+
+    media_status = models.CharField(
+        max_length=10, choices=MEDIA_STATUS_CHOICES, default='ready')
+
     class Meta:
         db_table = "posts"
         indexes = [
@@ -191,14 +288,65 @@ class Posts(models.Model):
             models.Index(fields=["category"]),
             models.Index(fields=["period"]),  # New index for period filtering
             models.Index(fields=["location"]),
+            # Keyset pagination of the feed on (created_at, id)
+            models.Index(fields=["-created_at", "-id"],
+                         name="posts_created_id_idx"),
+            # Filtered feeds: range scan over published top-level posts
+            models.Index(
+                fields=["normalized_category", "period", "-created_at"],
+                name="posts_feed_filter_idx",
+                condition=Q(parent_post__isnull=True, status='published'),
+            ),
         ]
 
+    def save(self, *args, **kwargs):
+        self.normalized_category = normalize_category(self.category)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'category' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'normalized_category'}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         if self.parent_post:
             return f"Day Post: {self.title} (Parent: {self.parent_post.title})"
         return f"Post: {self.title or 'Untitled'} by {self.user.username}"
 
 
+class ImageAsset(models.Model):
+    """
+    Model indexing processed post images by content, so a photo that is
+    uploaded again reuses the stored variants instead of being re-encoded
+    and re-uploaded. Object keys are random rather than derived from the
+    hash, and assets no post image uses any more are deleted by
+    api.tasks.purge_orphaned_images.
+    Attributes:
+        content_hash (CharField): SHA-256 hex digest of the uploaded bytes, unique.
+        image (CharField): Object key of the largest JPEG variant.
+        variants (JSONField): Object keys of the resized copies, {format: {width: key}} (see api/images.py).
+        width (PositiveIntegerField): Width of the largest variant.
+        height (PositiveIntegerField): Height of the largest variant.
+        placeholder (TextField): Tiny blurred JPEG of the image as a data URI.
+        created_at (DateTimeField): Timestamp indicating when the image was first processed.
+        last_used_at (DateTimeField): Timestamp of the latest upload that created or reused the asset.
+    Meta:
+        db_table (str): Name of the database table to use for the ImageAsset model.
+    """
+    content_hash = models.CharField(max_length=64, unique=True)
+    image = models.CharField(max_length=255)
+    variants = models.JSONField(default=dict)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    placeholder = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = "image_assets"
+
+    def __str__(self):
+        return f"Image asset {self.content_hash[:12]} ({self.image})"
+
+
 class PostImages(models.Model):
     """
     Model representing images associated with posts.
@@ -207,6 +355,11 @@ class PostImages(models.Model):
         post (ForeignKey): Foreign key to the Posts model, with a cascade delete option and a related name of 'images'.
         image (ImageField): Field to store the URL/path of the image, with upload location set to 'post_images/' and
                             validators to allow only 'jpg', 'jpeg', and 'png' file extensions.
+                            For processed uploads this is the largest JPEG variant.
+        variants (JSONField): Object keys of the resized copies, {format: {width: key}} (see api/images.py).
+        width (PositiveIntegerField): Width of the largest variant.
+        height (PositiveIntegerField): Height of the largest variant.
+        placeholder (TextField): Tiny blurred JPEG of the image as a data URI, shown while the variants load.
         created_at (DateTimeField): Timestamp indicating when the image was created, automatically set to the current date and time.
     Meta:
         db_table (str): Name of the database table to use for the PostImages model.
@@ -221,7 +374,12 @@ class PostImages(models.Model):
         upload_to="postImages/",
         null=True,
         blank=True,
+        db_index=True,  # purge_orphaned_images looks assets up by key
     )
+    variants = models.JSONField(default=dict, blank=True)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    placeholder = models.TextField(blank=True, default='')
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -233,7 +391,7 @@ class PostImages(models.Model):
         return f"Image for Post: {post_title} ({image_name})"
 
 
-class Comments(models.Model):
+class Comments(CounterFieldsMixin, models.Model):
     """
     Comments model represents user comments on posts within the application.
     Attributes:
@@ -245,6 +403,8 @@ class Comments(models.Model):
         reply_to (ForeignKey): Tracks if this comment is a reply to another comment, linked to the Comments model itself.
         created_at (DateTimeField): Timestamp when the comment was created.
         updated_at (DateTimeField): Timestamp when the comment was last updated.
+        likes_count (PositiveIntegerField): Denormalized number of likes, maintained by signals and never
+                                            written by save() (see CounterFieldsMixin).
     Meta:
         db_table (str): Name of the database table.
         indexes (list): List of indexes for efficient querying.
@@ -280,6 +440,8 @@ class Comments(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    likes_count = models.PositiveIntegerField(default=0)
+    COUNTER_FIELDS = ('likes_count',)
 
     class Meta:
         db_table = 'comments'
@@ -408,26 +570,186 @@ class Collects(models.Model):
 
 ############ Messenger ##################
 User = get_user_model()  # Get the correct user model dynamically
+class ConversationManager(models.Manager):
+    @staticmethod
+    def pair(user_id, other_user_id):
+        """Lookup of the conversation between two users, in stored (user_a <= user_b) order."""
+        user_a_id, user_b_id = sorted((user_id, other_user_id))
+        return {'user_a_id': user_a_id, 'user_b_id': user_b_id}
+
+    def for_pair(self, user_id, other_user_id):
+        """The conversation between two users, created on first use."""
+        conversation, _ = self.get_or_create(**self.pair(user_id, other_user_id))
+        return conversation
+
+    def between(self, user_id, other_user_id):
+        """The conversation between two users, or None if they never talked."""
+        return self.filter(**self.pair(user_id, other_user_id)).first()
+
+    def inbox(self, user):
+        """
+        Conversations `user` takes part in that have a last message, newest
+        activity first. Each side is read in order from its own (user_x,
+        last_activity_at) index and the two runs are merged, instead of
+        OR-ing the sides into one sort over every conversation.
+        """
+        runs = [
+            self.filter(**{side: user}, last_message__isnull=False).select_related(
+                'last_message', 'user_a', 'user_b').order_by('-last_activity_at', '-id')
+            for side in ('user_a', 'user_b')
+        ]
+        seen = set()  # A conversation with oneself is on both sides
+        inbox = []
+        for conversation in heapq.merge(
+                *runs, key=lambda c: (c.last_activity_at, c.id), reverse=True):
+            if conversation.id not in seen:
+                seen.add(conversation.id)
+                inbox.append(conversation)
+        return inbox
+
+    def record_message(self, message):
+        """
+        Move the conversation's last-message pointer to `message` (unless a
+        newer one got there first) and raise the receiver's unread count,
+        in a single UPDATE.
+        """
+        newer = Q(last_message__isnull=True) | Q(last_activity_at__lte=message.timestamp)
+        unread_field = f'{message.conversation.side(message.receiver_id)}_unread_count'
+        return self.filter(pk=message.conversation_id).update(
+            last_message_id=Case(
+                When(newer, then=Value(message.id)), default=F('last_message_id')),
+            last_activity_at=Case(
+                When(newer, then=Value(message.timestamp)), default=F('last_activity_at')),
+            **{unread_field: F(unread_field) + 1},
+        )
+
+    def mark_read(self, conversation, user, up_to=None):
+        """
+        Move `user`'s read watermark to message id `up_to` (default: the
+        highest message id) and set their unread count to what is left above
+        it. The watermark never moves backwards, and reading the whole
+        conversation is a single-row UPDATE however many messages were unread.
+        Returns the number of conversations updated (0 or 1).
+        """
+        side = conversation.side(user.id)
+        watermark = f'{side}_last_read_message_id'
+        unread_field = f'{side}_unread_count'
+        with transaction.atomic():
+            # Messages are saved in one transaction with record_message(), so
+            # once the row is locked each one is either counted below or added after
+            locked = self.select_for_update().filter(pk=conversation.pk).values_list('pk', flat=True)
+            if not locked:
+                return 0
+
+            if up_to is None:
+                # Ids, not last_message: the message with the latest timestamp may not have the highest id
+                last_id = Message.objects.filter(conversation_id=OuterRef('pk')).order_by(
+                    '-id').values('id')[:1]
+                return self.filter(pk=conversation.pk).update(**{
+                    watermark: Greatest(Coalesce(Subquery(last_id), Value(0)), F(watermark)),
+                    unread_field: 0,
+                })
+
+            remaining = conversation.messages.filter(receiver_id=user.id, id__gt=up_to).count()
+            return self.filter(pk=conversation.pk, **{f'{watermark}__lt': up_to}).update(**{
+                watermark: up_to,
+                unread_field: remaining,
+            })
+
+
+class Conversation(models.Model):
+    """
+    Direct-message thread between two users, one row per unordered pair.
+    Attributes:
+        user_a (ForeignKey): The participant with the lower id.
+        user_b (ForeignKey): The participant with the higher id.
+        last_message (ForeignKey): Most recent message, shown in the inbox.
+        last_activity_at (DateTimeField): Timestamp of last_message; the inbox sort key.
+        user_a_unread_count (PositiveIntegerField): Messages user_a has not read.
+        user_b_unread_count (PositiveIntegerField): Messages user_b has not read.
+        user_a_last_read_message_id (BigIntegerField): Read watermark of user_a; every
+            message with a lower or equal id is read (0: nothing read yet).
+        user_b_last_read_message_id (BigIntegerField): Read watermark of user_b.
+    Meta:
+        constraints: One conversation per pair, stored with user_a <= user_b.
+        indexes (list): Per-participant inbox scans, newest activity first.
+    """
+    id = models.BigAutoField(primary_key=True)
+    user_a = models.ForeignKey(
+        Users, on_delete=models.CASCADE, related_name='+')
+    user_b = models.ForeignKey(
+        Users, on_delete=models.CASCADE, related_name='+')
+    last_message = models.ForeignKey(
+        'Message', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_activity_at = models.DateTimeField(default=timezone.now)
+    user_a_unread_count = models.PositiveIntegerField(default=0)
+    user_b_unread_count = models.PositiveIntegerField(default=0)
+    user_a_last_read_message_id = models.BigIntegerField(default=0)
+    user_b_last_read_message_id = models.BigIntegerField(default=0)
+
+    objects = ConversationManager()
+
+    class Meta:
+        db_table = 'conversations'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user_a', 'user_b'], name='unique_conversation_pair'),
+            models.CheckConstraint(
+                condition=Q(user_a__lte=F('user_b')), name='conversation_pair_ordered'),
+        ]
+        indexes = [
+            models.Index(fields=['user_a', '-last_activity_at'],
+                         name='conversation_user_a_idx'),
+            models.Index(fields=['user_b', '-last_activity_at'],
+                         name='conversation_user_b_idx'),
+        ]
+
+    def side(self, user_id):
+        """Column prefix ('user_a' or 'user_b') of the participant `user_id`."""
+        return 'user_a' if user_id == self.user_a_id else 'user_b'
+
+    def other_user_id(self, user):
+        return self.user_b_id if user.id == self.user_a_id else self.user_a_id
+
+    def unread_count_for(self, user):
+        return getattr(self, f'{self.side(user.id)}_unread_count')
+
+    def last_read_message_id_for(self, user_id):
+        return getattr(self, f'{self.side(user_id)}_last_read_message_id')
+
+    def has_read(self, message):
+        """Whether the receiver of `message` has read it, from their watermark."""
+        return message.id <= self.last_read_message_id_for(message.receiver_id)
+
+    def __str__(self):
+        return f"Conversation {self.user_a_id} <-> {self.user_b_id}"
+
+
 class Message(models.Model):
     id = models.BigAutoField(primary_key=True)
+    conversation = models.ForeignKey(
+        Conversation, on_delete=models.CASCADE, null=True, related_name='messages')
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name="sent_messages")
     receiver = models.ForeignKey(User, on_delete=models.CASCADE, related_name="received_messages")
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
+    # Deprecated: read state lives in the Conversation watermarks. Only
+    # backfill_conversations reads this; drop it once that has run everywhere
     is_read = models.BooleanField(default=False)
 
-    @classmethod
-    def get_latest_messages_per_conversation(cls, user):
-        """
-        Fetch the latest message from each conversation (either sender or receiver is the user).
-        """
-        latest_messages = (
-            cls.objects.filter(Q(sender=user) | Q(receiver=user))
-            .order_by("sender", "receiver", "-timestamp")
-            .distinct("sender", "receiver")  # Get the latest for each user pair
-            
-        )
-        return latest_messages
+    class Meta:
+        indexes = [
+            # Chat history: keyset windows over one conversation
+            models.Index(fields=['conversation', '-timestamp', '-id'],
+                         name='message_conversation_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # One transaction with the post_save record_message(), see ConversationManager.mark_read
+        with transaction.atomic():
+            if self.conversation_id is None:
+                self.conversation = Conversation.objects.for_pair(self.sender_id, self.receiver_id)
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.sender} -> {self.receiver}: {self.content[:30]}"
@@ -480,6 +802,10 @@ class Notifications(models.Model):
         ]
     )
     message_text = models.CharField(max_length=255) 
+    # Coalesced notifications ("alice and 12 others liked your post"):
+    # approximate number of distinct actors and the most recent ones, newest first
+    actor_count = models.PositiveIntegerField(default=1)
+    recent_actor_ids = models.JSONField(default=list, blank=True)
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -495,9 +821,13 @@ class Notifications(models.Model):
         ]
         db_table = "notifications"
         indexes = [
-            models.Index(fields=["recipient"]),
-            models.Index(fields=["is_read"]),
-            models.Index(fields=["created_at"]),
+            # Notification feed: keyset pages per recipient
+            models.Index(fields=["recipient", "-created_at", "-id"],
+                         name="notif_recipient_created_idx"),
+            # Unread filter and coalescing lookups only touch unread rows
+            models.Index(fields=["recipient", "-created_at"],
+                         name="notif_unread_idx",
+                         condition=Q(is_read=False)),
         ]
         ordering = ['-created_at']  # Show newest notifications first
 
@@ -536,6 +866,41 @@ class Follow(models.Model):
     def __str__(self):
         return f"{self.follower.username} follows {self.following.username}"
 
+
+class TimelineEntry(models.Model):
+    """
+    One post in a user's materialized home timeline, written when a followed user publishes.
+    Attributes:
+        user (ForeignKey): The user whose home timeline this entry belongs to.
+        post (ForeignKey): The published top-level post.
+        author (ForeignKey): Author of the post, so an unfollow can prune entries in one query.
+        created_at (DateTimeField): Copy of the post's created_at, used as the timeline sort key.
+    Meta:
+        db_table (str): The name of the database table.
+        unique_together (tuple): A post appears at most once per timeline.
+        indexes (list): Keyset index for reading a timeline newest first.
+    """
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(
+        Users, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(
+        Posts, on_delete=models.CASCADE, related_name='timeline_entries')
+    author = models.ForeignKey(
+        Users, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'timeline_entries'
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-post'],
+                         name='timeline_user_created_idx'),
+            models.Index(fields=['user', 'author']),
+        ]
+
+    def __str__(self):
+        return f"Timeline of {self.user_id}: post {self.post_id}"
+
 # Add for role-based relationship
 
 
@@ -561,9 +926,23 @@ class Profile(models.Model):
 
 ############ Notifications ##################
 class Device(models.Model):
+    """
+    An FCM registration token of a user's device.
+    Attributes:
+        user (ForeignKey): Owner of the device.
+        token (CharField): FCM registration token.
+        created_at (DateTimeField): When the token was registered.
+        last_success_at (DateTimeField): Last time FCM accepted a push for this token.
+        failure_count (PositiveIntegerField): Consecutive failed pushes, reset on success.
+        invalidated_at (DateTimeField): When FCM rejected the token permanently; such
+            devices are skipped and deleted by the prune_device_tokens task.
+    """
     user = models.ForeignKey(Users, on_delete=models.CASCADE)
     token = models.CharField(max_length=255, unique=True)  # Store FCM token
     created_at = models.DateTimeField(auto_now_add=True)
+    last_success_at = models.DateTimeField(null=True, blank=True)
+    failure_count = models.PositiveIntegerField(default=0)
+    invalidated_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.user.username} - {self.token}"
@@ -0,0 +1,338 @@
+"""
+Asynchronous notification pipeline.
+
+Signal receivers describe what happened as small JSON events and enqueue()
+hands them to Celery once the surrounding transaction commits, so requests
+never wait on FCM. The worker calls deliver(), which resolves a whole batch
+of events with a fixed number of queries, bulk-creates the Notifications rows
+and sends one push per notification to all of the recipient's devices
+(batched per FCM_BATCH_SIZE tokens by FirebaseManager).
+
+Likes, collects and follows are coalesced: while an unread notification for
+the same (recipient, type, post, comment) is younger than
+NOTIFICATION_COALESCE_WINDOW, new actors are merged into it ("alice and 12
+others liked your post") instead of adding rows, and its push is sent at most
+once per NOTIFICATION_PUSH_COOLDOWN. actor_count is approximate: only the
+last RECENT_ACTORS actors are remembered, so someone who acts again after
+that many others (e.g. unlike, then like) is counted twice.
+
+Every created or updated notification is also published to the recipient's
+realtime stream (see api/realtime.py) together with the new unread count.
+"""
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Prefetch, Q
+from django.utils import timezone
+
+from . import counters, realtime
+from .device_management import DeviceManager
+from .firebase_utils import FirebaseManager
+from .models import Comments, Device, Message, Notifications, PostImages, Posts, Users
+from .serializers import NotificationSerializer
+
+# notification_type -> (push title, message text)
+NOTIFICATION_TEMPLATES = {
+    'like_post': ('New Like', '{actors} liked your post'),
+    'like_comment': ('New Like', '{actors} liked your comment'),
+    'comment': ('New Comment', '{actors} commented on your post'),
+    'reply': ('New Reply', '{actors} replied to your comment'),
+    'mention': ('New Mention', '{actors} mentioned you in a comment'),
+    'collect': ('New Collection', '{actors} collected your post'),
+    'follow': ('New Follower', '{actors} started following you'),
+    'message': ('New Message', 'New message from {actors}'),
+}
+
+# Types merged into a single row per (recipient, type, post, comment)
+COALESCED_TYPES = {'like_post', 'like_comment', 'collect', 'follow'}
+
+# How many actor ids a coalesced notification remembers, and so how far back
+# repeat actors are recognised
+RECENT_ACTORS = 5
+
+_firebase = None
+
+
+def get_firebase():
+    """FirebaseManager for this process, created on first push rather than at import."""
+    global _firebase
+    if _firebase is None:
+        _firebase = FirebaseManager()
+    return _firebase
+
+
+def event(notification_type, recipient_id, sender_id,
+          post_id=None, comment_id=None, message_id=None):
+    """Build a JSON-serializable notification event."""
+    return {
+        'type': notification_type,
+        'recipient_id': recipient_id,
+        'sender_id': sender_id,
+        'post_id': post_id,
+        'comment_id': comment_id,
+        'message_id': message_id,
+    }
+
+
+def enqueue(*events):
+    """Send `events` to the notification worker once the current transaction commits."""
+    from .tasks import deliver_notifications
+
+    events = [e for e in events if e['recipient_id'] is not None]
+    if events:
+        transaction.on_commit(lambda: deliver_notifications.delay(events))
+
+
+def _existing_ids(model, ids):
+    ids = {pk for pk in ids if pk is not None}
+    if not ids:
+        return set()
+    return set(model.objects.filter(id__in=ids).values_list('id', flat=True))
+
+
+def _actors(username, actor_count):
+    """'alice', 'alice and 1 other' or 'alice and 12 others'."""
+    others = actor_count - 1
+    if others <= 0:
+        return username
+    return f"{username} and {others} other{'s' if others > 1 else ''}"
+
+
+def _coalesce_key(notification_type, recipient_id, post_id, comment_id):
+    return (notification_type, recipient_id, post_id, comment_id)
+
+
+def _add_actor(notification, actor_id):
+    """Merge one actor into a coalesced notification. Returns False for recent repeat actors."""
+    if not notification.recent_actor_ids and notification.sender_id:
+        # Row written before recent_actor_ids existed (see backfill_notification_actors)
+        notification.recent_actor_ids = [notification.sender_id]
+    if actor_id in notification.recent_actor_ids:
+        return False
+    notification.actor_count += 1
+    notification.recent_actor_ids = [actor_id] + notification.recent_actor_ids[:RECENT_ACTORS - 1]
+    notification.sender_id = actor_id
+    return True
+
+
+def coalesce(groups, usernames):
+    """
+    Merge grouped coalescible events into the recipients' recent unread
+    notifications, creating rows only for keys without one.
+    `groups` maps _coalesce_key(...) to a list of events.
+    Returns (created, updated) lists of Notifications.
+    """
+    if not groups:
+        return [], []
+
+    match = Q()
+    for notification_type, recipient_id, post_id, comment_id in groups:
+        match |= Q(notification_type=notification_type, recipient_id=recipient_id,
+                   post_id=post_id, comment_id=comment_id)
+    now = timezone.now()
+
+    with transaction.atomic():
+        existing = {}
+        for notification in Notifications.objects.select_for_update().filter(
+                match, is_read=False,
+                created_at__gte=now - settings.NOTIFICATION_COALESCE_WINDOW,
+        ).order_by('created_at'):
+            # Newest row wins if there are several
+            existing[_coalesce_key(
+                notification.notification_type, notification.recipient_id,
+                notification.post_id, notification.comment_id)] = notification
+
+        created, updated = [], []
+        for key, group in groups.items():
+            notification_type, recipient_id, post_id, comment_id = key
+            notification = existing.get(key)
+            is_new = notification is None
+            if is_new:
+                notification = Notifications(
+                    recipient_id=recipient_id, post_id=post_id, comment_id=comment_id,
+                    notification_type=notification_type,
+                    actor_count=0, recent_actor_ids=[])
+
+            changed = False
+            for e in group:
+                changed = _add_actor(notification, e['sender_id']) or changed
+            if not changed:
+                continue
+
+            _, text = NOTIFICATION_TEMPLATES[notification_type]
+            notification.message_text = text.format(actors=_actors(
+                usernames[notification.sender_id], notification.actor_count))
+            if is_new:
+                created.append(notification)
+            else:
+                # Resurface the merged notification at the top of the list
+                notification.created_at = now
+                updated.append(notification)
+
+        Notifications.objects.bulk_update(updated, [
+            'sender', 'actor_count', 'recent_actor_ids', 'message_text', 'created_at'])
+        created = Notifications.objects.bulk_create(created)
+
+    return created, updated
+
+
+def deliver(events):
+    """
+    Create (or coalesce) the notifications described by `events` and push them.
+    Events whose post, comment or message was deleted before the worker ran
+    are dropped. Returns the Notifications that were created or updated.
+    """
+    post_ids = _existing_ids(Posts, (e['post_id'] for e in events))
+    comment_ids = _existing_ids(Comments, (e['comment_id'] for e in events))
+    messages = dict(Message.objects.filter(
+        id__in={e['message_id'] for e in events if e['message_id']}
+    ).values_list('id', 'content'))
+    usernames = dict(Users.objects.filter(
+        id__in={e['sender_id'] for e in events}
+    ).values_list('id', 'username'))
+
+    notifications = []
+    groups = defaultdict(list)
+    for e in events:
+        if e['post_id'] and e['post_id'] not in post_ids:
+            continue
+        if e['comment_id'] and e['comment_id'] not in comment_ids:
+            continue
+        if e['message_id'] and e['message_id'] not in messages:
+            continue
+        if e['sender_id'] not in usernames:
+            continue
+        if e['type'] in COALESCED_TYPES:
+            groups[_coalesce_key(
+                e['type'], e['recipient_id'], e['post_id'], e['comment_id'])].append(e)
+            continue
+        _, text = NOTIFICATION_TEMPLATES[e['type']]
+        notifications.append(Notifications(
+            recipient_id=e['recipient_id'],
+            sender_id=e['sender_id'],
+            post_id=e['post_id'],
+            comment_id=e['comment_id'],
+            message_id=e['message_id'],
+            notification_type=e['type'],
+            message_text=text.format(actors=usernames[e['sender_id']]),
+            recent_actor_ids=[e['sender_id']],
+        ))
+
+    with transaction.atomic():
+        notifications = Notifications.objects.bulk_create(notifications)
+        created, updated = coalesce(groups, usernames)
+        # Coalesced updates were already unread; only new rows count
+        _count_unread(notifications + created)
+    notifications += created + updated
+
+    publish_realtime(notifications)
+    send_pushes(notifications, usernames, messages)
+    return notifications
+
+
+def with_feed_relations(queryset):
+    """Load what NotificationSerializer renders, in a fixed number of queries."""
+    return queryset.select_related(
+        'sender',
+        'post',
+        'comment',
+    ).prefetch_related(
+        # Only the first image is used, as the thumbnail
+        Prefetch('post__images', queryset=PostImages.objects.order_by('id')),
+    )
+
+
+def publish_realtime(notifications):
+    """Stream `notifications` to their recipients' open realtime connections."""
+    if not notifications:
+        return
+    rows = list(with_feed_relations(Notifications.objects.filter(
+        id__in=[n.id for n in notifications])))
+    unread = dict(Users.objects.filter(
+        id__in={n.recipient_id for n in rows}
+    ).values_list('id', 'unread_notifications_count'))
+
+    for notification, data in zip(rows, NotificationSerializer(rows, many=True).data):
+        realtime.publish(notification.recipient_id, 'notification', {
+            'notification': data,
+            'unread_count': unread.get(notification.recipient_id, 0),
+        })
+
+
+def _count_unread(notifications):
+    """Raise recipients' unread_notifications_count by the number of new `notifications` each got."""
+    for recipient_id, count in Counter(n.recipient_id for n in notifications).items():
+        counters.adjust(Users, recipient_id, 'unread_notifications_count', count)
+
+
+def mark_read(user, notifications):
+    """
+    Mark `notifications` (a queryset) read for `user` and lower the user's
+    unread counter by the number of rows that actually changed.
+    Returns that number.
+    """
+    with transaction.atomic():
+        marked = notifications.filter(recipient=user, is_read=False).update(is_read=True)
+        counters.adjust(Users, user.id, 'unread_notifications_count', -marked)
+    return marked
+
+
+def get_unread_count(user):
+    """Current unread notification count of `user`, read from the counter column."""
+    return Users.objects.filter(pk=user.pk).values_list(
+        'unread_notifications_count', flat=True).first() or 0
+
+
+def _push_allowed(notification):
+    """Rate-limit pushes of coalesced notifications to one per key per cooldown."""
+    if notification.notification_type not in COALESCED_TYPES:
+        return True
+    key = 'notification-push:{}:{}:{}:{}'.format(*_coalesce_key(
+        notification.notification_type, notification.recipient_id,
+        notification.post_id, notification.comment_id))
+    return cache.add(key, 1, timeout=settings.NOTIFICATION_PUSH_COOLDOWN)
+
+
+def send_pushes(notifications, usernames, messages):
+    """Push each notification to all of its recipient's devices."""
+    notifications = [n for n in notifications if _push_allowed(n)]
+
+    # Invalidated tokens are skipped; prune_device_tokens deletes them later
+    tokens = defaultdict(list)
+    for user_id, token in Device.objects.filter(
+            user_id__in={n.recipient_id for n in notifications},
+            invalidated_at__isnull=True).values_list('user_id', 'token'):
+        tokens[user_id].append(token)
+
+    if not tokens:
+        return
+
+    firebase = get_firebase()
+    for notification in notifications:
+        recipient_tokens = tokens.get(notification.recipient_id)
+        if not recipient_tokens:
+            continue
+
+        title, _ = NOTIFICATION_TEMPLATES[notification.notification_type]
+        body = notification.message_text
+        data = {
+            'type': notification.notification_type,
+            'notification_id': str(notification.id),
+            'post_id': str(notification.post_id or ''),
+            'comment_id': str(notification.comment_id or ''),
+        }
+        if notification.message_id:
+            sender = usernames[notification.sender_id]
+            body = f"{sender}: {messages[notification.message_id][:50]}"
+            data.update({
+                'sender_id': str(notification.sender_id),
+                'receiver_id': str(notification.recipient_id),
+                'message_id': str(notification.message_id),
+            })
+
+        result = firebase.send_notification(
+            tokens=recipient_tokens, title=title, body=body, data=data)
+
+        DeviceManager.record_send_results(result)
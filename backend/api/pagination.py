@@ -0,0 +1,125 @@
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    """Raised when a client sends a cursor we did not issue."""
+
+
+def encode_cursor(created_at, pk):
+    """
+    Build an opaque cursor from the last row of a page.
+    The cursor is a url-safe base64 JSON pair of (timestamp, id).
+    """
+    payload = json.dumps([created_at.isoformat(), pk])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Reverse of encode_cursor. Returns a (datetime, id) tuple."""
+    try:
+        created_at, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        created_at = parse_datetime(created_at)
+        if created_at is None:
+            raise ValueError(cursor)
+        return created_at, int(pk)
+    except (TypeError, ValueError, UnicodeError):
+        raise InvalidCursor(cursor)
+
+
+def get_page_size(request, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Read `page_size` from the query string, clamped to [1, maximum]."""
+    try:
+        page_size = int(request.query_params.get('page_size', default))
+    except (TypeError, ValueError):
+        page_size = default
+    return max(1, min(page_size, maximum))
+
+
+def _seek(queryset, cursor, lookup, time_field, id_field):
+    """Keep the rows strictly past `cursor` in (time_field, id_field) order; `lookup` is 'lt' or 'gt'."""
+    created_at, pk = decode_cursor(cursor)
+    return queryset.filter(
+        Q(**{f'{time_field}__{lookup}': created_at}) |
+        Q(**{time_field: created_at, f'{id_field}__{lookup}': pk})
+    )
+
+
+def keyset_paginate(queryset, cursor=None, page_size=DEFAULT_PAGE_SIZE,
+                    time_field='created_at', id_field='id'):
+    """
+    Return one page of `queryset`, newest first, and the cursor of the next page.
+
+    Rows are ordered by (time_field DESC, id_field DESC) and the cursor marks
+    the last row that was returned, so every page is a bounded index range
+    scan instead of an OFFSET over the whole table.
+
+    Returns:
+        (list, str | None): the rows of the page and the `next` cursor
+        (None when there are no more rows).
+    """
+    if cursor:
+        queryset = _seek(queryset, cursor, 'lt', time_field, id_field)
+
+    # Fetch one extra row to know whether a next page exists
+    rows = list(queryset.order_by(
+        f'-{time_field}', f'-{id_field}')[:page_size + 1])
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor(
+            getattr(last, time_field), getattr(last, id_field))
+    return rows, next_cursor
+
+
+def keyset_window(queryset, before=None, after=None, page_size=DEFAULT_PAGE_SIZE,
+                  time_field='created_at', id_field='id'):
+    """
+    Return a window of `queryset` in chronological order, for chat-style
+    history that opens at the newest rows and scrolls in both directions.
+
+    Without a cursor the window holds the latest `page_size` rows; with
+    `before` the rows just older than that cursor, with `after` the rows just
+    newer. Like keyset_paginate, each window is one bounded index range scan.
+
+    Returns:
+        (list, str | None, str | None): the rows, oldest first, and the
+        `before` / `after` cursors. `before` is None once the window reaches
+        the oldest row. `after` always marks the newest row seen, even on the
+        latest window, so clients can poll it for messages that arrive
+        later; an empty catch-up window hands back the cursor it was given.
+    """
+    if before and after:
+        raise InvalidCursor('before and after cannot be combined')
+
+    if after:
+        queryset = _seek(queryset, after, 'gt', time_field, id_field)
+        ordering = (time_field, id_field)
+    else:
+        if before:
+            queryset = _seek(queryset, before, 'lt', time_field, id_field)
+        ordering = (f'-{time_field}', f'-{id_field}')
+
+    # Fetch one extra row to know whether the window can be extended further
+    rows = list(queryset.order_by(*ordering)[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if not after:
+        rows.reverse()
+    if not rows:
+        return rows, None, after
+
+    def cursor_of(row):
+        return encode_cursor(getattr(row, time_field), getattr(row, id_field))
+
+    if after:
+        return rows, cursor_of(rows[0]), cursor_of(rows[-1])
+    return rows, cursor_of(rows[0]) if has_more else None, cursor_of(rows[-1])
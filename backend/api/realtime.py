@@ -0,0 +1,144 @@
+"""
+Realtime fan-out of notifications and messages to connected clients.
+
+Producers call publish(user_id, event_type, data) from ordinary sync code
+(request handlers, Celery workers). The SSE endpoint (RealtimeStreamView)
+subscribes to the authenticated user's channel and streams events as they
+arrive, so clients no longer need to poll notifications/ and messages/.
+
+The broker is chosen by settings.REALTIME_BROKER:
+    InProcessBroker - subscribers in the current process only (tests, a
+                      single ASGI process with eager Celery tasks)
+    RedisBroker     - Redis pub/sub, reaches every ASGI process and lets
+                      Celery workers publish (the default)
+
+Browsers' EventSource cannot send an Authorization header, so they first
+exchange their JWT for a ticket (issue_ticket) and open the stream with
+?ticket=. Tickets are signed, name only the user, expire after
+REALTIME_TICKET_TTL seconds and open a stream once: each carries a nonce
+that redeem_ticket() records in the cache, so the copy that lands in access
+logs cannot be replayed. Across processes this needs a shared cache
+(CACHE_URL).
+"""
+import asyncio
+import json
+import secrets
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+
+TICKET_SALT = 'api.realtime.stream-ticket'
+
+# Events buffered per connection before new ones are dropped (slow client)
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def _offer(queue, event):
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        pass
+
+
+class InProcessBroker:
+    def __init__(self):
+        self._subscribers = defaultdict(set)  # user_id -> {(loop, queue)}
+        self._lock = threading.Lock()
+
+    def publish(self, user_id, event):
+        with self._lock:
+            targets = list(self._subscribers.get(user_id, ()))
+        for loop, queue in targets:
+            loop.call_soon_threadsafe(_offer, queue, event)
+
+    async def subscribe(self, user_id, heartbeat):
+        """Yield events for `user_id`, or None every `heartbeat` seconds of silence."""
+        entry = (asyncio.get_running_loop(), asyncio.Queue(SUBSCRIBER_QUEUE_SIZE))
+        with self._lock:
+            self._subscribers[user_id].add(entry)
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(entry[1].get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            with self._lock:
+                self._subscribers[user_id].discard(entry)
+                if not self._subscribers[user_id]:
+                    del self._subscribers[user_id]
+
+
+class RedisBroker:
+    def __init__(self, url=None):
+        import redis
+
+        self.url = url or settings.REALTIME_REDIS_URL
+        self._client = redis.Redis.from_url(self.url)
+
+    @staticmethod
+    def channel(user_id):
+        return f"realtime:user:{user_id}"
+
+    def publish(self, user_id, event):
+        self._client.publish(self.channel(user_id), json.dumps(event, cls=DjangoJSONEncoder))
+
+    async def subscribe(self, user_id, heartbeat):
+        """Yield events for `user_id`, or None every `heartbeat` seconds of silence."""
+        import redis.asyncio as aioredis
+
+        client = aioredis.Redis.from_url(self.url)
+        pubsub = client.pubsub()
+        await pubsub.subscribe(self.channel(user_id))
+        try:
+            while True:
+                message = await pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=heartbeat)
+                yield json.loads(message['data']) if message else None
+        finally:
+            await pubsub.unsubscribe()
+            await pubsub.aclose()
+            await client.aclose()
+
+
+_broker = None
+
+
+def get_broker():
+    """The process-wide broker named by settings.REALTIME_BROKER."""
+    global _broker
+    if _broker is None:
+        _broker = import_string(settings.REALTIME_BROKER)()
+    return _broker
+
+
+def publish(user_id, event_type, data):
+    """Send one event to every open stream of `user_id`. Never raises."""
+    try:
+        get_broker().publish(user_id, {'type': event_type, 'data': data})
+    except Exception as e:
+        print(f"❌ Realtime publish to user {user_id} failed: {e}")
+
+
+def issue_ticket(user_id):
+    """A signed, short-lived, single-use ticket that opens `user_id`'s stream."""
+    return signing.dumps(
+        {'user_id': user_id, 'nonce': secrets.token_urlsafe(16)}, salt=TICKET_SALT, compress=True)
+
+
+def redeem_ticket(ticket):
+    """The user id named by a valid, unexpired and unused ticket, or None."""
+    try:
+        payload = signing.loads(ticket, salt=TICKET_SALT, max_age=settings.REALTIME_TICKET_TTL)
+        user_id, nonce = payload['user_id'], payload['nonce']
+    except (signing.BadSignature, KeyError, TypeError):
+        return None
+    # Outlives the ticket, so it cannot be redeemed again before it expires
+    if not cache.add(f'realtime-ticket:{nonce}', 1, timeout=settings.REALTIME_TICKET_TTL + 1):
+        return None
+    return user_id
@@ -0,0 +1,63 @@
+"""
+Per-process S3 client shared by Celery tasks, upload staging and MediaStorage.
+
+Creating a boto3 client resolves credentials and opens fresh TLS
+connections, so doing it per image dominated small uploads. get_s3_client()
+builds one client per process with a connection pool sized by
+S3_MAX_POOL_CONNECTIONS and hands it out on every later call. Clients are
+rebuilt after a fork (Celery prefork workers) so processes never share
+sockets.
+
+Point AWS_S3_ENDPOINT_URL at an S3-compatible server (MinIO, moto_server)
+to run against a local stand-in.
+"""
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+from django.conf import settings
+
+_lock = threading.Lock()
+_resources = {}
+
+
+def _options():
+    return (
+        getattr(settings, 'AWS_S3_ENDPOINT_URL', None) or None,
+        getattr(settings, 'AWS_S3_REGION_NAME', None) or 'us-east-1',
+        settings.S3_MAX_POOL_CONNECTIONS,
+    )
+
+
+def get_s3_resource():
+    """The boto3 S3 resource of this process, created on first use."""
+    key = (os.getpid(),) + _options()
+    resource = _resources.get(key)
+    if resource is None:
+        with _lock:
+            resource = _resources.get(key)
+            if resource is None:
+                endpoint_url, region_name, pool_size = key[1:]
+                resource = boto3.session.Session().resource(
+                    's3',
+                    endpoint_url=endpoint_url,
+                    region_name=region_name,
+                    config=Config(
+                        signature_version='s3v4',
+                        max_pool_connections=pool_size,
+                        tcp_keepalive=True,
+                        retries={'max_attempts': 3, 'mode': 'standard'},
+                        # Stand-ins are addressed by host:port, not bucket subdomains
+                        s3={'addressing_style': 'path'} if endpoint_url else None,
+                    ),
+                )
+                # Drop clients inherited from a parent process
+                _resources.clear()
+                _resources[key] = resource
+    return resource
+
+
+def get_s3_client():
+    """The pooled boto3 S3 client of this process."""
+    return get_s3_resource().meta.client
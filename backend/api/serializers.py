@@ -1,9 +1,11 @@
 from .models import Device
 from rest_framework import serializers
 from django.contrib.auth.hashers import make_password
-from .models import Follow, Users, Posts, Location, Comments, PostImages, Likes, CollectionFolders, Collects, Notifications, Message
+from .models import Follow, Users, Posts, Location, Comments, PostImages, Likes, CollectionFolders, Collects, Notifications, Message, Conversation
 from django.conf import settings
 from django.db.models import Prefetch
+from .batching import prefetch_users
+from .images import smallest as smallest_variant
 
 import logging
 logger = logging.getLogger(__name__)
@@ -19,13 +21,11 @@ class UserSerializer(serializers.ModelSerializer):
     # So the getter name has to be "get_profile_picture_url"
     profile_picture_url = serializers.SerializerMethodField()
 
-    followers_count = serializers.IntegerField(
-        # relationship defined in Follow Model
-        read_only=True, source='follower_relationships.count')
-    following_count = serializers.IntegerField(
-        # relationship defined in Follow Model
-        read_only=True, source='following_relationships.count')
-    is_following = serializers.BooleanField(read_only=True, default=False)
+    # Read from Users.objects.with_follow_stats() annotations when present,
+    # falling back to per-user queries otherwise
+    followers_count = serializers.SerializerMethodField()
+    following_count = serializers.SerializerMethodField()
+    is_following = serializers.SerializerMethodField()
 
     role = serializers.CharField(source='profile.role', read_only=True)
     # Defines what fileds and nested obj should be in the serialization
@@ -67,19 +67,6 @@ class UserSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(default_url)
         return default_url 
 
-    # Add a dynamic is_following field that tells the currently authenticated user whether they are following the user being serialized.
-    # Used in any serializers that has a UserSerializer field.
-    def to_representation(self, instance):
-        # get parent to_rep to get initial serialize data
-        data = super().to_representation(instance)
-        request = self.context.get('request')  # get request from context
-        if request and request.user.is_authenticated:  # check request nout null and if user is authenticated
-            data['is_following'] = Follow.objects.filter(
-                follower=request.user,
-                following=instance
-            ).exists()
-        return data
-
     #
     def create(self, validated_data):
         # Hash the password before saving
@@ -88,12 +75,20 @@ class UserSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
     def get_followers_count(self, obj):
-        return obj.followers.count()
+        if hasattr(obj, 'followers_count'):
+            return obj.followers_count
+        return obj.follower_relationships.count()
 
     def get_following_count(self, obj):
-        return obj.following.count()
+        if hasattr(obj, 'following_count'):
+            return obj.following_count
+        return obj.following_relationships.count()
 
+    # Tells the currently authenticated user whether they are following the user being serialized.
+    # Used in any serializers that has a UserSerializer field.
     def get_is_following(self, obj):
+        if hasattr(obj, 'is_following'):
+            return obj.is_following
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return Follow.objects.filter(follower=request.user, following=obj).exists()
@@ -140,26 +135,42 @@ class UserSerializer(serializers.ModelSerializer):
 
 class PostImageSerializer(serializers.ModelSerializer):
     image = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = PostImages
-        fields = ['id', 'post', 'image', 'created_at']
+        fields = ['id', 'post', 'image', 'width', 'height', 'placeholder', 'srcset', 'created_at']
+
+    def _url(self, obj, key):
+        url = obj.image.storage.url(key)
+        if settings.USE_S3:
+            return url  # S3 returns full URL
+        request = self.context.get('request', None)
+        if request:
+            return request.build_absolute_uri(url)
+        return url
 
     def get_image(self, obj):
         if obj.image:
-            if settings.USE_S3:
-                return obj.image.url  # S3 returns full URL
-            request = self.context.get('request', None)
-            if request:
-                return request.build_absolute_uri(obj.image.url)
-            return obj.image.url
+            return self._url(obj, obj.image.name)
         return None
 
+    def get_srcset(self, obj):
+        """{format: {width: url}} of the stored variants, for srcset and <picture> sources."""
+        return {
+            fmt: {width: self._url(obj, key) for width, key in by_width.items()}
+            for fmt, by_width in (obj.variants or {}).items()
+        }
+
+    def thumbnail_url(self, obj):
+        """URL of the narrowest JPEG variant, or the image itself for unprocessed rows."""
+        key = smallest_variant(obj.variants or {})
+        return self._url(obj, key) if key else self.get_image(obj)
+
 
 class CommentSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     replies = serializers.SerializerMethodField()
-    likes_count = serializers.SerializerMethodField()
     is_liked = serializers.SerializerMethodField()
     comment_image_url = serializers.SerializerMethodField()
 
@@ -173,6 +184,7 @@ class CommentSerializer(serializers.ModelSerializer):
             'content': {'required': False},
             'comment_image': {'write_only': True, 'required': False},
         }
+        read_only_fields = ['likes_count']
 
     def validate(self, data):
         content = data.get('content', '').strip()
@@ -203,16 +215,26 @@ class CommentSerializer(serializers.ModelSerializer):
             "profile_picture_url": obj.user.profile_picture.url if obj.user.profile_picture else None,
         }
 
+    def _threads(self, obj):
+        """Batched comment threads from the view, if they cover this comment."""
+        threads = self.context.get('comment_threads')
+        if threads is not None and threads.covers(obj):
+            return threads
+        return None
+
     def get_replies(self, obj):
-        # Preload replies for all comments in the view using prefetch_related
-        replies = Comments.objects.filter(reply_to=obj)
+        threads = self._threads(obj)
+        if threads:
+            replies = threads.replies_for(obj)
+        else:
+            replies = Comments.objects.filter(reply_to=obj)
         return CommentSerializer(replies, many=True, context=self.context).data
 
-    def get_likes_count(self, obj):
-        return obj.comment_likes.count()
-
     def get_is_liked(self, obj):
         """Check if the logged-in user liked the comment."""
+        threads = self._threads(obj)
+        if threads:
+            return threads.is_liked(obj)
         request = self.context.get('request', None)
         if request and request.user.is_authenticated:
             return obj.comment_likes.filter(user=request.user).exists()
@@ -239,8 +261,6 @@ class PostSerializer(serializers.ModelSerializer):
     location = LocationSerializer()
     user = UserSerializer(read_only=True)
     images = PostImageSerializer(many=True, read_only=True)
-    likes_count = serializers.SerializerMethodField()
-    saves_count = serializers.SerializerMethodField()
     detailed_comments = serializers.SerializerMethodField()
     is_liked = serializers.SerializerMethodField()
     is_saved = serializers.SerializerMethodField()
@@ -251,14 +271,15 @@ class PostSerializer(serializers.ModelSerializer):
         model = Posts
         fields = ['id', 'user', 'title', 'content', 'location', 'created_at', 'category', 'period',
                   'updated_at', 'status', 'visibility', 'images', 'likes_count',
-                  'saves_count', 'detailed_comments', 'is_liked', 'is_saved',
-                  'childPosts',]
+                  'saves_count', 'comments_count', 'detailed_comments', 'is_liked', 'is_saved',
+                  'childPosts', 'media_status',]
         extra_kwargs = {
             'category': {'required': True},  # Ensure category is required
             'hashtags': {'required': False},  # Hashtags are optional
         }
         # Prevent users from manually modifying it
-        read_only_fields = ['period']
+        read_only_fields = ['period', 'likes_count',
+                            'saves_count', 'comments_count', 'media_status']
 
     def validate(self, data):
         if 'location' not in data or not data['location']:
@@ -354,22 +375,28 @@ class PostSerializer(serializers.ModelSerializer):
 
         return main_post
 
-    def get_likes_count(self, obj):
-        """Calculate and return the total like count for the post."""
-        return obj.post_likes.count()
-
-    def get_saves_count(self, obj):
-        """Calculate and return the total count of collections for the post."""
-        return obj.post_saves.count()
+    def _engagement(self, obj):
+        """Batched engagement from the view, if it covers this post."""
+        engagement = self.context.get('post_engagement')
+        if engagement is not None and engagement.covers(obj):
+            return engagement
+        return None
 
     def get_detailed_comments(self, obj):
         """Generate and return a detailed JSON of comments with their replies and likes."""
-        comments = obj.comments_set.filter(
-            reply_to=None)  # Fetch only top-level comments
-        return CommentSerializer(comments, many=True).data
+        threads = self.context.get('comment_threads')
+        if threads is not None and threads.covers_post(obj):
+            comments = threads.top_level_for(obj)
+        else:
+            comments = obj.comments_set.filter(
+                reply_to=None)  # Fetch only top-level comments
+        return CommentSerializer(comments, many=True, context=self.context).data
 
     def get_is_liked(self, obj):
         """Check if the logged-in user liked the post."""
+        engagement = self._engagement(obj)
+        if engagement:
+            return engagement.is_liked(obj)
         request = self.context.get('request', None)
         if request and request.user.is_authenticated:
             return obj.post_likes.filter(user=request.user).exists()
@@ -377,6 +404,9 @@ class PostSerializer(serializers.ModelSerializer):
 
     def get_is_saved(self, obj):
         """Check if the logged-in user saved the post."""
+        engagement = self._engagement(obj)
+        if engagement:
+            return engagement.is_saved(obj)
         request = self.context.get('request', None)
         if request and request.user.is_authenticated:
             return obj.post_saves.filter(user=request.user).exists()
@@ -384,9 +414,10 @@ class PostSerializer(serializers.ModelSerializer):
 
     def get_childPosts(self, obj):
         if obj.period == 'multipleday':
-            child_posts = Posts.objects.filter(parent_post=obj)
-            print(
-                f"🔎 Found {child_posts.count()} child posts for parent {obj.id}")
+            request = self.context.get('request')
+            child_posts = Posts.objects.filter(parent_post=obj).select_related(
+                'location').prefetch_related(
+                    prefetch_users('user', getattr(request, 'user', None)), 'images')
             return PostSerializer(child_posts, many=True, context=self.context).data
         return []
 
@@ -436,17 +467,63 @@ class CollectSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'post', 'folder', 'created_at']
 
 
+class UserSummarySerializer(serializers.ModelSerializer):
+    """Just enough of a user to render an avatar and a name."""
+    profile_picture_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Users
+        fields = ['id', 'username', 'profile_picture_url']
+
+    get_profile_picture_url = UserSerializer.get_profile_picture_url
+
+
 class NotificationSerializer(serializers.ModelSerializer):
-    recipient = UserSerializer(read_only=True)
-    sender = UserSerializer(read_only=True)
-    post = PostSerializer(read_only=True)
-    comment = CommentSerializer(read_only=True)
+    """
+    Compact notification for the notification feed: the actor, the recipient's
+    id, a post summary (id, title, thumbnail) and the comment's text instead of
+    nested full objects. Expects `post__images` to be prefetched.
+    """
+    sender = UserSummarySerializer(read_only=True)
+    recipient = serializers.SerializerMethodField()
+    post = serializers.SerializerMethodField()
+    comment = serializers.SerializerMethodField()
+
+    COMMENT_SNIPPET_LENGTH = 80
 
     class Meta:
         model = Notifications
-        fields = ['id', 'recipient', 'sender', 'post', 'comment',
-                  'notification_type', 'message', 'is_read', 'created_at']
-        read_only_fields = ['notification_type', 'message']
+        fields = ['id', 'sender', 'recipient', 'post', 'comment', 'message',
+                  'notification_type', 'message_text', 'actor_count',
+                  'recent_actor_ids', 'is_read', 'created_at']
+        read_only_fields = ['notification_type', 'message', 'message_text',
+                            'actor_count', 'recent_actor_ids']
+
+    def get_recipient(self, obj):
+        # The app reads recipient.id; the id is on the row, so no join is needed
+        return {'id': obj.recipient_id}
+
+    def get_post(self, obj):
+        if obj.post is None:
+            return None
+        post_images = list(obj.post.images.all())
+        thumbnail = PostImageSerializer(
+            context=self.context).thumbnail_url(post_images[0]) if post_images else None
+        return {
+            'id': obj.post.id,
+            'title': obj.post.title,
+            'thumbnail': thumbnail,
+        }
+
+    def get_comment(self, obj):
+        if obj.comment is None:
+            return None
+        content = obj.comment.content or ''
+        return {
+            'id': obj.comment.id,
+            'content': content,
+            'snippet': content[:self.COMMENT_SNIPPET_LENGTH],
+        }
 
 
 class FollowSerializer(serializers.ModelSerializer):
@@ -464,6 +541,49 @@ class DeviceSerializer(serializers.ModelSerializer):
 
 # Messenger
 class MessageSerializer(serializers.ModelSerializer):
+    # Derived from the receiver's read watermark; pass the conversation in
+    # the context when serializing many messages of one conversation
+    is_read = serializers.SerializerMethodField()
+
     class Meta:
         model = Message
         fields = ['id', 'sender', 'receiver', 'content', 'timestamp', 'is_read']
+
+    def get_is_read(self, obj):
+        conversation = self.context.get('conversation') or obj.conversation
+        return conversation is not None and conversation.has_read(obj)
+
+
+class ConversationSerializer(serializers.ModelSerializer):
+    """
+    Inbox entry. Keeps the shape of the last message (id, sender, receiver,
+    content, timestamp, is_read) and adds the conversation id, the other
+    participant and the viewer's unread count. Expects `last_message`,
+    `user_a` and `user_b` to be select_related.
+    """
+    conversation_id = serializers.IntegerField(source='id')
+    other_user = serializers.SerializerMethodField()
+    unread_count = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Conversation
+        fields = ['conversation_id', 'other_user', 'unread_count', 'last_activity_at']
+
+    def _viewer(self):
+        return self.context['request'].user
+
+    def get_other_user(self, obj):
+        viewer = self._viewer()
+        other = obj.user_b if obj.user_a_id == viewer.id else obj.user_a
+        return UserSummarySerializer(other, context=self.context).data
+
+    def get_unread_count(self, obj):
+        return obj.unread_count_for(self._viewer())
+
+    def to_representation(self, instance):
+        data = {}
+        if instance.last_message is not None:
+            data.update(MessageSerializer(
+                instance.last_message, context={'conversation': instance}).data)
+        data.update(super().to_representation(instance))
+        return data
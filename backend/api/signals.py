@@ -1,41 +1,13 @@
 # signals.py
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import m2m_changed, pre_save, post_save, post_delete
 from django.dispatch import receiver
-from .device_management import DeviceManager
-from .models import Collects, Comments, Follow, Likes, Notifications, Users, Profile, Device, Message
-from .firebase_utils import FirebaseManager
-
-firebase = FirebaseManager()
-
-
-def send_push_notification(recipient, notification_data):
-    """Helper function to send push notification to a user's devices"""
-    # Clean up invalid tokens first
-    DeviceManager.clean_invalid_tokens(recipient)
-
-    # Get all device tokens for the recipient
-    device_tokens = Device.objects.filter(
-        user=recipient
-    ).values_list('token', flat=True)
-
-    if device_tokens:
-        # Send notification via Firebase
-        result = firebase.send_notification(
-            tokens=list(device_tokens),
-            title=notification_data['title'],
-            body=notification_data['message'],
-            data={
-                'type': notification_data['type'],
-                'notification_id': str(notification_data['notification_id']),
-                'post_id': str(notification_data.get('post_id', '')),
-                'comment_id': str(notification_data.get('comment_id', ''))
-            }
-        )
-
-        # If there were any failures, clean up those tokens
-        if result.get('failed_tokens'):
-            for failed_token in result['failed_tokens']:
-                Device.objects.filter(token=failed_token['token']).delete()
+from .models import Collects, Comments, Conversation, Follow, Likes, Notifications, Users, Profile, Message, Posts
+from .tasks import fan_out_post_to_timelines, backfill_timeline
+from .timeline import prune_follow, remove_post
+from . import counters
+from . import notifications, realtime
+from .serializers import MessageSerializer
 
 
 @receiver(post_save, sender=Users)
@@ -47,208 +19,193 @@ def create_or_update_user_profile(sender, instance, created, **kwargs):
         instance.profile.save()
 
 
+############ Notifications ##################
+# Receivers only describe the event; Notifications rows and pushes are
+# created by the deliver_notifications worker after the transaction commits.
 @receiver(post_save, sender=Likes)
-def create_like_notification(sender, instance, created, **kwargs):
+def create_like_notification(sender, instance, created, raw=False, **kwargs):
     """Signal to handle notifications for likes on posts and comments"""
-    if created:
+    if created and not raw:
         if instance.post:
-            # Create database notification for post like
-            notification = Notifications.objects.create(
-                recipient=instance.post.user,
-                sender=instance.user,
-                post=instance.post,
-                notification_type='like_post',
-                message_text=f"{instance.user.username} liked your post"
-            )
-
-            # Send push notification
-            send_push_notification(instance.post.user, {
-                'title': 'New Like',
-                'message_text': f"{instance.user.username} liked your post",
-                'type': 'like_post',
-                'notification_id': notification.id,
-                'post_id': instance.post.id
-            })
-
+            notifications.enqueue(notifications.event(
+                'like_post', instance.post.user_id, instance.user_id,
+                post_id=instance.post_id))
         elif instance.comment:
-            # Create database notification for comment like
-            notification = Notifications.objects.create(
-                recipient=instance.comment.user,
-                sender=instance.user,
-                comment=instance.comment,
-                post=instance.comment.post,
-                notification_type='like_comment',
-                message_text=f"{instance.user.username} liked your comment"
-            )
-
-            send_push_notification(instance.comment.user, {
-                'title': 'New Like',
-                'message_text': f"{instance.user.username} liked your comment",
-                'type': 'like_comment',
-                'notification_id': notification.id,
-                'post_id': instance.comment.post.id,
-                'comment_id': instance.comment.id
-            })
+            notifications.enqueue(notifications.event(
+                'like_comment', instance.comment.user_id, instance.user_id,
+                post_id=instance.comment.post_id, comment_id=instance.comment_id))
 
 
 @receiver(post_save, sender=Comments)
-def create_comment_notification(sender, instance, created, **kwargs):
+def create_comment_notification(sender, instance, created, raw=False, **kwargs):
     """Signal to handle notifications for comments and replies"""
-    if created:
+    if created and not raw:
         if instance.reply_to:
-            # Create database notification for reply
-            notification = Notifications.objects.create(
-                recipient=instance.reply_to.user,
-                sender=instance.user,
-                post=instance.post,
-                comment=instance,
-                notification_type='reply',
-                message_text=f"{instance.user.username} replied to your comment"
-            )
-
-            # Send push notification for reply
-            send_push_notification(instance.reply_to.user, {
-                'title': 'New Reply',
-                'message_text': f"{instance.user.username} replied to your comment",
-                'type': 'reply',
-                'notification_id': notification.id,
-                'post_id': instance.post.id,
-                'comment_id': instance.id
-            })
+            notifications.enqueue(notifications.event(
+                'reply', instance.reply_to.user_id, instance.user_id,
+                post_id=instance.post_id, comment_id=instance.id))
         else:
-            # Create database notification for comment on post
-            notification = Notifications.objects.create(
-                recipient=instance.post.user,
-                sender=instance.user,
-                post=instance.post,
-                comment=instance,
-                notification_type='comment',
-                message_text=f"{instance.user.username} commented on your post"
-            )
-
-            # Send push notification for comment
-            send_push_notification(instance.post.user, {
-                'title': 'New Comment',
-                'message_text': f"{instance.user.username} commented on your post",
-                'type': 'comment',
-                'notification_id': notification.id,
-                'post_id': instance.post.id,
-                'comment_id': instance.id
-            })
-
-        # Handle mentions in comments
-        for mentioned_user in instance.mentioned_users.all():
-            # Create database notification for mention
-            notification = Notifications.objects.create(
-                recipient=mentioned_user,
-                sender=instance.user,
-                post=instance.post,
-                comment=instance,
-                notification_type='mention',
-                message_text=f"{instance.user.username} mentioned you in a comment"
-            )
-
-            # Send push notification for mention
-            send_push_notification(mentioned_user, {
-                'title': 'New Mention',
-                'message_text': f"{instance.user.username} mentioned you in a comment",
-                'type': 'mention',
-                'notification_id': notification.id,
-                'post_id': instance.post.id,
-                'comment_id': instance.id
-            })
+            notifications.enqueue(notifications.event(
+                'comment', instance.post.user_id, instance.user_id,
+                post_id=instance.post_id, comment_id=instance.id))
+
+
+@receiver(m2m_changed, sender=Comments.mentioned_users.through)
+def create_mention_notifications(sender, instance, action, pk_set, reverse=False, **kwargs):
+    """Signal to notify users mentioned in a comment (mentions are set after the comment is saved)"""
+    if action == 'post_add' and not reverse and pk_set:
+        notifications.enqueue(*[
+            notifications.event(
+                'mention', user_id, instance.user_id,
+                post_id=instance.post_id, comment_id=instance.id)
+            for user_id in pk_set
+        ])
 
 
 @receiver(post_save, sender=Collects)
-def create_collect_notification(sender, instance, created, **kwargs):
+def create_collect_notification(sender, instance, created, raw=False, **kwargs):
     """Signal to handle notifications for post collections"""
-    if created:
-        # Create database notification
-        notification = Notifications.objects.create(
-            recipient=instance.post.user,
-            sender=instance.user,
-            post=instance.post,
-            notification_type='collect',
-            message_text=f"{instance.user.username} collected your post"
-        )
-
-        # Send push notification
-        send_push_notification(instance.post.user, {
-            'title': 'New Collection',
-            'message_text': f"{instance.user.username} collected your post",
-            'type': 'collect',
-            'notification_id': notification.id,
-            'post_id': instance.post.id
-        })
+    if created and not raw:
+        notifications.enqueue(notifications.event(
+            'collect', instance.post.user_id, instance.user_id,
+            post_id=instance.post_id))
 
 
 @receiver(post_save, sender=Follow)
-def create_follow_notification(sender, instance, created, **kwargs):
+def create_follow_notification(sender, instance, created, raw=False, **kwargs):
     """Signal to handle notifications for new followers"""
-    if created:
-        # Create database notification
-        notification = Notifications.objects.create(
-            recipient=instance.following,
-            sender=instance.follower,
-            notification_type='follow',
-            message_text=f"{instance.follower.username} started following you"
-        )
+    if created and not raw:
+        notifications.enqueue(notifications.event(
+            'follow', instance.following_id, instance.follower_id))
 
-        # Send push notification
-        send_push_notification(instance.following, {
-            'title': 'New Follower',
-            'message_text': f"{instance.follower.username} started following you",
-            'type': 'follow',
-            'notification_id': notification.id
-        })
 
+@receiver(post_save, sender=Message)
+def create_message_notification(sender, instance, created, raw=False, **kwargs):
+    """Signal to handle notifications for new messages"""
+    if created and not raw:
+        notifications.enqueue(notifications.event(
+            'message', instance.receiver_id, instance.sender_id,
+            message_id=instance.id))
 
+        # Both sides see the message at once; the sender may have other devices open
+        data = MessageSerializer(instance).data
+        participants = {instance.sender_id, instance.receiver_id}
 
+        def publish_message():
+            for user_id in participants:
+                realtime.publish(user_id, 'message', data)
+
+        transaction.on_commit(publish_message)
+
+
+############ Conversations ##################
 @receiver(post_save, sender=Message)
-def create_message_notification(sender, instance, created, **kwargs):
-    """Signal to handle notifications for new messages"""
-    if created:
-        recipient = instance.receiver  # ✅ Fix: Correct recipient field
-        sender = instance.sender       # ✅ Fix: Correct sender field
-
-        # ✅ Create database notification for the message
-        notification = Notifications.objects.create(
-            recipient=recipient,
-            sender=sender,
-            message=instance,  # ✅ Attach the Message object
-            notification_type="message",
-            message_text=f"New message from {sender.username}"
-        )
-
-        # ✅ Get all device tokens for recipient
-        device_tokens = Device.objects.filter(user=recipient).values_list('token', flat=True)
-
-        if device_tokens:
-            print(f"📲 Sending notification to {len(device_tokens)} devices...")
-
-            # ✅ Send Firebase Notification
-            result = firebase.send_notification(
-                tokens=list(device_tokens),
-                title="New Message",
-                body=f"{sender.username}: {instance.content[:50]}",  # ✅ Show first 50 characters
-                data={
-                    "type": "message",
-                    "notification_id": str(notification.id),
-                    "sender_id": str(sender.id),
-                    "receiver_id": str(recipient.id),
-                    "message_id": str(instance.id),
-                }
-            )
-
-            print(f"🚀 Firebase send result: {result}")
-
-            # ✅ Remove failed tokens
-            if result.get("failed_tokens"):
-                for failed_token in result['failed_tokens']:
-                    Device.objects.filter(token=failed_token["token"]).delete()
-        else:
-            print("⚠️ No registered devices for recipient. Skipping push notification.")
+def update_conversation(sender, instance, created, raw=False, **kwargs):
+    """Signal to move the conversation's last-message pointer and unread count"""
+    if created and not raw:
+        Conversation.objects.record_message(instance)
+
+
+############ Home timeline ##################
+@receiver(pre_save, sender=Posts)
+def remember_post_status(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Signal to note the stored status so post_save can spot publish/unpublish transitions"""
+    if instance.pk is None:
+        instance._previous_status = None
+    elif raw or (update_fields is not None and 'status' not in update_fields):
+        # The status column is not being written
+        instance._previous_status = instance.status
+    else:
+        instance._previous_status = Posts.objects.filter(
+            pk=instance.pk).values_list('status', flat=True).first()
+
+
+@receiver(post_save, sender=Posts)
+def fan_out_new_post(sender, instance, created, raw=False, **kwargs):
+    """Signal to push a top-level post into followers' timelines when it becomes published, and pull it when it stops being"""
+    if raw or instance.parent_post_id is not None:
+        return
+    was_published = getattr(instance, '_previous_status', None) == 'published'
+    is_published = instance.status == 'published'
+    if is_published and not was_published:
+        post_id = instance.id
+        transaction.on_commit(lambda: fan_out_post_to_timelines.delay(post_id))
+    elif was_published and not is_published:
+        remove_post(instance.id)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_followed_posts(sender, instance, created, raw=False, **kwargs):
+    """Signal to backfill the follower's timeline with the followed user's posts"""
+    if created and not raw:
+        follower_id, following_id = instance.follower_id, instance.following_id
+        transaction.on_commit(
+            lambda: backfill_timeline.delay(follower_id, following_id))
+
+
+@receiver(post_delete, sender=Follow)
+def prune_unfollowed_posts(sender, instance, **kwargs):
+    """Signal to remove an unfollowed user's posts from the follower's timeline"""
+    prune_follow(instance.follower_id, instance.following_id)
+
+
+############ Engagement counters ##################
+@receiver(post_save, sender=Likes)
+def increment_like_counter(sender, instance, created, raw=False, **kwargs):
+    """Signal to bump the liked post's or comment's likes_count"""
+    if created and not raw:
+        if instance.post_id:
+            counters.adjust(Posts, instance.post_id, 'likes_count', 1)
+        elif instance.comment_id:
+            counters.adjust(Comments, instance.comment_id, 'likes_count', 1)
+
+
+@receiver(post_delete, sender=Likes)
+def decrement_like_counter(sender, instance, **kwargs):
+    """Signal to lower the liked post's or comment's likes_count"""
+    if instance.post_id:
+        counters.adjust(Posts, instance.post_id, 'likes_count', -1)
+    elif instance.comment_id:
+        counters.adjust(Comments, instance.comment_id, 'likes_count', -1)
+
+
+@receiver(post_save, sender=Collects)
+def increment_save_counter(sender, instance, created, raw=False, **kwargs):
+    """Signal to bump the collected post's saves_count"""
+    if created and not raw:
+        counters.adjust(Posts, instance.post_id, 'saves_count', 1)
+
+
+@receiver(post_delete, sender=Collects)
+def decrement_save_counter(sender, instance, **kwargs):
+    """Signal to lower the collected post's saves_count"""
+    counters.adjust(Posts, instance.post_id, 'saves_count', -1)
+
+
+@receiver(post_save, sender=Comments)
+def increment_comment_counter(sender, instance, created, raw=False, **kwargs):
+    """Signal to bump the commented post's comments_count"""
+    if created and not raw:
+        counters.adjust(Posts, instance.post_id, 'comments_count', 1)
+
+
+@receiver(post_delete, sender=Comments)
+def decrement_comment_counter(sender, instance, **kwargs):
+    """Signal to lower the commented post's comments_count"""
+    counters.adjust(Posts, instance.post_id, 'comments_count', -1)
 
 
+############ Unread notification counter ##################
+# Rows inserted with bulk_create are counted in notifications.deliver()
+@receiver(post_save, sender=Notifications)
+def increment_unread_counter(sender, instance, created, raw=False, **kwargs):
+    """Signal to bump the recipient's unread_notifications_count"""
+    if created and not raw and not instance.is_read:
+        counters.adjust(Users, instance.recipient_id, 'unread_notifications_count', 1)
 
 
+@receiver(post_delete, sender=Notifications)
+def decrement_unread_counter(sender, instance, **kwargs):
+    """Signal to lower the recipient's unread_notifications_count when an unread notification goes away"""
+    if not instance.is_read:
+        counters.adjust(Users, instance.recipient_id, 'unread_notifications_count', -1)
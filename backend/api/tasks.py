@@ -1,107 +1,220 @@
-from celery import shared_task
-from PIL import Image  
-from io import BytesIO
-import boto3
-import uuid 
-from api.models import Comments 
+from collections import defaultdict
+from datetime import timedelta
+
+from celery import chord, shared_task
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+import uuid
+from api.models import Comments, ImageAsset, PostImages, Posts
+from api.timeline import backfill_follow, fan_out_post
+from api.notifications import deliver
+from api.device_management import DeviceManager
+from api import images, realtime, uploads
+
+
+def _post_image_asset(image_bytes):
+    """
+    The ImageAsset for `image_bytes`. Variants are rendered and uploaded only
+    the first time a photo is seen; re-uploads of the same bytes reuse them.
+    Unused assets are removed by purge_orphaned_images.
+    """
+    digest = images.content_hash(image_bytes)
+    # Touching last_used_at keeps purge_orphaned_images away from an asset about to be reused
+    if ImageAsset.objects.filter(content_hash=digest).update(last_used_at=timezone.now()):
+        print(f"♻️ Reusing stored variants of {digest[:12]}")
+        asset = ImageAsset.objects.get(content_hash=digest)
+        if not asset.placeholder:
+            # Stored before placeholders existed; fill it in rather than copy '' onwards
+            asset.placeholder = images.placeholder(images.decode(image_bytes))
+            asset.save(update_fields=['placeholder'])
+        return asset
+
+    # A random stem: keys derived from the hash would let anyone holding the
+    # photo find its public objects and learn that someone uploaded it
+    processed = images.process(image_bytes, f"media/postImages/{uuid.uuid4().hex}")
+    print(f"✅ Stored {sum(map(len, processed.variants.values()))} variants")
+    asset, created = ImageAsset.objects.get_or_create(
+        content_hash=digest,
+        defaults={
+            'image': processed.primary_key,
+            'variants': processed.variants,
+            'width': processed.width,
+            'height': processed.height,
+            'placeholder': processed.placeholder,
+        },
+    )
+    if not created:
+        # A concurrent upload of the same photo got there first
+        images.delete_variants(processed.variants)
+    return asset
 
 
 @shared_task
-def upload_post_image(post_id, image_bytes, image_name, is_child=False):
+def upload_post_image(post_id, staged_ref):
+    """
+    Attach the variants of a staged upload (see api/uploads.py) to the post,
+    rendering them unless the same photo was processed before. Returns
+    {'post_id', 'ok'} for finalize_post_media.
+    """
     print(f"📤 Starting upload_post_image for post {post_id}")
 
     try:
-        print("🔧 Opening image...")
-        img = Image.open(BytesIO(image_bytes))
-        if img.mode in ("RGBA", "P"):
-            img = img.convert("RGB")
-
-        if img.width > 1024:
-            ratio = 1024 / float(img.width)
-            new_height = int(float(img.height) * ratio)
-            img = img.resize((1024, new_height), Image.Resampling.LANCZOS)
-
-        buffer = BytesIO()
-        img.save(buffer, format='JPEG', quality=75)
-        buffer.seek(0)
-
-        # Generate a clean filename using only alphanumeric characters
-        clean_filename = ''.join(c for c in str(uuid.uuid4()) if c.isalnum())
-        object_key = f"media/postImages/{clean_filename}.jpg"
-        print(f"🚀 Uploading to S3: {object_key}")
-        
-        # Configure S3 client with proper settings
-        s3 = boto3.client(
-            's3',
-            region_name='us-east-1',  # Set your actual region
-            config=boto3.session.Config(signature_version='s3v4')
-        )
-        
-        # Set proper content type and ACL
-        s3.upload_fileobj(
-            buffer, 
-            'travelmingle-media', 
-            object_key,
-            ExtraArgs={
-                'ContentType': 'image/jpeg',
-               # 'ACL': 'public-read'  # Make sure bucket permissions allow this
-            }
+        asset = _post_image_asset(uploads.read_staged(staged_ref))
+        PostImages.objects.create(
+            post_id=post_id,
+            image=asset.image,
+            variants=asset.variants,
+            width=asset.width,
+            height=asset.height,
+            placeholder=asset.placeholder,
         )
-        print("✅ S3 upload complete")
-
-        from api.models import PostImages
-        PostImages.objects.create(post_id=post_id, image=object_key)
         print(f"✅ PostImages saved for post {post_id}")
+        return {'post_id': post_id, 'ok': True}
 
     except Exception as e:
         print(f"❌ upload_post_image failed: {str(e)}")
+        return {'post_id': post_id, 'ok': False}
+    finally:
+        uploads.discard(staged_ref)
+
+
+def _media_status(outcomes):
+    if all(outcomes):
+        return 'ready'
+    return 'partial' if any(outcomes) else 'failed'
+
+
+@shared_task
+def finalize_post_media(results, post_id):
+    """
+    Chord callback of process_post_images: set media_status on every post
+    that had images, and on `post_id` for all of them together, then tell
+    the author over the realtime stream.
+    """
+    outcomes = defaultdict(list)
+    for result in results:
+        outcomes[result['post_id']].append(result['ok'])
+    for image_post_id, post_outcomes in outcomes.items():
+        Posts.objects.filter(id=image_post_id).update(
+            media_status=_media_status(post_outcomes))
+
+    status = _media_status([ok for oks in outcomes.values() for ok in oks])
+    Posts.objects.filter(id=post_id).update(media_status=status)
+    print(f"✅ Media of post {post_id} finished: {status}")
+
+    author_id = Posts.objects.filter(id=post_id).values_list('user_id', flat=True).first()
+    if author_id:
+        realtime.publish(author_id, 'post_media', {'post_id': post_id, 'media_status': status})
+
+
+@shared_task
+def fail_post_media(request, exc, traceback, post_id):
+    """
+    Error callback of the process_post_images chord, which fires when an
+    image task or finalize_post_media never reports back (lost worker, time
+    limit, ...): mark the posts still pending as failed so they do not stay
+    pending forever.
+    """
+    print(f"❌ Media of post {post_id} failed: {exc}")
+    Posts.objects.filter(
+        Q(id=post_id) | Q(parent_post_id=post_id), media_status='pending',
+    ).update(media_status='failed')
+
+    author_id = Posts.objects.filter(id=post_id).values_list('user_id', flat=True).first()
+    if author_id:
+        realtime.publish(author_id, 'post_media', {'post_id': post_id, 'media_status': 'failed'})
+
+
+def process_post_images(post_id, jobs):
+    """
+    Mark the posts in `jobs` as pending and, once the current transaction
+    commits, process all their images in parallel as one chord whose
+    callback is finalize_post_media (fail_post_media if the chord errors).
+    `jobs` holds (post_id, staged_ref) pairs for `post_id` and its day posts.
+    """
+    if not jobs:
+        return
+    Posts.objects.filter(
+        id__in={post_id} | {job[0] for job in jobs}).update(media_status='pending')
+
+    header = [upload_post_image.s(*job) for job in jobs]
+    callback = finalize_post_media.s(post_id).on_error(fail_post_media.s(post_id))
+    transaction.on_commit(lambda: chord(header)(callback))
+
 
-# 2. Apply the same fix to upload_comment_image
 @shared_task
-def upload_comment_image(comment_id, image_bytes, image_name):
+def upload_comment_image(comment_id, staged_ref, image_name):
+    """Store a staged upload (see api/uploads.py) as the comment's image."""
     print(f"🎯 Background upload for comment {comment_id}")
 
     try:
-        # Compress image from bytes
-        img = Image.open(BytesIO(image_bytes))
-        if img.mode in ("RGBA", "P"):
-            img = img.convert("RGB")
-
-        if img.width > 1024:
-            ratio = 1024 / float(img.width)
-            new_height = int((float(img.height) * float(ratio)))
-            img = img.resize((1024, new_height), Image.Resampling.LANCZOS)
-
-        buffer = BytesIO()
-        img.save(buffer, format='JPEG', quality=75)
-        buffer.seek(0)
-
-        # Generate a clean filename using only alphanumeric characters
-        clean_filename = ''.join(c for c in str(uuid.uuid4()) if c.isalnum())
-        object_key = f"media/commentImages/{clean_filename}.jpg"
-
-        # Configure S3 client with proper settings
-        s3 = boto3.client(
-            's3',
-            region_name='us-east-1',  # Set your actual region
-            config=boto3.session.Config(signature_version='s3v4')
-        )
-        
-        # Set proper content type and ACL
-        s3.upload_fileobj(
-            buffer, 
-            'travelmingle-media', 
-            object_key,
-            ExtraArgs={
-                'ContentType': 'image/jpeg',
-                'ACL': 'public-read'  # Make sure bucket permissions allow this
-            }
-        )
+        # Comments show a single image: one JPEG capped at the largest variant width
+        processed = images.process(
+            uploads.read_staged(staged_ref), f"media/commentImages/{uuid.uuid4().hex}",
+            widths=(), formats=('jpeg',), max_width=max(settings.IMAGE_VARIANT_WIDTHS),
+            with_placeholder=False)
 
         # Update comment with image key
-        comment = Comments.objects.get(id=comment_id)
-        comment.comment_image = object_key
-        comment.save()
-        print(f"✅ S3 upload + comment update complete: {object_key}")
+        Comments.objects.filter(id=comment_id).update(comment_image=processed.primary_key)
+        print(f"✅ S3 upload + comment update complete: {processed.primary_key}")
     except Exception as e:
         print(f"❌ Failed to upload comment image: {str(e)}")
+    finally:
+        uploads.discard(staged_ref)
+
+
+@shared_task
+def fan_out_post_to_timelines(post_id):
+    """Write a newly published post into its author's followers' home timelines."""
+    post = Posts.objects.filter(id=post_id).first()
+    if post:
+        written = fan_out_post(post)
+        print(f"✅ Post {post_id} fanned out to {written} timelines")
+
+
+@shared_task
+def backfill_timeline(follower_id, following_id):
+    """Copy a newly followed user's recent posts into the follower's home timeline."""
+    written = backfill_follow(follower_id, following_id)
+    print(f"✅ Backfilled {written} posts from user {following_id} into timeline of {follower_id}")
+
+
+@shared_task
+def deliver_notifications(events):
+    """Create and push the notifications described by a batch of signal events."""
+    created = deliver(events)
+    print(f"✅ Delivered {len(created)} of {len(events)} notification events")
+
+
+@shared_task
+def prune_device_tokens():
+    """Periodic: delete device tokens that FCM rejected or that stopped working."""
+    removed = DeviceManager.prune_dead_tokens()
+    print(f"🧹 Pruned {removed} dead device tokens")
+
+
+@shared_task
+def purge_staged_uploads():
+    """Periodic: delete staged uploads that no task picked up or cleaned."""
+    removed = uploads.purge_stale(settings.UPLOAD_STAGING_MAX_AGE)
+    print(f"🧹 Purged {removed} stale staged uploads")
+
+
+@shared_task
+def purge_orphaned_images():
+    """
+    Periodic: delete image assets that no post image uses any more, together
+    with their stored variants. Assets used within IMAGE_ORPHAN_GRACE are kept.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.IMAGE_ORPHAN_GRACE)
+    orphans = ImageAsset.objects.filter(last_used_at__lt=cutoff).exclude(
+        Exists(PostImages.objects.filter(image=OuterRef('image'))))
+    removed = 0
+    for asset in orphans.iterator():
+        # The row goes first, so a re-upload racing this renders new objects instead of reusing these
+        if ImageAsset.objects.filter(pk=asset.pk, last_used_at__lt=cutoff).delete()[0]:
+            images.delete_variants(asset.variants)
+            removed += 1
+    print(f"🧹 Purged {removed} orphaned image assets")
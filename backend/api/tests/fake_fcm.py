@@ -0,0 +1,71 @@
+"""
+Local stand-in for FCM, speaking the batch protocol of
+api.firebase_utils.HTTPTransport. Records every request so tests can assert
+on round trips, and answers UNREGISTERED for tokens listed as invalid and
+INVALID_ARGUMENT for tokens listed as rejected.
+
+    with FakeFCMServer(invalid_tokens={'dead'}) as fcm:
+        manager = FirebaseManager(transport=HTTPTransport(fcm.url))
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeFCMServer:
+    def __init__(self, invalid_tokens=(), rejected_tokens=()):
+        self.invalid_tokens = set(invalid_tokens)
+        self.rejected_tokens = set(rejected_tokens)
+        self.requests = []
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length))
+                server.requests.append(payload)
+
+                results = []
+                for index, token in enumerate(payload['tokens']):
+                    if token in server.invalid_tokens:
+                        results.append({'error': {
+                            'code': 'UNREGISTERED',
+                            'message': 'Requested entity was not found.',
+                        }})
+                    elif token in server.rejected_tokens:
+                        results.append({'error': {
+                            'code': 'INVALID_ARGUMENT',
+                            'message': 'Request contains an invalid argument.',
+                        }})
+                    else:
+                        results.append({'name': f"projects/fake/messages/{index}"})
+
+                body = json.dumps({'results': results}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,93 @@
+"""
+Local stand-in for S3, enough of the REST API for api/s3.py clients:
+PutObject, GetObject, HeadObject and DeleteObject with path-style
+addressing. Objects live in memory in `objects`, keyed by (bucket, key).
+
+    with FakeS3Server() as s3, override_settings(AWS_S3_ENDPOINT_URL=s3.url):
+        get_s3_client().put_object(Bucket='media', Key='a.jpg', Body=b'...')
+"""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+
+def _decode_aws_chunked(body):
+    """Strip the aws-chunked framing newer botocore uses to send checksums."""
+    data = b''
+    while body:
+        header, _, body = body.partition(b'\r\n')
+        size = int(header.split(b';')[0], 16)
+        if size == 0:
+            break
+        data += body[:size]
+        body = body[size + 2:]
+    return data
+
+
+class FakeS3Server:
+    def __init__(self):
+        self.objects = {}
+        self.requests = []
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _location(self):
+                bucket, _, key = unquote(urlsplit(self.path).path).lstrip('/').partition('/')
+                server.requests.append((self.command, bucket, key))
+                return bucket, key
+
+            def _reply(self, code, body=b'', content_type='application/xml'):
+                self.send_response(code)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('ETag', '"fake"')
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(body)
+
+            def do_PUT(self):
+                location = self._location()
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if 'aws-chunked' in self.headers.get('Content-Encoding', ''):
+                    body = _decode_aws_chunked(body)
+                server.objects[location] = (
+                    body, self.headers.get('Content-Type', 'binary/octet-stream'))
+                self._reply(200)
+
+            def do_GET(self):
+                stored = server.objects.get(self._location())
+                if stored is None:
+                    return self._reply(404, b'<Error><Code>NoSuchKey</Code></Error>')
+                body, content_type = stored
+                self._reply(200, body, content_type)
+
+            do_HEAD = do_GET
+
+            def do_DELETE(self):
+                server.objects.pop(self._location(), None)
+                self._reply(204)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -4,9 +4,25 @@ from django.test import TestCase
 from django.contrib.auth import get_user_model
 from api.models import (
     Location, Posts, PostImages, Comments, Likes,
-    CollectionFolders, Collects, Notifications, Follow, Device
+    CollectionFolders, Collects, Notifications, Follow, Device,
+    Conversation, Message, ImageAsset
 )
 from django.contrib.gis.geos import Point
+from api.counters import reconcile
+from api import notifications
+from api.device_management import DeviceManager
+from api.tasks import (
+    fail_post_media, finalize_post_media, purge_orphaned_images, upload_post_image)
+from api import uploads
+from api.tests.fake_s3 import FakeS3Server
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from django.core.management import call_command
+from django.utils import timezone
+from datetime import timedelta
+from io import BytesIO, StringIO
+from PIL import Image
+import tempfile
 
 
 class UsersModelTest(TestCase):
@@ -22,6 +38,16 @@ class UsersModelTest(TestCase):
         self.assertEqual(self.user.email, 'test@example.com')
         self.assertTrue(self.user.check_password('testpassword'))
 
+    def test_profile_save_keeps_unread_counter(self):
+        Users = get_user_model()
+        Users.objects.filter(pk=self.user.pk).update(unread_notifications_count=3)
+        self.user.bio = 'Traveller'  # loaded before the increment
+        self.user.save()
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.bio, 'Traveller')
+        self.assertEqual(self.user.unread_notifications_count, 3)
+
 
 class LocationModelTest(TestCase):
     def setUp(self):
@@ -68,6 +94,112 @@ class PostsModelTest(TestCase):
         self.assertEqual(self.post.category, 'adventure')
         self.assertEqual(self.post.period, 'oneday')
 
+    def test_normalized_category_follows_category(self):
+        self.assertEqual(self.post.normalized_category, 'adventure')
+        self.post.category = 'Road Trip!'
+        self.post.save(update_fields=['category'])
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.normalized_category, 'roadtrip')
+
+
+class PostImageTasksTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='imageuser', email='image@example.com', password='imagepassword'
+        )
+        self.location = Location.objects.create(
+            place_id='place789', name='Image Location', address='789 Image Ave',
+            latitude=37.7749, longitude=-122.4194
+        )
+        self.post = Posts.objects.create(
+            user=self.user, title='Photo Trip', location=self.location,
+            status='published', category='adventure', period='oneday'
+        )
+
+        self.s3 = FakeS3Server()
+        self.s3.__enter__()
+        self.addCleanup(self.s3.__exit__, None, None, None)
+        spool = tempfile.TemporaryDirectory()
+        self.addCleanup(spool.cleanup)
+        storage = override_settings(
+            AWS_S3_ENDPOINT_URL=self.s3.url, MEDIA_BUCKET_NAME='media',
+            UPLOAD_STAGING='local', UPLOAD_SPOOL_DIR=spool.name, IMAGE_ORPHAN_GRACE=3600)
+        storage.enable()
+        self.addCleanup(storage.disable)
+
+        buffer = BytesIO()
+        Image.new('RGB', (800, 600), 'teal').save(buffer, format='JPEG')
+        self.photo = buffer.getvalue()
+
+    def upload(self, post):
+        """Stage the test photo and run upload_post_image on it for `post`."""
+        ref = uploads.stage(SimpleUploadedFile('photo.jpg', self.photo))
+        return upload_post_image(post.id, ref)
+
+    def test_reuploaded_photo_reuses_stored_variants(self):
+        day = Posts.objects.create(
+            user=self.user, title='Day 1', location=self.location, parent_post=self.post)
+        for post in (self.post, day):
+            self.assertTrue(self.upload(post)['ok'])
+        puts = [request for request in self.s3.requests if request[0] == 'PUT']
+
+        asset = ImageAsset.objects.get()
+        self.assertEqual(len(puts), sum(map(len, asset.variants.values())))
+        self.assertEqual(
+            list(PostImages.objects.order_by('id').values_list('image', flat=True)),
+            [asset.image, asset.image])
+
+    def test_reused_asset_without_placeholder_gets_one(self):
+        self.assertTrue(self.upload(self.post)['ok'])
+        # As stored before placeholders were rendered
+        ImageAsset.objects.update(placeholder='')
+        self.assertTrue(self.upload(self.post)['ok'])
+
+        self.assertTrue(ImageAsset.objects.get().placeholder.startswith('data:image/jpeg;base64,'))
+        self.assertTrue(self.post.images.order_by('-id').first().placeholder)
+
+    def test_orphaned_image_assets_are_purged(self):
+        self.assertTrue(self.upload(self.post)['ok'])
+        asset = ImageAsset.objects.get()
+        self.assertNotIn(asset.content_hash, asset.image)
+
+        ImageAsset.objects.update(last_used_at=timezone.now() - timedelta(hours=2))
+        purge_orphaned_images()
+        self.assertTrue(ImageAsset.objects.exists())
+
+        self.post.images.all().delete()
+        purge_orphaned_images()
+        self.assertFalse(ImageAsset.objects.exists())
+        self.assertEqual(self.s3.objects, {})
+
+    def test_finalize_post_media_summarizes_each_day(self):
+        day = Posts.objects.create(
+            user=self.user, title='Day 1', location=self.location,
+            parent_post=self.post, media_status='pending')
+        finalize_post_media([
+            {'post_id': self.post.id, 'ok': True},
+            {'post_id': day.id, 'ok': True},
+            {'post_id': day.id, 'ok': False},
+        ], self.post.id)
+
+        day.refresh_from_db()
+        self.post.refresh_from_db()
+        self.assertEqual(day.media_status, 'partial')
+        self.assertEqual(self.post.media_status, 'partial')
+
+    def test_chord_error_fails_pending_media(self):
+        day = Posts.objects.create(
+            user=self.user, title='Day 1', location=self.location,
+            parent_post=self.post, media_status='pending')
+        Posts.objects.filter(id=self.post.id).update(media_status='pending')
+
+        fail_post_media(None, TimeoutError('worker lost'), None, self.post.id)
+
+        day.refresh_from_db()
+        self.post.refresh_from_db()
+        self.assertEqual(day.media_status, 'failed')
+        self.assertEqual(self.post.media_status, 'failed')
+
 
 class CommentsModelTest(TestCase):
     def setUp(self):
@@ -104,6 +236,69 @@ class LikesModelTest(TestCase):
         self.assertEqual(self.like.post.title, 'Likeable Post')
 
 
+class EngagementCountersTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='counteruser', email='counter@example.com', password='counterpassword'
+        )
+        self.post = Posts.objects.create(
+            user=self.user, title='Counted Post', content='Content',
+            status='published', visibility='public', category='hiking', period='oneday'
+        )
+
+    def test_counters_follow_creates_and_deletes(self):
+        like = Likes.objects.create(user=self.user, post=self.post)
+        collect = Collects.objects.create(user=self.user, post=self.post)
+        comment = Comments.objects.create(
+            user=self.user, post=self.post, content='Nice')
+        Comments.objects.create(
+            user=self.user, post=self.post, content='Reply', reply_to=comment)
+        Likes.objects.create(user=self.user, comment=comment)
+
+        self.post.refresh_from_db()
+        comment.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+        self.assertEqual(self.post.saves_count, 1)
+        self.assertEqual(self.post.comments_count, 2)
+        self.assertEqual(comment.likes_count, 1)
+
+        like.delete()
+        collect.delete()
+        comment.delete()  # Cascades to its reply
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 0)
+        self.assertEqual(self.post.saves_count, 0)
+        self.assertEqual(self.post.comments_count, 0)
+
+    def test_save_does_not_write_back_stale_counters(self):
+        stale_post = Posts.objects.get(pk=self.post.pk)
+        comment = Comments.objects.create(user=self.user, post=self.post, content='Nice')
+        stale_comment = Comments.objects.get(pk=comment.pk)
+        Likes.objects.create(user=self.user, post=self.post)
+        Likes.objects.create(user=self.user, comment=comment)
+
+        stale_post.title = 'Edited'
+        stale_post.save()
+        stale_comment.content = 'Edited'
+        stale_comment.save()
+
+        self.post.refresh_from_db()
+        comment.refresh_from_db()
+        self.assertEqual(self.post.title, 'Edited')
+        self.assertEqual((self.post.likes_count, self.post.comments_count), (1, 1))
+        self.assertEqual((comment.content, comment.likes_count), ('Edited', 1))
+
+    def test_reconcile_repairs_drift(self):
+        Likes.objects.create(user=self.user, post=self.post)
+        Posts.objects.filter(pk=self.post.pk).update(likes_count=7)
+
+        reconcile()
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+
+
 class NotificationsModelTest(TestCase):
     def setUp(self):
         self.sender = get_user_model().objects.create_user(
@@ -126,6 +321,66 @@ class NotificationsModelTest(TestCase):
         self.assertEqual(self.notification.message_text, 'You have a new follower')
 
 
+class NotificationPipelineTest(TestCase):
+    def setUp(self):
+        self.author = get_user_model().objects.create_user(
+            username='author', email='author@example.com', password='authorpassword'
+        )
+        self.fan = get_user_model().objects.create_user(
+            username='fan', email='fan@example.com', password='fanpassword'
+        )
+        self.post = Posts.objects.create(
+            user=self.author, title='Post', content='Content',
+            category='adventure', period='oneday'
+        )
+
+    def test_like_is_delivered_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            Likes.objects.create(user=self.fan, post=self.post)
+        self.assertEqual(len(callbacks), 1)
+        self.assertFalse(Notifications.objects.exists())
+
+    def test_deliver_bulk_creates_notifications(self):
+        created = notifications.deliver([
+            notifications.event('like_post', self.author.id, self.fan.id, post_id=self.post.id),
+            notifications.event('follow', self.author.id, self.fan.id),
+            notifications.event('like_post', self.author.id, self.fan.id, post_id=-1),
+        ])
+        self.assertEqual(len(created), 2)
+        self.assertEqual(
+            Notifications.objects.get(notification_type='follow').message_text,
+            'fan started following you')
+
+    def test_likes_are_coalesced_per_post(self):
+        fans = [self.fan] + [
+            get_user_model().objects.create_user(
+                username=f'fan{i}', email=f'fan{i}@example.com', password='fanpassword')
+            for i in range(2)
+        ]
+        notifications.deliver([
+            notifications.event('like_post', self.author.id, fans[0].id, post_id=self.post.id)])
+        notifications.deliver([
+            notifications.event('like_post', self.author.id, fan.id, post_id=self.post.id)
+            for fan in fans
+        ])
+
+        notification = Notifications.objects.get()
+        self.assertEqual(notification.actor_count, 3)
+        self.assertEqual(notification.recent_actor_ids, [fan.id for fan in reversed(fans)])
+        self.assertEqual(notification.message_text, 'fan1 and 2 others liked your post')
+
+    def test_sender_of_pre_existing_row_is_not_counted_twice(self):
+        Notifications.objects.create(
+            recipient=self.author, sender=self.fan, post=self.post,
+            notification_type='like_post', message_text='fan liked your post')  # no recent_actor_ids
+        notifications.deliver([
+            notifications.event('like_post', self.author.id, self.fan.id, post_id=self.post.id)])
+
+        notification = Notifications.objects.get()
+        self.assertEqual(notification.actor_count, 1)
+        self.assertEqual(notification.recent_actor_ids, [self.fan.id])
+
+
 class DeviceModelTest(TestCase):
     def setUp(self):
         self.user = get_user_model().objects.create_user(
@@ -137,3 +392,92 @@ class DeviceModelTest(TestCase):
     def test_device_creation(self):
         self.assertEqual(self.device.user.username, 'deviceuser')
         self.assertEqual(self.device.token, 'device-token-123')
+
+    def test_send_results_drive_pruning(self):
+        healthy = Device.objects.create(user=self.user, token='healthy-token')
+        DeviceManager.record_send_results({
+            'successful_tokens': ['healthy-token'],
+            'failed_tokens': [
+                {'token': 'device-token-123', 'error': 'not found', 'invalid': True},
+            ],
+        })
+
+        self.device.refresh_from_db()
+        healthy.refresh_from_db()
+        self.assertIsNotNone(self.device.invalidated_at)
+        self.assertIsNotNone(healthy.last_success_at)
+
+        self.assertEqual(DeviceManager.prune_dead_tokens(), 1)
+        self.assertEqual(list(Device.objects.values_list('token', flat=True)),
+                         ['healthy-token'])
+
+
+class ConversationModelTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.alice = User.objects.create_user(username='alice', password='pass')
+        self.bob = User.objects.create_user(username='bob', password='pass')
+
+    def test_messages_in_both_directions_share_one_conversation(self):
+        Message.objects.create(sender=self.bob, receiver=self.alice, content='hi')
+        Message.objects.create(sender=self.bob, receiver=self.alice, content='there?')
+        reply = Message.objects.create(sender=self.alice, receiver=self.bob, content='yes')
+
+        conversation = Conversation.objects.get()
+        self.assertEqual(conversation.last_message, reply)
+        self.assertEqual(conversation.last_activity_at, reply.timestamp)
+        self.assertEqual(conversation.unread_count_for(self.alice), 2)
+        self.assertEqual(conversation.unread_count_for(self.bob), 1)
+
+        Conversation.objects.mark_read(conversation, self.alice)
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.unread_count_for(self.alice), 0)
+        self.assertEqual(conversation.unread_count_for(self.bob), 1)
+
+    def test_read_state_follows_the_watermark(self):
+        first, second, third = [
+            Message.objects.create(sender=self.bob, receiver=self.alice, content=str(i))
+            for i in range(3)]
+        conversation = Conversation.objects.get()
+
+        Conversation.objects.mark_read(conversation, self.alice, up_to=second.id)
+        conversation.refresh_from_db()
+        self.assertTrue(conversation.has_read(first))
+        self.assertTrue(conversation.has_read(second))
+        self.assertFalse(conversation.has_read(third))
+        self.assertEqual(conversation.unread_count_for(self.alice), 1)
+
+        # An older receipt does not move the watermark back
+        self.assertEqual(
+            Conversation.objects.mark_read(conversation, self.alice, up_to=first.id), 0)
+
+    def test_mark_read_covers_messages_above_last_message(self):
+        first, second = [
+            Message.objects.create(sender=self.bob, receiver=self.alice, content=str(i))
+            for i in range(2)]
+        # Concurrent sends can leave the latest timestamp on the lower id
+        Conversation.objects.update(last_message=first)
+        conversation = Conversation.objects.get()
+
+        Conversation.objects.mark_read(conversation, self.alice)
+        conversation.refresh_from_db()
+        self.assertTrue(conversation.has_read(second))
+        self.assertEqual(conversation.unread_count_for(self.alice), 0)
+
+    def test_backfill_carries_legacy_unread_state_over(self):
+        first, second, third = [
+            Message.objects.create(sender=self.bob, receiver=self.alice, content=str(i))
+            for i in range(3)]
+        # As stored before conversations existed: alice has read only the first message
+        Message.objects.update(conversation=None)
+        Message.objects.filter(id=first.id).update(is_read=True)
+        Conversation.objects.all().delete()
+
+        call_command('backfill_conversations', stdout=StringIO())
+
+        conversation = Conversation.objects.get()
+        self.assertTrue(conversation.has_read(first))
+        self.assertFalse(conversation.has_read(second))
+        self.assertEqual(conversation.unread_count_for(self.alice), 2)
+        self.assertEqual(conversation.unread_count_for(self.bob), 0)
+        self.assertEqual(conversation.last_message, third)
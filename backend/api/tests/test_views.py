@@ -2,9 +2,27 @@
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.contrib.auth import get_user_model
-from api.models import Device, Follow, Notifications, Posts, Likes, Comments, CollectionFolders, Collects, Location
+from api.models import Device, Follow, Message, Notifications, Posts, Likes, Comments, CollectionFolders, Collects, Location, TimelineEntry, Conversation
 from rest_framework_simplejwt.tokens import AccessToken
 from django.urls import reverse
+from api.timeline import backfill_follow, prune_follow
+from api.tasks import fan_out_post_to_timelines
+from api.firebase_utils import FCM_BATCH_SIZE, FirebaseManager, HTTPTransport
+from api.tests.fake_fcm import FakeFCMServer
+from django.test import SimpleTestCase
+from api.realtime import InProcessBroker
+from api import images, realtime, uploads
+from io import BytesIO
+from PIL import Image
+from api.s3 import get_s3_client
+from api.tests.fake_s3 import FakeS3Server
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+import asyncio
+import base64
+import os
+import tempfile
+import urllib.request
 
 
 class LikeViewsTestCase(APITestCase):
@@ -27,6 +45,15 @@ class LikeViewsTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertFalse(response.data['is_liked'])
 
+    def test_feed_reports_batched_like_state(self):
+        self.client.post(self.like_url)
+        response = self.client.get(reverse('post-list-create'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        post = next(p for p in response.data if p['id'] == self.post.id)
+        self.assertEqual(post['likes_count'], 1)
+        self.assertTrue(post['is_liked'])
+        self.assertFalse(post['is_saved'])
+
 
 class NearbyPostsTestCase(APITestCase):
     def setUp(self):
@@ -72,6 +99,36 @@ class PostViewsTestCase(APITestCase):
         self.post_detail_url = reverse(
             'post-detail', kwargs={'pk': self.post.id})
 
+    def test_media_status(self):
+        Posts.objects.filter(id=self.post.id).update(media_status='pending')
+        response = self.client.get(reverse('post-media-status', kwargs={'pk': self.post.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['media_status'], 'pending')
+
+        response = self.client.get(reverse('post-media-status', kwargs={'pk': self.post.id + 1000}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_complete_direct_upload_checks_the_refs(self):
+        url = reverse('post-images-complete', kwargs={'pk': self.post.id})
+        response = self.client.post(url, {'refs': ['s3:staging/999/a.jpg']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(url, {'refs': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(reverse('upload-presign'),
+                                    {'files': [{'name': 'a.exe', 'content_type': 'application/x-msdownload'}]},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(reverse('upload-presign'),
+                                    {'files': [{'name': 'a.svg', 'content_type': 'image/svg+xml'}]},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(reverse('comment-list-create'),
+                                    {'post': self.post.id, 'content': 'Hi', 'image_ref': 123},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
 
 def test_create_post(self):
     url = reverse('post-list-create')
@@ -97,6 +154,49 @@ def test_create_post(self):
         self.assertEqual(response.data['title'], 'Test Post')
 
 
+class PostFeedPaginationTestCase(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='feeduser', email='feed@example.com', password='pass')
+        self.access_token = str(AccessToken.for_user(self.user))
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+        for i in range(5):
+            Posts.objects.create(
+                user=self.user, title=f'Post {i}', content='Content',
+                category='hiking', period='oneday')
+        self.url = reverse('post-list-create')
+
+    def test_cursor_pages_cover_feed_once(self):
+        response = self.client.get(self.url, {'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['posts']), 2)
+
+        seen = [post['id'] for post in response.data['posts']]
+        while response.data['next']:
+            response = self.client.get(
+                self.url, {'page_size': 2, 'cursor': response.data['next']})
+            seen += [post['id'] for post in response.data['posts']]
+
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(len(set(seen)), 5)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filter_uses_normalized_category(self):
+        Posts.objects.create(
+            user=self.user, title='Trip', content='Content',
+            category='Road Trip', period='oneday')
+        Posts.objects.create(
+            user=self.user, title='Draft', content='Content',
+            category='Road Trip', period='oneday', status='draft')
+        response = self.client.get(self.url, {'travel_types': 'road trip'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([post['title'] for post in response.data], ['Trip'])
+
+
 class UserViewsTestCase(APITestCase):
     def setUp(self):
         self.user = get_user_model().objects.create_user(
@@ -131,6 +231,80 @@ class FollowListTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.json()), 1)
 
+    def test_following_list_reports_annotated_stats(self):
+        url = reverse('user-following', kwargs={'user_id': self.user.id})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        followed = response.json()[0]
+        self.assertEqual(followed['id'], self.user2.id)
+        self.assertEqual(followed['followers_count'], 1)
+        self.assertEqual(followed['following_count'], 0)
+        self.assertTrue(followed['is_following'])
+
+
+class HomeTimelineTestCase(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='reader', email='reader@example.com', password='pass')
+        self.author = get_user_model().objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        self.post = Posts.objects.create(
+            user=self.author, title='Trip', content='Content',
+            category='hiking', period='oneday')
+        Follow.objects.create(follower=self.user, following=self.author)
+        self.access_token = str(AccessToken.for_user(self.user))
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+        self.url = reverse('follow-posts')
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        backfill_follow(self.user.id, self.author.id)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([p['id'] for p in response.data['posts']], [self.post.id])
+        self.assertIsNone(response.data['next'])
+
+        prune_follow(self.user.id, self.author.id)
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['posts'], [])
+
+    def test_feed_is_whole_unless_paginated(self):
+        newer = Posts.objects.create(
+            user=self.author, title='Newer', content='Content',
+            category='hiking', period='oneday')
+        backfill_follow(self.user.id, self.author.id)
+
+        response = self.client.get(self.url)
+        self.assertEqual([p['id'] for p in response.data['posts']], [newer.id, self.post.id])
+        self.assertIsNone(response.data['next'])
+
+        response = self.client.get(self.url, {'page_size': 1})
+        self.assertEqual([p['id'] for p in response.data['posts']], [newer.id])
+        response = self.client.get(self.url, {'cursor': response.data['next']})
+        self.assertEqual([p['id'] for p in response.data['posts']], [self.post.id])
+
+    def test_draft_enters_timelines_when_published(self):
+        draft = Posts.objects.create(
+            user=self.author, title='Draft', content='Content',
+            category='hiking', period='oneday', status='draft')
+        self.assertFalse(TimelineEntry.objects.filter(post=draft).exists())
+
+        draft.status = 'published'
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            draft.save()
+        self.assertEqual(len(callbacks), 1)
+        fan_out_post_to_timelines(draft.id)  # what the queued task runs
+        self.assertTrue(TimelineEntry.objects.filter(user=self.user, post=draft).exists())
+
+        # Saving again while published does not fan out twice
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            draft.save()
+        self.assertEqual(callbacks, [])
+
+        draft.status = 'draft'
+        draft.save()
+        self.assertFalse(TimelineEntry.objects.filter(post=draft).exists())
+
 
 class NotificationTestCase(APITestCase):
     def setUp(self):
@@ -150,6 +324,100 @@ class NotificationTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data['notifications']), 1)
 
+    def test_notifications_are_cursor_paginated_and_compact(self):
+        post = Posts.objects.create(
+            user=self.user, title='Trip', content='Content')
+        for _ in range(2):
+            Notifications.objects.create(recipient=self.user, sender=self.user2, post=post,
+                                         notification_type='like_post', message_text='User2 liked your post')
+
+        response = self.client.get(self.notifications_url, {'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        first = response.data['notifications'][0]
+        self.assertEqual(first['sender']['username'], 'user88')
+        self.assertEqual(first['post'], {'id': post.id, 'title': 'Trip', 'thumbnail': None})
+        self.assertEqual(first['recipient'], {'id': self.user.id})  # read by the app
+
+        response = self.client.get(
+            self.notifications_url, {'page_size': 2, 'cursor': response.data['next']})
+        self.assertEqual(len(response.data['notifications']), 1)
+        self.assertIsNone(response.data['next'])
+
+    def test_comment_notifications_carry_the_comment_text(self):
+        post = Posts.objects.create(user=self.user, title='Trip', content='Content')
+        comment = Comments.objects.create(user=self.user2, post=post, content='Lovely view')
+        Notifications.objects.create(recipient=self.user, sender=self.user2, post=post, comment=comment,
+                                     notification_type='comment', message_text='User2 commented')
+
+        response = self.client.get(self.notifications_url)
+        self.assertEqual(response.data['notifications'][0]['comment']['content'], 'Lovely view')
+
+    def test_unread_count_follows_mark_read(self):
+        url = reverse('notification-unread-count')
+        self.assertEqual(self.client.get(url).data['unread_count'], 1)
+
+        response = self.client.post(
+            reverse('notification-mark-read'), {'mark_all': 'true'}, format='json')
+        self.assertEqual(response.data['unread_count'], 0)
+        self.assertEqual(self.client.get(url).data['unread_count'], 0)
+
+
+class MessagingTestCase(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username='chatter', password='pass')
+        self.friend = User.objects.create_user(username='friend', password='pass')
+        self.other = User.objects.create_user(username='other', password='pass')
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_inbox_lists_one_entry_per_pair_by_activity(self):
+        Message.objects.create(sender=self.friend, receiver=self.user, content='hey')
+        Message.objects.create(sender=self.user, receiver=self.friend, content='hi!')
+        Message.objects.create(sender=self.other, receiver=self.user, content='ping')
+
+        response = self.client.get(reverse('conversations-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([c['other_user']['username'] for c in response.data],
+                         ['other', 'friend'])
+        self.assertEqual(response.data[0]['unread_count'], 1)
+        self.assertEqual(response.data[1]['content'], 'hi!')
+        self.assertEqual(response.data[1]['unread_count'], 1)
+
+    def test_inbox_skips_conversations_without_messages(self):
+        Message.objects.create(sender=self.friend, receiver=self.user, content='hey')
+        # Left behind by a send that failed after creating the conversation
+        Conversation.objects.for_pair(self.user.id, self.other.id)
+
+        response = self.client.get(reverse('conversations-list'))
+        self.assertEqual([c['other_user']['username'] for c in response.data], ['friend'])
+
+    def test_history_is_loaded_in_keyset_windows(self):
+        sent = [Message.objects.create(sender=self.friend, receiver=self.user, content=str(i))
+                for i in range(5)]
+        url = reverse('message-list')
+        params = {'other_user_id': self.friend.id, 'page_size': 2}
+
+        latest = self.client.get(url, params).data
+        self.assertEqual([m['id'] for m in latest['messages']], [sent[3].id, sent[4].id])
+        caught_up = self.client.get(url, {**params, 'after': latest['after']}).data
+        self.assertEqual(caught_up['messages'], [])
+        self.assertEqual(caught_up['after'], latest['after'])
+
+        older = self.client.get(url, {**params, 'before': latest['before']}).data
+        self.assertEqual([m['id'] for m in older['messages']], [sent[1].id, sent[2].id])
+
+        oldest = self.client.get(url, {**params, 'before': older['before']}).data
+        self.assertEqual([m['id'] for m in oldest['messages']], [sent[0].id])
+        self.assertIsNone(oldest['before'])
+
+        newer = self.client.get(url, {**params, 'after': older['after']}).data
+        self.assertEqual([m['id'] for m in newer['messages']], [sent[3].id, sent[4].id])
+
+        reply = Message.objects.create(sender=self.user, receiver=self.friend, content='hi')
+        arrived = self.client.get(url, {**params, 'after': latest['after']}).data
+        self.assertEqual([m['id'] for m in arrived['messages']], [reply.id])
+
 
 class CommentViewsTestCase(APITestCase):
     def setUp(self):
@@ -188,6 +456,25 @@ class CommentViewsTestCase(APITestCase):
         self.assertIn("At least one of 'content' or 'comment_image' must be provided.",
                       response.json()['non_field_errors'])
 
+    def test_post_comments_nests_replies(self):
+        parent = Comments.objects.create(
+            user=self.user, post=self.post, content='Parent')
+        reply = Comments.objects.create(
+            user=self.user, post=self.post, content='Reply', reply_to=parent)
+        Comments.objects.create(
+            user=self.user, post=self.post, content='Nested', reply_to=reply)
+        Likes.objects.create(user=self.user, comment=reply)
+
+        response = self.client.get(
+            reverse('post-comments', kwargs={'post_id': self.post.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        replies = response.data[0]['replies']
+        self.assertEqual(len(replies), 1)
+        self.assertEqual(replies[0]['likes_count'], 1)
+        self.assertTrue(replies[0]['is_liked'])
+        self.assertEqual(replies[0]['replies'][0]['content'], 'Nested')
+
 
 class LoginTestCase(APITestCase):
     def setUp(self):
@@ -246,6 +533,163 @@ class RegisterUserTestCase(APITestCase):
         self.assertIn('access_token', response.json())
 
 
+class FirebaseBatchingTestCase(SimpleTestCase):
+    def test_tokens_are_sent_in_batches(self):
+        tokens = [f'token-{i}' for i in range(FCM_BATCH_SIZE + 1)] + ['dead']
+        with FakeFCMServer(invalid_tokens={'dead'}) as fcm:
+            firebase = FirebaseManager(transport=HTTPTransport(fcm.url))
+            result = firebase.send_notification(
+                tokens, 'Title', 'Body', data={'type': 'test'})
+
+        self.assertEqual(len(fcm.requests), 2)
+        self.assertEqual(result['success_count'], FCM_BATCH_SIZE + 1)
+        self.assertEqual(result['failed_tokens'], [{
+            'token': 'dead',
+            'error': 'Requested entity was not found.',
+            'invalid': True,
+        }])
+
+    def test_invalid_argument_is_a_failure_not_a_dead_token(self):
+        with FakeFCMServer(rejected_tokens={'token-1'}) as fcm:
+            firebase = FirebaseManager(transport=HTTPTransport(fcm.url))
+            result = firebase.send_notification(['token-1'], 'Title', 'Body')
+
+        self.assertEqual(result['failure_count'], 1)
+        self.assertFalse(result['failed_tokens'][0]['invalid'])
+
+
+class RealtimeBrokerTestCase(SimpleTestCase):
+    def test_in_process_broker_streams_to_subscribed_user(self):
+        broker = InProcessBroker()
+        event = {'type': 'message', 'data': {'id': 7}}
+
+        async def scenario():
+            stream = broker.subscribe(1, heartbeat=0.05)
+            # First heartbeat: the stream is now subscribed
+            self.assertIsNone(await anext(stream))
+            broker.publish(2, {'type': 'message', 'data': {'id': 8}})
+            broker.publish(1, event)
+            self.assertEqual(await anext(stream), event)
+            self.assertIsNone(await anext(stream))
+            await stream.aclose()
+
+        asyncio.run(scenario())
+        self.assertEqual(broker._subscribers, {})
+
+
+class UploadStagingTestCase(SimpleTestCase):
+    def test_staged_upload_is_passed_by_reference_and_discarded(self):
+        with tempfile.TemporaryDirectory() as spool, \
+                override_settings(UPLOAD_STAGING='local', UPLOAD_SPOOL_DIR=spool):
+            ref = uploads.stage(SimpleUploadedFile('photo.JPG', b'jpeg-bytes'))
+            self.assertTrue(ref.startswith('file:'))
+            self.assertLess(len(ref), 64)
+            self.assertEqual(uploads.read_staged(ref), b'jpeg-bytes')
+
+            uploads.discard(ref)
+            self.assertEqual(os.listdir(spool), [])
+
+    def test_s3_staging_reuses_the_process_client(self):
+        with FakeS3Server() as s3, override_settings(
+                AWS_S3_ENDPOINT_URL=s3.url, UPLOAD_STAGING='s3',
+                UPLOAD_STAGING_BUCKET='media', UPLOAD_STAGING_PREFIX='staging/'):
+            client = get_s3_client()
+            ref = uploads.stage(SimpleUploadedFile('photo.jpg', b'jpeg-bytes'))
+            self.assertEqual(uploads.read_staged(ref), b'jpeg-bytes')
+            uploads.discard(ref)
+
+            self.assertIs(get_s3_client(), client)
+            self.assertEqual(s3.objects, {})
+            self.assertEqual([method for method, _, _ in s3.requests], ['PUT', 'GET', 'DELETE'])
+
+    def test_direct_upload_is_claimed_only_by_its_uploader(self):
+        with FakeS3Server() as s3, override_settings(
+                AWS_S3_ENDPOINT_URL=s3.url, UPLOAD_STAGING_BUCKET='media',
+                UPLOAD_STAGING_PREFIX='staging/', UPLOAD_MAX_BYTES=16):
+            upload = uploads.presign(7, 'photo.JPG', 'image/jpeg')
+            self.assertTrue(upload['ref'].startswith('s3:staging/7/'))
+            self.assertRaises(ValueError, uploads.claim, upload['ref'], 7)  # not uploaded yet
+
+            request = urllib.request.Request(
+                upload['url'], data=b'jpeg-bytes', method='PUT', headers=upload['headers'])
+            urllib.request.urlopen(request).close()
+
+            self.assertEqual(uploads.claim(upload['ref'], 7), upload['ref'])
+            self.assertRaises(ValueError, uploads.claim, upload['ref'], 8)
+            self.assertEqual(uploads.read_staged(upload['ref']), b'jpeg-bytes')
+
+            too_big = uploads.presign(7, 'big.jpg', 'image/jpeg')
+            request = urllib.request.Request(
+                too_big['url'], data=b'x' * 17, method='PUT', headers=too_big['headers'])
+            urllib.request.urlopen(request).close()
+            self.assertRaises(ValueError, uploads.claim, too_big['ref'], 7)
+            self.assertNotIn(('media', too_big['ref'][3:]), s3.objects)
+
+
+class ImagePipelineTestCase(SimpleTestCase):
+    def test_upload_is_rendered_at_each_width_and_format(self):
+        buffer = BytesIO()
+        Image.new('RGB', (2000, 1000), 'orange').save(buffer, format='PNG')
+
+        with FakeS3Server() as s3, override_settings(
+                AWS_S3_ENDPOINT_URL=s3.url, MEDIA_BUCKET_NAME='media',
+                IMAGE_VARIANT_WIDTHS=[320, 640, 1024], IMAGE_MAX_WIDTH=1600,
+                IMAGE_VARIANT_FORMATS=['jpeg', 'webp']):
+            processed = images.process(buffer.getvalue(), 'media/postImages/abc')
+
+        self.assertEqual((processed.width, processed.height), (1600, 800))
+        self.assertEqual(sorted(processed.variants['webp'], key=int),
+                         ['320', '640', '1024', '1600'])
+        self.assertEqual(processed.primary_key, 'media/postImages/abc_1600.jpg')
+        self.assertEqual(images.smallest(processed.variants), 'media/postImages/abc_320.jpg')
+        self.assertEqual(s3.objects[('media', 'media/postImages/abc_640.webp')][1], 'image/webp')
+        self.assertEqual(len(s3.objects), 8)
+        self.assertTrue(processed.placeholder)
+
+    def test_placeholder_can_be_skipped(self):
+        buffer = BytesIO()
+        Image.new('RGB', (400, 300), 'orange').save(buffer, format='JPEG')
+
+        with FakeS3Server() as s3, override_settings(
+                AWS_S3_ENDPOINT_URL=s3.url, MEDIA_BUCKET_NAME='media'):
+            processed = images.process(
+                buffer.getvalue(), 'media/commentImages/abc', widths=(), formats=('jpeg',),
+                with_placeholder=False)
+
+        self.assertIsNone(processed.placeholder)
+
+    def test_placeholder_is_a_tiny_inline_jpeg(self):
+        with override_settings(IMAGE_PLACEHOLDER_WIDTH=32):
+            uri = images.placeholder(Image.new('RGB', (2000, 1000), 'orange'))
+
+        prefix = 'data:image/jpeg;base64,'
+        self.assertTrue(uri.startswith(prefix))
+        self.assertLess(len(uri), 1024)
+        self.assertEqual(Image.open(BytesIO(base64.b64decode(uri[len(prefix):]))).size, (32, 16))
+
+
+class RealtimeStreamTestCase(APITestCase):
+    def test_stream_requires_valid_ticket(self):
+        response = self.client.get(reverse('realtime-stream'), {'ticket': 'garbage'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_ticket_names_the_user_expires_and_works_once(self):
+        user = get_user_model().objects.create_user(username='streamer', password='pass')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        ticket = self.client.post(reverse('realtime-ticket')).data['ticket']
+
+        with override_settings(REALTIME_TICKET_TTL=-1):
+            self.assertIsNone(realtime.redeem_ticket(ticket))
+        self.assertEqual(realtime.redeem_ticket(ticket), user.id)
+        # A replayed ticket (e.g. from an access log) is refused
+        self.assertIsNone(realtime.redeem_ticket(ticket))
+
+    def test_raw_token_in_query_string_is_refused(self):
+        user = get_user_model().objects.create_user(username='leaky', password='pass')
+        response = self.client.get(reverse('realtime-stream'), {'token': str(AccessToken.for_user(user))})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
 class SendNotificationTestCase(APITestCase):
     def setUp(self):
         self.user = get_user_model().objects.create_user(username='notifyuser',
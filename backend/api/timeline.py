@@ -0,0 +1,101 @@
+"""
+Materialized home timelines (fan-out on write).
+
+When a user publishes a top-level post (on creation or later, from a draft)
+it is copied into the timeline of every follower, and each timeline is
+trimmed to HOME_TIMELINE_DEPTH entries. Unpublishing removes it again;
+deleting a post cascades to its entries.
+Following someone backfills their recent posts; unfollowing removes them.
+Reading a home feed is then a keyset scan over one user's entries.
+"""
+from django.conf import settings
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from .models import Follow, Posts, TimelineEntry
+
+FAN_OUT_BATCH_SIZE = 1000
+
+
+def timeline_depth():
+    return getattr(settings, 'HOME_TIMELINE_DEPTH', 500)
+
+
+def trim_timelines(user_ids, depth=None):
+    """Delete entries beyond `depth` from the timelines of `user_ids`."""
+    depth = depth or timeline_depth()
+    overflow = TimelineEntry.objects.filter(user_id__in=user_ids).annotate(
+        position=Window(
+            RowNumber(),
+            partition_by=[F('user_id')],
+            order_by=[F('created_at').desc(), F('post_id').desc()],
+        )
+    ).filter(position__gt=depth)
+    return TimelineEntry.objects.filter(
+        id__in=overflow.values('id')).delete()[0]
+
+
+def fan_out_post(post):
+    """Insert a published top-level post into every follower's timeline."""
+    if post.parent_post_id is not None or post.status != 'published':
+        return 0
+
+    follower_ids = Follow.objects.filter(
+        following_id=post.user_id).values_list('follower_id', flat=True)
+
+    written = 0
+    batch = []
+    for follower_id in follower_ids.iterator(chunk_size=FAN_OUT_BATCH_SIZE):
+        batch.append(follower_id)
+        if len(batch) >= FAN_OUT_BATCH_SIZE:
+            written += _write_entries(post, batch)
+            batch = []
+    if batch:
+        written += _write_entries(post, batch)
+    return written
+
+
+def _write_entries(post, follower_ids):
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(user_id=follower_id, post_id=post.id,
+                          author_id=post.user_id, created_at=post.created_at)
+            for follower_id in follower_ids
+        ],
+        ignore_conflicts=True,
+    )
+    trim_timelines(follower_ids)
+    return len(follower_ids)
+
+
+def backfill_follow(follower_id, following_id):
+    """Copy the followed user's recent posts into the follower's timeline."""
+    if not Follow.objects.filter(follower_id=follower_id, following_id=following_id).exists():
+        # Unfollowed before the task ran
+        return 0
+
+    recent_posts = Posts.objects.filter(
+        user_id=following_id,
+        status='published',
+        parent_post__isnull=True,
+    ).order_by('-created_at', '-id').values_list('id', 'created_at')[:timeline_depth()]
+
+    entries = [
+        TimelineEntry(user_id=follower_id, post_id=post_id,
+                      author_id=following_id, created_at=created_at)
+        for post_id, created_at in recent_posts
+    ]
+    TimelineEntry.objects.bulk_create(entries, ignore_conflicts=True)
+    trim_timelines([follower_id])
+    return len(entries)
+
+
+def prune_follow(follower_id, following_id):
+    """Remove the unfollowed user's posts from the follower's timeline."""
+    return TimelineEntry.objects.filter(
+        user_id=follower_id, author_id=following_id).delete()[0]
+
+
+def remove_post(post_id):
+    """Remove an unpublished post from every timeline."""
+    return TimelineEntry.objects.filter(post_id=post_id).delete()[0]
@@ -0,0 +1,151 @@
+"""
+Staging area for uploaded images awaiting background processing.
+
+Request handlers stream each upload into staging with stage() and enqueue
+only the returned reference, so the Celery broker carries a short string
+instead of the photo itself. The task reads the bytes back with
+read_staged() and removes them with discard() once it is done.
+
+settings.UPLOAD_STAGING selects where uploads are staged:
+    'local' - files in UPLOAD_SPOOL_DIR (a directory shared with the workers)
+    's3'    - objects under UPLOAD_STAGING_PREFIX in UPLOAD_STAGING_BUCKET
+Anything a crashed worker leaves behind is removed by purge_stale().
+
+Clients may also skip the application server entirely: presign() reserves a
+key under UPLOAD_STAGING_PREFIX/<user id>/ in UPLOAD_STAGING_BUCKET and
+returns a presigned PUT URL for it. Once the client reports the upload
+complete, claim() checks the object and its reference is processed like any
+other staged upload.
+"""
+import os
+import time
+import uuid
+
+from botocore.exceptions import ClientError
+from django.conf import settings
+
+from .s3 import get_s3_client
+
+LOCAL_PREFIX = 'file:'
+S3_PREFIX = 's3:'
+
+
+def _spool_path(name):
+    # Only ever a bare file name inside the spool directory
+    return os.path.join(settings.UPLOAD_SPOOL_DIR, os.path.basename(name))
+
+
+def stage(uploaded_file):
+    """Copy `uploaded_file` into staging chunk by chunk and return its reference."""
+    _, ext = os.path.splitext(uploaded_file.name or '')
+    name = f"{uuid.uuid4().hex}{ext.lower()}"
+
+    if settings.UPLOAD_STAGING == 's3':
+        key = f"{settings.UPLOAD_STAGING_PREFIX}{name}"
+        uploaded_file.seek(0)
+        get_s3_client().upload_fileobj(uploaded_file, settings.UPLOAD_STAGING_BUCKET, key)
+        return f"{S3_PREFIX}{key}"
+
+    os.makedirs(settings.UPLOAD_SPOOL_DIR, exist_ok=True)
+    with open(_spool_path(name), 'wb') as spooled:
+        for chunk in uploaded_file.chunks():
+            spooled.write(chunk)
+    return f"{LOCAL_PREFIX}{name}"
+
+
+def presign(user_id, filename, content_type):
+    """
+    Reserve a staging key for a direct upload by `user_id` and return
+    {'ref', 'url', 'method', 'headers'} for the client's PUT request.
+    """
+    _, ext = os.path.splitext(filename or '')
+    key = f"{settings.UPLOAD_STAGING_PREFIX}{user_id}/{uuid.uuid4().hex}{ext.lower()}"
+    url = get_s3_client().generate_presigned_url(
+        'put_object',
+        Params={'Bucket': settings.UPLOAD_STAGING_BUCKET, 'Key': key, 'ContentType': content_type},
+        ExpiresIn=settings.UPLOAD_PRESIGN_EXPIRES,
+    )
+    return {'ref': f"{S3_PREFIX}{key}", 'url': url, 'method': 'PUT',
+            'headers': {'Content-Type': content_type}}
+
+
+def claim(ref, user_id):
+    """
+    Check that `ref` is a direct upload reserved by `user_id` that has
+    arrived and is no larger than UPLOAD_MAX_BYTES. Raises ValueError
+    otherwise; an oversized upload is discarded.
+    """
+    owner_prefix = f"{S3_PREFIX}{settings.UPLOAD_STAGING_PREFIX}{user_id}/"
+    name = ref[len(owner_prefix):] if ref.startswith(owner_prefix) else ''
+    if not name or '/' in name:
+        raise ValueError(f"Not an upload of this user: {ref}")
+
+    try:
+        head = get_s3_client().head_object(
+            Bucket=settings.UPLOAD_STAGING_BUCKET, Key=ref[len(S3_PREFIX):])
+    except ClientError:
+        raise ValueError(f"Upload has not arrived: {ref}")
+    if head['ContentLength'] > settings.UPLOAD_MAX_BYTES:
+        discard(ref)
+        raise ValueError(f"Upload is larger than {settings.UPLOAD_MAX_BYTES} bytes: {ref}")
+    return ref
+
+
+def read_staged(ref):
+    """The bytes of a staged upload."""
+    if ref.startswith(S3_PREFIX):
+        response = get_s3_client().get_object(
+            Bucket=settings.UPLOAD_STAGING_BUCKET, Key=ref[len(S3_PREFIX):])
+        return response['Body'].read()
+    if ref.startswith(LOCAL_PREFIX):
+        with open(_spool_path(ref[len(LOCAL_PREFIX):]), 'rb') as spooled:
+            return spooled.read()
+    raise ValueError(f"Unknown staged upload reference: {ref}")
+
+
+def discard(ref):
+    """Delete a staged upload. Missing files are ignored."""
+    if ref.startswith(S3_PREFIX):
+        get_s3_client().delete_object(
+            Bucket=settings.UPLOAD_STAGING_BUCKET, Key=ref[len(S3_PREFIX):])
+    elif ref.startswith(LOCAL_PREFIX):
+        try:
+            os.remove(_spool_path(ref[len(LOCAL_PREFIX):]))
+        except FileNotFoundError:
+            pass
+
+
+def _purge_s3(cutoff):
+    s3 = get_s3_client()
+    removed = 0
+    pages = s3.get_paginator('list_objects_v2').paginate(
+        Bucket=settings.UPLOAD_STAGING_BUCKET, Prefix=settings.UPLOAD_STAGING_PREFIX)
+    for page in pages:
+        for obj in page.get('Contents', []):
+            if obj['LastModified'].timestamp() < cutoff:
+                s3.delete_object(Bucket=settings.UPLOAD_STAGING_BUCKET, Key=obj['Key'])
+                removed += 1
+    return removed
+
+
+def _purge_local(cutoff):
+    if not os.path.isdir(settings.UPLOAD_SPOOL_DIR):
+        return 0
+    removed = 0
+    for entry in os.scandir(settings.UPLOAD_SPOOL_DIR):
+        if entry.is_file() and entry.stat().st_mtime < cutoff:
+            os.remove(entry.path)
+            removed += 1
+    return removed
+
+
+def purge_stale(max_age):
+    """
+    Delete staged uploads older than `max_age` seconds, including direct
+    uploads that were never completed. Returns how many were removed.
+    """
+    cutoff = time.time() - max_age
+    removed = _purge_local(cutoff)
+    if settings.UPLOAD_STAGING == 's3' or settings.UPLOAD_DIRECT:
+        removed += _purge_s3(cutoff)
+    return removed
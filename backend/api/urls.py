@@ -5,7 +5,7 @@ from django.conf import settings
 
 from .views import (
     UserListCreateView, UserDetailView,
-    PostListCreateView, PostDetailView,
+    PostListCreateView, PostDetailView, PostMediaStatusView,
     CommentListCreateView, CommentDetailView,
     LikeListCreateView, LikeDetailView,
     CollectionFolderListCreateView, CollectionFolderDetailView,
@@ -14,8 +14,9 @@ from .views import (
     UserInfoView, UserDetailView,
     ToggleLikeView, PostCommentsView, ToggleSaveView,
     FollowView, UserFollowingListView, UserFollowersListView, PostListByLocationView, NearbyPostsView, FollowPostView,
-    NotificationMarkReadView, RegisterDevice, SendNotification, TestFirebaseNotification,
-    MessageListView, SendMessageView, MarkMessageReadView, ConversationsListView,MarkConversationReadView
+    NotificationMarkReadView, NotificationUnreadCountView, RegisterDevice, SendNotification, TestFirebaseNotification,
+    MessageListView, SendMessageView, MarkMessageReadView, ConversationsListView,MarkConversationReadView,
+    RealtimeStreamView, RealtimeTicketView, PresignUploadView, PostImagesCompleteView
 )
 
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
@@ -34,6 +35,10 @@ urlpatterns = [
     # Post Endpoints
     path('posts/', PostListCreateView.as_view(), name='post-list-create'),
     path('posts/<int:pk>/', PostDetailView.as_view(), name='post-detail'),
+    path('posts/<int:pk>/media-status/', PostMediaStatusView.as_view(),
+         name='post-media-status'),
+    path('posts/<int:pk>/images/complete/', PostImagesCompleteView.as_view(),
+         name='post-images-complete'),
     path('posts/<int:post_id>/comments/',
          PostCommentsView.as_view(), name='post-comments'),
     path('posts/<int:post_id>/like/', ToggleLikeView.as_view(), name='post-like'),
@@ -79,6 +84,15 @@ urlpatterns = [
          name='notification-list'),
     path('notifications/mark-read/', NotificationMarkReadView.as_view(),
          name='notification-mark-read'),
+    path('notifications/unread-count/', NotificationUnreadCountView.as_view(),
+         name='notification-unread-count'),
+    # Server-sent events: new notifications and messages (ASGI only)
+    path('realtime/stream/', RealtimeStreamView.as_view(),
+         name='realtime-stream'),
+    path('realtime/ticket/', RealtimeTicketView.as_view(),
+         name='realtime-ticket'),
+    # Presigned PUT URLs for uploading images straight to object storage
+    path('uploads/presign/', PresignUploadView.as_view(), name='upload-presign'),
     # Only for development
 
      path('users/me/', UserInfoView.as_view(), name='user-info'),
@@ -1,9 +1,9 @@
 from .user_views import UserListCreateView, UserDetailView, UserInfoView
-from .post_views import PostListCreateView, PostDetailView
+from .post_views import PostListCreateView, PostDetailView, PostMediaStatusView
 from .comment_views import CommentListCreateView, CommentDetailView, PostCommentsView
 from .like_views import LikeListCreateView, LikeDetailView
 from .collection_views import CollectionFolderListCreateView, CollectionFolderDetailView, CollectListCreateView, CollectDetailView
-from .notification_views import NotificationListView, NotificationMarkReadView
+from .notification_views import NotificationListView, NotificationMarkReadView, NotificationUnreadCountView
 from .register_views import RegisterView
 from .login_views import LoginView
 from .post_views import ToggleLikeView, ToggleSaveView
@@ -16,3 +16,5 @@ from .register_device_views import RegisterDevice
 from .send_notofication_views import SendNotification
 from .firebase_test import TestFirebaseNotification
 from .message_views import MessageListView, SendMessageView, MarkMessageReadView, ConversationsListView, MarkConversationReadView
+from .realtime_views import RealtimeStreamView, RealtimeTicketView
+from .upload_views import PresignUploadView, PostImagesCompleteView
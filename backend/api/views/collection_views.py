@@ -3,6 +3,8 @@ from drf_yasg.utils import swagger_auto_schema
 from rest_framework.generics import ListCreateAPIView, RetrieveUpdateDestroyAPIView
 from ..models import CollectionFolders, Collects
 from ..serializers import CollectionFolderSerializer, CollectSerializer
+from ..batching import post_serializer_context, prefetch_users
+from rest_framework.response import Response
 
 
 class CollectionFolderListCreateView(ListCreateAPIView):
@@ -89,6 +91,17 @@ class CollectListCreateView(ListCreateAPIView):
     queryset = Collects.objects.select_related('user', 'post', 'folder').all()
     serializer_class = CollectSerializer
 
+    def get_queryset(self):
+        viewer = self.request.user
+        return Collects.objects.select_related(
+            'post__location', 'folder'
+        ).prefetch_related(
+            prefetch_users('user', viewer),
+            prefetch_users('post__user', viewer),
+            prefetch_users('folder__user', viewer),
+            'post__images',
+        )
+
     @swagger_auto_schema(
         operation_summary="List all collects",
         operation_description=(
@@ -99,6 +112,16 @@ class CollectListCreateView(ListCreateAPIView):
     def get(self, request, *args, **kwargs):
         return super().get(request, *args, **kwargs)
 
+    def list(self, request, *args, **kwargs):
+        collects = list(self.filter_queryset(self.get_queryset()))
+
+        # Resolve likes/saves for every collected post in one batch
+        context = self.get_serializer_context()
+        context.update(post_serializer_context(
+            request, [collect.post for collect in collects if collect.post]))
+        serializer = self.get_serializer(collects, many=True, context=context)
+        return Response(serializer.data)
+
     @swagger_auto_schema(
         operation_summary="Create a new collect",
         operation_description=(
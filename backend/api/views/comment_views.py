@@ -11,15 +11,10 @@ from rest_framework import status
 
 import logging
 
-from PIL import Image
-from io import BytesIO
-from django.core.files.uploadedfile import InMemoryUploadedFile
-import sys
-
-import boto3
-from botocore.exceptions import ClientError
-
 from ..tasks import upload_comment_image
+from .. import uploads
+from ..uploads import stage
+from ..batching import comment_serializer_context
 
 # Create a logger instance
 logger = logging.getLogger(__name__)
@@ -35,55 +30,6 @@ class CommentListCreateView(ListCreateAPIView):
 
     
 
-    @staticmethod
-    def resize_and_compress_image(image_file, max_width=1024, quality=75):
-        """
-        Resize and compress an uploaded image using Pillow.
-        Returns an InMemoryUploadedFile ready for upload.
-        """
-        img = Image.open(image_file)
-
-        # Convert to RGB to avoid issues with PNG/Transparency
-        if img.mode in ("RGBA", "P"):
-            img = img.convert("RGB")
-
-        # Resize if too wide
-        if img.width > max_width:
-            ratio = max_width / float(img.width)
-            new_height = int((float(img.height) * float(ratio)))
-            img = img.resize((max_width, new_height), Image.Resampling.LANCZOS)
-
-        # Save to BytesIO buffer
-        buffer = BytesIO()
-        img.save(buffer, format='JPEG', quality=quality)
-        buffer.seek(0)
-
-        return InMemoryUploadedFile(
-            buffer,
-            None,
-            f"{image_file.name.split('.')[0]}.jpg",
-            'image/jpeg',
-            sys.getsizeof(buffer),
-            None
-        )
-
-    @staticmethod
-    def upload_comment_image_to_s3(file_obj, bucket_name, object_key):
-        """
-        Uploads a compressed image file to S3.
-        Returns the S3 object key or full URL if successful, otherwise None.
-        """
-        try:
-            s3_client = boto3.client('s3')
-            s3_client.upload_fileobj(file_obj, bucket_name, object_key)
-            print(f"✅ Uploaded to S3: {object_key}")
-            return object_key  # or return full URL: f"https://{bucket_name}.s3.amazonaws.com/{object_key}"
-        except ClientError as e:
-            print(f"❌ S3 Upload Error: {e}")
-            return None
-
-
-
     @swagger_auto_schema(
         operation_summary="List all comments",
         operation_description="Retrieve a list of all comments, including user details and associated posts.",
@@ -96,7 +42,9 @@ class CommentListCreateView(ListCreateAPIView):
         operation_summary="Create a new comment",
         operation_description="Create a new comment for a post or as a reply to another comment. "
         "Provide `post_id` to associate the comment with a post, and optionally "
-        "provide `reply_to` to associate the comment as a reply to another comment.",
+        "provide `reply_to` to associate the comment as a reply to another comment. "
+        "An image is sent either as `comment_image` (multipart) or, after a direct upload "
+        "through uploads/presign/, as `image_ref` (JSON).",
         request_body=CommentSerializer,
         responses={201: CommentSerializer}
     )
@@ -108,8 +56,30 @@ class CommentListCreateView(ListCreateAPIView):
 
         # Check Content-Type
         if request.content_type.startswith('application/json'):
-            # JSON payload (text-only comment)
-            return super().post(request, *args, **kwargs)
+            image_ref = request.data.get('image_ref')
+            if not image_ref:
+                # JSON payload (text-only comment)
+                return super().post(request, *args, **kwargs)
+
+            # Image already uploaded directly to storage (uploads/presign/)
+            if not isinstance(image_ref, str):
+                return Response({'error': 'image_ref must be an upload reference string'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            try:
+                uploads.claim(image_ref, request.user.id)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+            serializer = self.get_serializer(
+                data=request.data,
+                context={'request': request, 'has_image': True}
+            )
+            if serializer.is_valid():
+                comment = serializer.save()
+                upload_comment_image.delay(comment.id, image_ref, image_ref.rsplit('/', 1)[-1])
+                return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
         elif request.content_type.startswith('multipart/form-data'):
             image = request.FILES.get('comment_image')
@@ -127,7 +97,7 @@ class CommentListCreateView(ListCreateAPIView):
                 if image:
                     upload_comment_image.delay(
                         comment.id,
-                        image.read(),
+                        stage(image),
                         image.name
                     )
 
@@ -193,3 +163,12 @@ class PostCommentsView(ListAPIView):
     def get_queryset(self):
         post_id = self.kwargs['post_id']
         return Comments.objects.filter(post_id=post_id, reply_to=None)
+
+    def list(self, request, *args, **kwargs):
+        # Load the whole thread once and nest the replies in memory
+        post_id = self.kwargs['post_id']
+        context = self.get_serializer_context()
+        context.update(comment_serializer_context(request, [post_id]))
+        comments = context['comment_threads'].top_level.get(post_id, [])
+        serializer = self.get_serializer(comments, many=True, context=context)
+        return Response(serializer.data)
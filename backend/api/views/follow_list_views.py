@@ -46,6 +46,8 @@ class FollowListView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
+            # Counts and is_following come from one annotated query
+            users = users.with_follow_stats(request.user).select_related('profile')
             serializer = UserSerializer(
                 users, many=True, context={'request': request})
             return Response(serializer.data)
@@ -3,6 +3,7 @@ from drf_yasg.utils import swagger_auto_schema
 from rest_framework.generics import ListCreateAPIView, RetrieveUpdateDestroyAPIView
 from ..models import Likes
 from ..serializers import LikeSerializer
+from ..batching import prefetch_users
 
 
 class LikeListCreateView(ListCreateAPIView):
@@ -12,6 +13,10 @@ class LikeListCreateView(ListCreateAPIView):
     queryset = Likes.objects.select_related('user', 'post', 'comment').all()
     serializer_class = LikeSerializer
 
+    def get_queryset(self):
+        return Likes.objects.select_related('post', 'comment').prefetch_related(
+            prefetch_users('user', self.request.user))
+
     @swagger_auto_schema(
         operation_summary="List all likes",
         operation_description="Retrieve a list of all likes. Each like includes details about the user and the associated post or comment.",
@@ -1,6 +1,7 @@
 from rest_framework.generics import ListAPIView
 from ..models import Posts
 from ..serializers import PostSerializer
+from ..batching import post_serializer_context, prefetch_users
 from rest_framework.response import Response
 from rest_framework import status
 
@@ -12,14 +13,19 @@ class PostListByLocationView(ListAPIView):
         location_name = self.request.query_params.get('name')
 
         if location_name:
-            return Posts.objects.filter(location__name=location_name)
+            return Posts.objects.filter(
+                location__name=location_name
+            ).select_related('location').prefetch_related(
+                prefetch_users('user', self.request.user), 'images')
 
         return Posts.objects.none()
 
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        if not queryset.exists():
+        posts = list(self.get_queryset())
+        if not posts:
             return Response({"message": "No posts found for this location."}, status=status.HTTP_404_NOT_FOUND)
 
-        serializer = self.get_serializer(queryset, many=True)
+        context = self.get_serializer_context()
+        context.update(post_serializer_context(request, posts))
+        serializer = self.get_serializer(posts, many=True, context=context)
         return Response(serializer.data)
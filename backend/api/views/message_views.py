@@ -1,9 +1,11 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
-from django.db.models import Q, Max
-from ..models import Message, Users, Notifications
-from ..serializers import MessageSerializer
+from .. import realtime
+from ..models import Conversation, Message, Users, Notifications
+from ..serializers import ConversationSerializer, MessageSerializer
+from ..notifications import get_unread_count, mark_read
+from ..pagination import InvalidCursor, MAX_PAGE_SIZE, get_page_size, keyset_window
 
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
@@ -12,10 +14,51 @@ from drf_yasg import openapi
 
 class MessageListView(APIView):
     """
-    Fetch messages between the authenticated user and another user.
+    Fetch messages between the authenticated user and another user, one
+    chronological window at a time. Without a cursor the latest messages are
+    returned; `before` scrolls back and `after` catches up on newer ones.
+    Responds with {messages, before, after}.
     """
     permission_classes = [permissions.IsAuthenticated]
 
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                'other_user_id', openapi.IN_QUERY,
+                description="The other participant", type=openapi.TYPE_INTEGER, required=True),
+            openapi.Parameter(
+                'before', openapi.IN_QUERY,
+                description="Cursor returned as `before`: load older messages",
+                type=openapi.TYPE_STRING, required=False),
+            openapi.Parameter(
+                'after', openapi.IN_QUERY,
+                description="Cursor returned as `after`: load newer messages",
+                type=openapi.TYPE_STRING, required=False),
+            openapi.Parameter(
+                'page_size', openapi.IN_QUERY,
+                description=f"Number of messages per window (default 50, max {MAX_PAGE_SIZE})",
+                type=openapi.TYPE_INTEGER, required=False),
+        ],
+        responses={
+            200: openapi.Response(
+                description="A window of messages, oldest first, and the cursors around it",
+                schema=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        'messages': openapi.Schema(
+                            type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT)),
+                        'before': openapi.Schema(
+                            type=openapi.TYPE_STRING, x_nullable=True,
+                            description="Pass as `before` for older messages; null at the start of the conversation"),
+                        'after': openapi.Schema(
+                            type=openapi.TYPE_STRING, x_nullable=True,
+                            description="Pass as `after` for messages newer than this window"),
+                    },
+                ),
+            ),
+            400: "Invalid cursor",
+        },
+    )
     def get(self, request):
         other_user_id = request.query_params.get('other_user_id')
 
@@ -27,18 +70,32 @@ class MessageListView(APIView):
 
         try:
             other_user = Users.objects.get(id=other_user_id)
-        except Users.DoesNotExist:
+        except (Users.DoesNotExist, ValueError):
             print("❌ User not found")
             return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        messages = Message.objects.filter(
-            Q(sender=request.user, receiver=other_user) | Q(sender=other_user, receiver=request.user)
-        ).order_by('timestamp')
+        conversation = Conversation.objects.between(request.user.id, other_user.id)
+        if conversation is None:
+            return Response({"messages": [], "before": None, "after": None}, status=status.HTTP_200_OK)
 
-        print(f"📩 Messages retrieved: {messages.count()}")
+        try:
+            messages, before, after = keyset_window(
+                conversation.messages.all(),
+                before=request.query_params.get('before'),
+                after=request.query_params.get('after'),
+                page_size=get_page_size(request, default=50),
+                time_field='timestamp',
+            )
+        except InvalidCursor:
+            return Response({"error": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
 
-        serializer = MessageSerializer(messages, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        serializer = MessageSerializer(
+            messages, many=True, context={'conversation': conversation})
+        return Response({
+            "messages": serializer.data,
+            "before": before,
+            "after": after,
+        }, status=status.HTTP_200_OK)
 
 
 
@@ -72,14 +129,24 @@ class SendMessageView(APIView):
         except Users.DoesNotExist:
             return Response({"error": "Receiver not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        message = Message.objects.create(sender=request.user, receiver=receiver, content=content, is_read=False)
+        message = Message.objects.create(sender=request.user, receiver=receiver, content=content)
         serializer = MessageSerializer(message)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
+def _publish_read_receipt(conversation, reader, last_read_message_id):
+    """Tell the other participant how far `reader` has read."""
+    realtime.publish(conversation.other_user_id(reader), 'read', {
+        'conversation_id': conversation.id,
+        'reader_id': reader.id,
+        'last_read_message_id': last_read_message_id,
+    })
+
+
 class MarkMessageReadView(APIView):
     """
-    Mark a message as read.
+    Mark a message, and every earlier message in its conversation, as read
+    by moving the user's read watermark.
     """
     permission_classes = [permissions.IsAuthenticated]
 
@@ -97,49 +164,35 @@ class MarkMessageReadView(APIView):
 
     def patch(self, request, message_id):
         try:
-            message = Message.objects.get(id=message_id, receiver=request.user)
-            message.is_read = True
-            message.save()
+            message = Message.objects.select_related('conversation').get(
+                id=message_id, receiver=request.user)
+            conversation = message.conversation
+            if conversation and Conversation.objects.mark_read(
+                    conversation, request.user, up_to=message.id):
+                _publish_read_receipt(conversation, request.user, message.id)
             return Response({"message": "Message marked as read"}, status=status.HTTP_200_OK)
         except Message.DoesNotExist:
             return Response({"error": "Message not found"}, status=status.HTTP_404_NOT_FOUND)
 
-from django.db.models import Q, OuterRef, Subquery
-@classmethod
-def get_latest_messages_per_conversation(cls, user):
-    """
-    Fetch the latest message from each conversation (either sender or receiver is the user).
-    """
-    latest_messages = cls.objects.filter(
-        Q(sender=user) | Q(receiver=user)
-    ).order_by('-timestamp')
-
-    subquery = latest_messages.filter(
-        Q(sender=OuterRef("sender"), receiver=OuterRef("receiver")) |
-        Q(sender=OuterRef("receiver"), receiver=OuterRef("sender"))
-    ).order_by('-timestamp').values('id')[:1]  # Get latest message ID for each pair
-
-    return cls.objects.filter(id__in=Subquery(subquery))
-
 class ConversationsListView(APIView):
     """
-    Fetch a list of users the authenticated user has messaged, showing the latest message with each user.
+    The authenticated user's conversations, most recent activity first, each
+    with its last message and the user's unread count. Reads one row per
+    conversation through the per-participant (user, last_activity_at) indexes;
+    conversations without a message (e.g. a failed first send) are left out.
     """
     permission_classes = [permissions.IsAuthenticated]
 
+    @swagger_auto_schema(responses={200: ConversationSerializer(many=True)})
     def get(self, request):
         try:
             user = request.user
             print(f"📩 Fetching conversations for user: {user.id} ({user.username})")
 
-            latest_messages = Message.get_latest_messages_per_conversation(user)
-
-            if not latest_messages.exists():
-                print("⚠️ No conversations found for this user.")
+            conversations = Conversation.objects.inbox(user)
 
-            print(f"✅ Retrieved {latest_messages.count()} latest messages")
-
-            serializer = MessageSerializer(latest_messages, many=True)
+            serializer = ConversationSerializer(
+                conversations, many=True, context={'request': request})
             return Response(serializer.data, status=status.HTTP_200_OK)
 
         except Exception as e:
@@ -165,56 +218,26 @@ class MarkConversationReadView(APIView):
             print("🔐 Request user:", request.user, request.user.id)
             print("👥 Other user:", other_user, other_user.id)
 
-            # Get all notifications first
-            all_notifications = Notifications.objects.filter(
-                recipient=current_user,
-                is_read=False
-            )
-            print(f"✅ Found {all_notifications.count()} notifications")
-
-            # ✅ Step 1: Get all unread messages from other_user → current_user
-            unread_messages = Message.objects.filter(
-                sender=other_user,
-                receiver=current_user,
-                is_read=False
-            )
-
-            print("🔍 Matching messages count:", unread_messages.count())
-
-            # ✅ Get the IDs before update
-            message_ids = list(unread_messages.values_list('id', flat=True))
-
-            # ✅ Step 2: Mark messages as read
-            marked_messages = unread_messages.update(is_read=True)
-
-            # ✅ Step 3: Mark notifications as read based on those message IDs
-            # FIXED: Changed message_id__in to message__in to match the field name
-            marked_notifications = Notifications.objects.filter(
-                recipient=current_user,
+            # ✅ Step 1: Move the read watermark to the last message (one row)
+            marked_messages = 0
+            conversation = Conversation.objects.between(current_user.id, other_user.id)
+            if conversation is not None:
+                marked_messages = conversation.unread_count_for(current_user)
+                Conversation.objects.mark_read(conversation, current_user)
+                if marked_messages:
+                    conversation.refresh_from_db()
+                    _publish_read_receipt(
+                        conversation, current_user,
+                        conversation.last_read_message_id_for(current_user.id))
+
+            # ✅ Step 2: Mark this sender's message notifications as read
+            marked_notifications = mark_read(current_user, Notifications.objects.filter(
                 sender=other_user,
                 notification_type='message',
-                message__in=message_ids,  # FIXED: Changed from message_id__in to message__in
-                is_read=False
-            ).update(is_read=True)
-
-            # If no messages were found but we know there are message notifications,
-            # try to mark those notifications as read
-            if marked_messages == 0 and marked_notifications == 0:
-                # Directly mark message notifications from this sender as read
-                marked_notifications = Notifications.objects.filter(
-                    recipient=current_user,
-                    sender=other_user,
-                    notification_type='message',
-                    is_read=False
-                ).update(is_read=True)
-                
-                print(f"📝 Updated {marked_notifications} notifications directly")
-
-            # ✅ Step 4: Return updated unread notification count
-            unread_count = Notifications.objects.filter(
-                recipient=current_user,
-                is_read=False
-            ).count()
+            ))
+
+            # ✅ Step 3: Return updated unread notification count
+            unread_count = get_unread_count(current_user)
 
             return Response({
                 "marked_messages": marked_messages,
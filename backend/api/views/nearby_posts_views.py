@@ -3,13 +3,26 @@ from rest_framework.response import Response
 from rest_framework import status
 from ..models import Posts
 from ..serializers import PostSerializer
-from django.db.models import F, FloatField
-from django.db.models.functions import Power, Sqrt
-from math import cos, radians
+from ..batching import post_serializer_context, prefetch_users
+from ..filters import filter_posts
+from django.contrib.gis.db.models import PointField
+from django.contrib.gis.geos import Point
+from django.contrib.gis.measure import D
+from django.db.models import FloatField
 
-import re  # regular expressions
 from django.db.models import Func, F, Value
 
+
+class KNNDistance(Func):
+    """
+    PostGIS `<->` operator. Used in ORDER BY with a LIMIT it lets the GiST
+    index on Location.point return the nearest rows first (KNN search).
+    """
+    arg_joiner = ' <-> '
+    template = '%(expressions)s'
+    output_field = FloatField()
+
+
 class NearbyPostsView(APIView):
     def get(self, request):
         try:
@@ -23,56 +36,25 @@ class NearbyPostsView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        travel_types = request.query_params.get('travel_types', '').split(',')
-        periods = request.query_params.get('periods', '').split(',')
-
-        # Preprocess travel types and periods to remove spaces, special characters, and trim
-        def preprocess_filter_values(values):
-            processed = []
-            for value in values:
-                value = re.sub(r'[^\w]', '', value)  # Remove non-alphanumeric characters
-                value = value.strip().lower()  # Trim and convert to lowercase
-                if value:  # Add only if not empty
-                    processed.append(value)
-            return processed
-
-        travel_types = preprocess_filter_values(travel_types)
-        periods = preprocess_filter_values(periods)
-
-        lat_km = 111.32
-        lng_km = 111.32 * cos(radians(latitude))
+        center = Point(longitude, latitude, srid=4326)
 
-        nearby_posts = Posts.objects.annotate(
-            distance=Sqrt(
-                Power((F('location__latitude') - latitude) * lat_km, 2, output_field=FloatField()) +
-                Power((F('location__longitude') - longitude)
-                      * lng_km, 2, output_field=FloatField()),
-                output_field=FloatField()
-            )
-        ).filter(
-            distance__lte=radius,
-            parent_post__isnull=True
-        )
-
-        # Normalize category dynamically using annotate
-        nearby_posts = nearby_posts.annotate(
-            normalized_category=Func(F('category'), function='LOWER')
-        ).annotate(
-            normalized_category=Func(F('normalized_category'), Value(' '), Value(''), function='REPLACE')
+        # ST_DWithin on geography: an index range scan on Location.point
+        nearby_posts = Posts.objects.filter(
+            location__point__dwithin=(center, D(km=radius)),
+            parent_post__isnull=True,
+            status='published'
         )
+        nearby_posts = filter_posts(nearby_posts, request)
 
-        # Filter by travel types if provided
-        if travel_types:
-            nearby_posts = nearby_posts.filter(normalized_category__in=travel_types)
-
-        # Filter by periods if provided
-        if periods:
-            nearby_posts = nearby_posts.filter(period__in=periods)
-
-        nearby_posts = nearby_posts.order_by('distance')[:limit]
+        nearby_posts = list(nearby_posts.select_related('location').prefetch_related(
+            prefetch_users('user', request.user), 'images').order_by(
+                KNNDistance(
+                    F('location__point'),
+                    Value(center, output_field=PointField(geography=True, srid=4326)),
+                ))[:limit])
 
         serializer = PostSerializer(
-            nearby_posts, many=True, context={'request': request})
+            nearby_posts, many=True, context=post_serializer_context(request, nearby_posts))
 
         return Response({
             'posts': serializer.data,
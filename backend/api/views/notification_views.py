@@ -3,44 +3,66 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
 from ..models import Notifications
 from ..serializers import NotificationSerializer
+from ..notifications import get_unread_count, mark_read, with_feed_relations
+from ..pagination import InvalidCursor, MAX_PAGE_SIZE, get_page_size, keyset_paginate
 
 
 class NotificationListView(APIView):
+    """
+    The authenticated user's notifications, newest first, one cursor page at a
+    time. Pages are index range scans on (recipient, created_at, id); with
+    `unread=true` they use the partial index over unread rows.
+    """
     permission_classes = [IsAuthenticated]
 
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                'cursor', openapi.IN_QUERY,
+                description="Opaque cursor returned as `next` by the previous page",
+                type=openapi.TYPE_STRING, required=False),
+            openapi.Parameter(
+                'page_size', openapi.IN_QUERY,
+                description=f"Number of notifications per page (default 50, max {MAX_PAGE_SIZE})",
+                type=openapi.TYPE_INTEGER, required=False),
+            openapi.Parameter(
+                'unread', openapi.IN_QUERY,
+                description="Only return unread notifications",
+                type=openapi.TYPE_BOOLEAN, required=False),
+        ],
+        responses={200: NotificationSerializer(many=True), 400: "Invalid cursor"},
+    )
     def get(self, request):
-        print(f"🔍 Notification Request by User: {request.user.username}")
-        print(f"🔐 Current Auth Token: {request.auth}")  # Debug token
         try:
-            notifications = Notifications.objects.filter(
-                recipient=request.user
-            ).select_related(
-                'sender',
-                'post',
-                'comment',
-                'message',
-            ).order_by("-created_at")[:50]  # Limit to last 50 notifications
+            notifications = with_feed_relations(
+                Notifications.objects.filter(recipient=request.user))
+            if request.query_params.get('unread') == 'true':
+                notifications = notifications.filter(is_read=False)
 
-            print(f"✅ Found {notifications.count()} notifications")
+            page, next_cursor = keyset_paginate(
+                notifications,
+                cursor=request.query_params.get('cursor'),
+                page_size=get_page_size(request, default=50),
+            )
 
             serializer = NotificationSerializer(
-                notifications,
+                page,
                 many=True,
                 context={'request': request}
             )
 
-            # Get count of unread notifications
-            unread_count = Notifications.objects.filter(
-                recipient=request.user,
-                is_read=False
-            ).count()
-
             return Response({
                 'notifications': serializer.data,
-                'unread_count': unread_count
+                'next': next_cursor,
+                # Denormalized counter, loaded with request.user
+                'unread_count': request.user.unread_notifications_count
             })
+        except InvalidCursor:
+            return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             print(f"❌ Error in NotificationListView: {e}")
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -60,21 +82,15 @@ class NotificationMarkReadView(APIView):
         print(f"📋 DEBUG: Request data: notification_ids={notification_ids}, mark_all={mark_all}")
         
         # Check initial state
-        initial_unread = Notifications.objects.filter(recipient=request.user, is_read=False)
-        initial_unread_count = initial_unread.count()
+        initial_unread_count = request.user.unread_notifications_count
         print(f"📊 DEBUG: Initial unread count: {initial_unread_count}")
-        
-        if initial_unread_count > 0:
-            print(f"💡 DEBUG: Unread notification IDs before update: {list(initial_unread.values_list('id', flat=True))}")
-        
+
         affected_rows = 0
         
         if mark_all:
             # Mark all notifications as read
-            affected_rows = Notifications.objects.filter(
-                recipient=request.user,
-                is_read=False
-            ).update(is_read=True)
+            affected_rows = mark_read(
+                request.user, Notifications.objects.all())
             print(f"🔄 DEBUG: Marked ALL as read. Affected rows: {affected_rows}")
         elif notification_ids:
             # Check if notifications exist and belong to user before marking
@@ -101,20 +117,13 @@ class NotificationMarkReadView(APIView):
                 print(f"📝 DEBUG: These notifications were already marked as read: {already_read}")
             
             # Mark specific notifications as read
-            affected_rows = Notifications.objects.filter(
-                recipient=request.user,
-                id__in=valid_ids,
-                is_read=False
-            ).update(is_read=True)
+            affected_rows = mark_read(
+                request.user, Notifications.objects.filter(id__in=valid_ids))
             print(f"🔄 DEBUG: Marked specific notifications as read. Affected rows: {affected_rows}")
 
-        # Double-check the current state after update
-        final_unread = Notifications.objects.filter(recipient=request.user, is_read=False)
-        unread_count = final_unread.count()
-        
-        if unread_count > 0:
-            print(f"🔍 DEBUG: Remaining unread notification IDs: {list(final_unread.values_list('id', flat=True))}")
-        
+        # Current state after update
+        unread_count = get_unread_count(request.user)
+
         success = initial_unread_count != unread_count or affected_rows > 0
         print(f"{'✅' if success else '❌'} DEBUG: Mark read operation {'successful' if success else 'had no effect'}. Currently unread: {unread_count}")
 
@@ -130,4 +139,16 @@ class NotificationMarkReadView(APIView):
                 'initial_unread': initial_unread_count,
                 'final_unread': unread_count
             }
-        })
\ No newline at end of file
+        })
+
+
+class NotificationUnreadCountView(APIView):
+    """
+    Cheap endpoint for clients to poll the unread badge.
+    Reads the denormalized Users.unread_notifications_count, so it costs no
+    query beyond authentication.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response({'unread_count': request.user.unread_notifications_count})
@@ -1,11 +1,9 @@
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
-import re  # regular expressions
 from django.shortcuts import get_object_or_404
 import logging
 import json
-from django.db.models import Func, F, Value
 
 # Serializer
 from ..serializers import PostSerializer
@@ -22,7 +20,11 @@ from rest_framework.generics import ListCreateAPIView, RetrieveUpdateDestroyAPIV
 
 # Always import new models
 from ..models import Location, PostImages, Posts, Likes, Comments, Collects, CollectionFolders
-from ..tasks import upload_post_image
+from ..tasks import process_post_images
+from ..uploads import stage
+from ..batching import post_serializer_context, prefetch_users
+from ..filters import filter_posts
+from ..pagination import InvalidCursor, MAX_PAGE_SIZE, get_page_size, keyset_paginate
 
 from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
@@ -63,8 +65,12 @@ class PostListCreateView(APIView):
             - 401: Unauthorized
     get(request)
         Retrieve a list of all posts ordered by creation date.
+        Parameters:
+            - cursor (str): Cursor of the page to fetch (optional)
+            - page_size (int): Posts per page, enables cursor mode (optional)
         Responses:
-            - 200: List of posts
+            - 200: List of posts, or {posts, next} in cursor mode
+            - 400: Invalid cursor
             - 401: Unauthorized
     """
     parser_classes = (MultiPartParser, FormParser, JSONParser)
@@ -147,14 +153,11 @@ class PostListCreateView(APIView):
             # Handle image uploads
             images = request.FILES.getlist('image')
             print(f"📸 Received {len(images)} images for post {parent_post.id}")
-            # Replace your image upload section with this
-            for image in images:
-                    upload_post_image.delay(
-                        parent_post.id,
-                        image.read(),
-                        image.name,
-                        is_child=False
-                    )
+            # Images of the post and its day posts are processed as one chord
+            image_jobs = [
+                (parent_post.id, stage(image))
+                for image in images
+            ]
             # Handle multi-day child posts
             if is_multi_day:
                 print("🔄 Processing multi-day child posts...")
@@ -246,14 +249,10 @@ class PostListCreateView(APIView):
                     print(f"📸 Received {len(child_images)} images for child post {child_post.id}")
 
                     if child_images:
-                        for image in child_images:
-                            
-                            upload_post_image.delay(
-                                child_post.id,
-                                image.read(),
-                                image.name,
-                                is_child=True
-                            )
+                        image_jobs.extend(
+                            (child_post.id, stage(image))
+                            for image in child_images
+                        )
                     else:
                         print(f"❌ No images found for child post {child_post.id}")
 
@@ -275,6 +274,10 @@ class PostListCreateView(APIView):
                         - Image Count: {len(child_images)}
                     """)
 
+            process_post_images(parent_post.id, image_jobs)
+            if image_jobs:
+                parent_post.media_status = 'pending'
+
             # Return the created post with all its data
             serializer = PostSerializer(
                 parent_post, context={'request': request})
@@ -307,7 +310,8 @@ class PostListCreateView(APIView):
 
     @swagger_auto_schema(
         operation_summary="List all posts",
-        operation_description="Retrieve a list of all posts ordered by creation date",
+        operation_description="Retrieve a list of all posts ordered by creation date. "
+        "Pass `cursor` or `page_size` to get one page at a time together with a `next` cursor.",
         manual_parameters=[
             openapi.Parameter(
                 'category',
@@ -323,66 +327,57 @@ class PostListCreateView(APIView):
                 type=openapi.TYPE_STRING,
                 required=False
             ),
+            openapi.Parameter(
+                'cursor',
+                openapi.IN_QUERY,
+                description="Opaque cursor returned as `next` by the previous page",
+                type=openapi.TYPE_STRING,
+                required=False
+            ),
+            openapi.Parameter(
+                'page_size',
+                openapi.IN_QUERY,
+                description=f"Number of posts per page (max {MAX_PAGE_SIZE})",
+                type=openapi.TYPE_INTEGER,
+                required=False
+            ),
         ],
         responses={
             200: PostSerializer(many=True),
+            400: "Invalid cursor",
             401: "Unauthorized"
         }
     )
     def get(self, request):
-        travel_types = request.query_params.get('travel_types', '').split(',')
-        periods = request.query_params.get('periods', '').split(',')
-
-       # Preprocess travel types and periods to remove spaces, special characters, and trim
-        def preprocess_filter_values(values):
-            processed = []
-            for value in values:
-                # Remove non-alphanumeric characters
-                value = re.sub(r'[^\w]', '', value)
-                value = value.strip().lower()  # Trim and convert to lowercase
-                if value:  # Add only if not empty
-                    processed.append(value)
-            return processed
-
-        travel_types = preprocess_filter_values(travel_types)
-        periods = preprocess_filter_values(periods)
-
-       # Debugging: Log the preprocessed values
-        print("Processed Travel Types:", travel_types)
-        print("Processed Periods:", periods)
-
-        posts = Posts.objects.all().filter(
-            parent_post__isnull=True).order_by('-created_at')
-
-        # Normalize category dynamically using annotate
-        posts = posts.annotate(
-            normalized_category=Func(F('category'), function='LOWER')
-        ).annotate(
-            normalized_category=Func(F('normalized_category'), Value(' '), Value(''), function='REPLACE')
-        )
-
-        for post in posts:
-            print(f"Post ID: {post.id}, Travel Type: {post.category}")
-
-        # Filter by travel types if provided
-        if travel_types:
-            posts = posts.filter(normalized_category__in=travel_types)
-            print("Posts after Travel Types Filter:",
-                  posts.count())  # Debugging
+        # Published top-level posts, filtered on the stored normalized_category
+        # so the partial posts_feed_filter_idx index can serve the query
+        posts = filter_posts(
+            Posts.objects.filter(parent_post__isnull=True, status='published'),
+            request,
+        ).select_related('location').prefetch_related(
+            prefetch_users('user', request.user), 'images')
+
+        # Cursor mode: serve one bounded page keyed on (created_at, id)
+        if 'cursor' in request.query_params or 'page_size' in request.query_params:
+            try:
+                page, next_cursor = keyset_paginate(
+                    posts,
+                    cursor=request.query_params.get('cursor'),
+                    page_size=get_page_size(request),
+                )
+            except InvalidCursor:
+                return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Filter by periods if provided
-        if periods:
-            posts = posts.filter(period__in=periods)
-            print("Posts after Periods Filter:", posts.count())  # Debugging
+            serializer = PostSerializer(
+                page, many=True, context=post_serializer_context(request, page))
+            return Response({
+                'posts': serializer.data,
+                'next': next_cursor,
+            })
 
+        posts = list(posts.order_by('-created_at', '-id'))
         serializer = PostSerializer(
-            posts, many=True, context={'request': request})
-
-        # ✅ Debug: Ensure `childPosts` are included in response
-        for post in serializer.data:
-            print(f"🔍 Post {post['id']} has {
-                  len(post['childPosts'])} child posts")
-
+            posts, many=True, context=post_serializer_context(request, posts))
         return Response(serializer.data)
 
 
@@ -419,16 +414,18 @@ class PostDetailView(RetrieveUpdateDestroyAPIView):
 
         print(f"🔍 Fetching Post ID: {post.id}, Period: {post.period}")
 
-        serializer = self.get_serializer(post)
+        # Batch likes/saves for the post and its day posts
+        context = post_serializer_context(request, [post])
+        serializer = self.get_serializer(post, context=context)
         data = serializer.data
 
         # If the post is a multi-day post, include child_posts in the response
         if post.period == 'multipleday':
-            child_posts = Posts.objects.filter(parent_post=post).order_by('id')
-            print("✅ Retrieved Child Posts:", list(
-                child_posts.values()))  # Print child posts
+            child_posts = Posts.objects.filter(parent_post=post).select_related(
+                'location').prefetch_related(
+                    prefetch_users('user', request.user), 'images').order_by('id')
             child_posts_serializer = PostSerializer(
-                child_posts, many=True, context=self.get_serializer_context()
+                child_posts, many=True, context=context
             )
             # serializer = self.get_serializer(post)
             # data = serializer.data
@@ -437,7 +434,7 @@ class PostDetailView(RetrieveUpdateDestroyAPIView):
             return Response(data, status=status.HTTP_200_OK)
 
         # For single-day posts, return the standard serialized data
-        return super().get(request, *args, **kwargs)
+        return Response(data, status=status.HTTP_200_OK)
 
     @swagger_auto_schema(
         operation_summary="Update a post",
@@ -488,7 +485,9 @@ class ToggleLikeView(APIView):
                     is_liked = False
                 else:
                     is_liked = True
-                likes_count = post.post_likes.count()
+                # Counter is maintained by the Likes signals
+                post.refresh_from_db(fields=['likes_count'])
+                likes_count = post.likes_count
             except Posts.DoesNotExist:
                 return Response({"error": "Post not found"}, status=404)
 
@@ -502,7 +501,8 @@ class ToggleLikeView(APIView):
                     is_liked = False
                 else:
                     is_liked = True
-                likes_count = comment.comment_likes.count()
+                comment.refresh_from_db(fields=['likes_count'])
+                likes_count = comment.likes_count
             except Comments.DoesNotExist:
                 return Response({"error": "Comment not found"}, status=404)
         else:
@@ -524,7 +524,7 @@ class ToggleSaveView(APIView):
             - Checks if the post is already saved in the specified folder.
             - If the post is already saved, it unsaves (deletes) the collect.
             - If the post is not saved, it saves (creates) the collect.
-            - Counts the total number of users who have saved this post.
+            - Reads the post's denormalized saves counter.
             - Returns a response with the save status and the total number of saves.
     """
     permission_classes = [IsAuthenticated]
@@ -559,10 +559,32 @@ class ToggleSaveView(APIView):
             Collects.objects.create(user=user, post=post, folder=folder)
             is_saved = True
 
-        # Count the total number of users who have saved this post
-        saves_count = Collects.objects.filter(post=post).count()
+        # Read the saves counter maintained by the Collects signals
+        post.refresh_from_db(fields=['saves_count'])
+        saves_count = post.saves_count
 
         return Response(
             {"is_saved": is_saved, "saves_count": saves_count},
             status=status.HTTP_200_OK
         )
+
+
+class PostMediaStatusView(APIView):
+    """
+    Reports how far a post's image processing has got, for clients without
+    the realtime stream (which sends a `post_media` event when it finishes).
+    """
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_summary="Post media status",
+        operation_description="Returns 'pending', 'partial', 'ready' or 'failed' for the post's images "
+                              "(across all day posts of a multi-day trip).",
+        responses={200: openapi.Response(description="Media status of the post"),
+                   404: "Post not found"},
+    )
+    def get(self, request, pk):
+        media_status = Posts.objects.filter(id=pk).values_list('media_status', flat=True).first()
+        if media_status is None:
+            return Response({"error": "Post not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'id': pk, 'media_status': media_status}, status=status.HTTP_200_OK)
@@ -0,0 +1,91 @@
+# realtime_views.py
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from ..models import Users
+from ..realtime import get_broker, issue_ticket, redeem_ticket
+
+
+def _authenticate(request):
+    """
+    Resolve the user from a Bearer header or, since browser EventSource
+    cannot set headers, from a `ticket` issued by RealtimeTicketView. Raw
+    JWTs are not accepted in the query string, where they would be logged.
+    """
+    ticket = request.GET.get('ticket')
+    if ticket:
+        user_id = redeem_ticket(ticket)
+        return Users.objects.filter(id=user_id, is_active=True).first() if user_id else None
+
+    auth = JWTAuthentication()
+    header = auth.get_header(request)
+    raw_token = auth.get_raw_token(header) if header else None
+    if not raw_token:
+        return None
+    try:
+        return auth.get_user(auth.get_validated_token(raw_token))
+    except (InvalidToken, TokenError):
+        return None
+
+
+class RealtimeTicketView(APIView):
+    """
+    Exchanges the caller's JWT for a stream ticket, valid for
+    REALTIME_TICKET_TTL seconds, to open realtime/stream/?ticket=<ticket>.
+    """
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_summary="Issue a realtime stream ticket",
+        responses={200: openapi.Response(description="{ticket, expires_in}")},
+    )
+    def post(self, request):
+        return Response({'ticket': issue_ticket(request.user.id),
+                         'expires_in': settings.REALTIME_TICKET_TTL}, status=status.HTTP_200_OK)
+
+
+class RealtimeStreamView(View):
+    """
+    Server-sent event stream of the authenticated user's new notifications
+    (`event: notification`) and messages (`event: message`), replacing
+    polling of notifications/ and messages/. A comment line is sent every
+    REALTIME_HEARTBEAT seconds to keep proxies from closing the connection.
+
+    Must be served by an ASGI server (see backend/asgi.py); under WSGI each
+    open stream would hold a worker.
+    """
+
+    async def get(self, request):
+        user = await sync_to_async(_authenticate)(request)
+        if user is None:
+            return JsonResponse({'error': 'Authentication credentials were not provided or are invalid'},
+                                status=401)
+
+        response = StreamingHttpResponse(
+            self.stream(user.id), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # Disable nginx buffering
+        return response
+
+    @staticmethod
+    async def stream(user_id):
+        yield 'retry: 5000\n\n'
+        async for event in get_broker().subscribe(user_id, settings.REALTIME_HEARTBEAT):
+            if event is None:
+                yield ': keep-alive\n\n'
+                continue
+            data = json.dumps(event['data'], cls=DjangoJSONEncoder)
+            yield f"event: {event['type']}\ndata: {data}\n\n"
@@ -16,9 +16,6 @@ class RegisterDevice(APIView):
             return Response({"error": "Token is required"}, status=400)
 
         try:
-            # Clean up any invalid tokens first
-            DeviceManager.clean_invalid_tokens(user)
-
             # Register new token
             success, message = DeviceManager.register_device(user, token)
 
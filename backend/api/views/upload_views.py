@@ -0,0 +1,113 @@
+from django.conf import settings
+from django.shortcuts import get_object_or_404
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .. import uploads
+from ..images import DECODABLE_CONTENT_TYPES
+from ..models import Posts
+from ..tasks import process_post_images
+
+
+def _claim_all(refs, user):
+    """Claim every ref for `user`, or return an error Response for the first bad one."""
+    if not isinstance(refs, list) or not refs or not all(isinstance(ref, str) for ref in refs):
+        return None, Response({'error': 'refs must be a non-empty list of upload references'},
+                              status=status.HTTP_400_BAD_REQUEST)
+    try:
+        return [uploads.claim(ref, user.id) for ref in refs], None
+    except ValueError as e:
+        return None, Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class PresignUploadView(APIView):
+    """
+    Issue presigned PUT URLs so clients upload images straight to object
+    storage instead of through request.FILES. Each returned `ref` is later
+    passed to PostImagesCompleteView, or as `image_ref` when creating a
+    comment.
+    """
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_summary="Presign image uploads",
+        operation_description="Returns one presigned PUT URL per file. Upload each file with the "
+                              "given method and headers, then report the refs as complete.",
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            required=['files'],
+            properties={
+                'files': openapi.Schema(
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Schema(
+                        type=openapi.TYPE_OBJECT,
+                        properties={
+                            'name': openapi.Schema(type=openapi.TYPE_STRING),
+                            'content_type': openapi.Schema(type=openapi.TYPE_STRING, example='image/jpeg'),
+                        },
+                    ),
+                ),
+            },
+        ),
+        responses={200: "List of {ref, url, method, headers}", 400: "Invalid files"},
+    )
+    def post(self, request):
+        if not settings.UPLOAD_DIRECT:
+            return Response({'error': 'Direct uploads are disabled'}, status=status.HTTP_404_NOT_FOUND)
+
+        files = request.data.get('files')
+        if not isinstance(files, list) or not files:
+            return Response({'error': 'files must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(files) > settings.UPLOAD_MAX_FILES:
+            return Response({'error': f'At most {settings.UPLOAD_MAX_FILES} files per request'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        presigned = []
+        for file in files:
+            content_type = file.get('content_type') if isinstance(file, dict) else None
+            if content_type not in DECODABLE_CONTENT_TYPES:
+                return Response({'error': f"Supported image types: {', '.join(sorted(DECODABLE_CONTENT_TYPES))}"},
+                                status=status.HTTP_400_BAD_REQUEST)
+            presigned.append(uploads.presign(request.user.id, file.get('name'), content_type))
+
+        return Response({'uploads': presigned, 'expires_in': settings.UPLOAD_PRESIGN_EXPIRES},
+                        status=status.HTTP_200_OK)
+
+
+class PostImagesCompleteView(APIView):
+    """
+    Completion callback for direct uploads to a post (or one day of a
+    multi-day post): queues variant generation for the uploaded refs.
+    Progress is reported through the post's media_status.
+    """
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_summary="Complete post image uploads",
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            required=['refs'],
+            properties={
+                'refs': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_STRING)),
+            },
+        ),
+        responses={202: "Processing queued", 400: "Invalid refs", 403: "Not the post's author",
+                   404: "Post not found"},
+    )
+    def post(self, request, pk):
+        post = get_object_or_404(Posts, pk=pk)
+        if post.user_id != request.user.id:
+            return Response({'error': 'You can only add images to your own posts'},
+                            status=status.HTTP_403_FORBIDDEN)
+
+        refs, error = _claim_all(request.data.get('refs'), request.user)
+        if error:
+            return error
+
+        process_post_images(post.id, [(post.id, ref) for ref in refs])
+        return Response({'id': post.id, 'media_status': 'pending'}, status=status.HTTP_202_ACCEPTED)
+
@@ -25,7 +25,8 @@ class UserFollowingListView(APIView):
 
     def get(self, request, user_id):
         user = get_object_or_404(Users, id=user_id)
-        following = user.following.all()
+        following = user.following.with_follow_stats(
+            request.user).select_related('profile')
         serializer = UserSerializer(
             following, many=True, context={'request': request})
         return Response(serializer.data)
@@ -45,7 +46,8 @@ class UserFollowersListView(APIView):
 
     def get(self, request, user_id):
         user = get_object_or_404(Users, id=user_id)
-        followers = user.followers_set.all()
+        followers = user.followers_set.with_follow_stats(
+            request.user).select_related('profile')
         serializer = UserSerializer(
             followers, many=True, context={'request': request})
         return Response(serializer.data)
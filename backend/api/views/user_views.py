@@ -26,6 +26,10 @@ class UserListCreateView(ListCreateAPIView):
     queryset = Users.objects.all()
     serializer_class = UserSerializer
 
+    def get_queryset(self):
+        return Users.objects.with_follow_stats(
+            self.request.user).select_related('profile')
+
     @swagger_auto_schema(
         operation_summary="List all users",
         operation_description="Retrieve a list of all registered users.",
@@ -49,6 +53,10 @@ class UserDetailView(RetrieveUpdateDestroyAPIView):
     queryset = Users.objects.all()
     serializer_class = UserSerializer
 
+    def get_queryset(self):
+        return Users.objects.with_follow_stats(
+            self.request.user).select_related('profile')
+
     @swagger_auto_schema(
         operation_summary="Retrieve a user",
         operation_description="Retrieve details of a specific user by ID.",
@@ -3,6 +3,11 @@ ASGI config for backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve the project through this module (e.g. ``uvicorn backend.asgi:application``
+or gunicorn with ``-k uvicorn.workers.UvicornWorker``) so the long-lived
+server-sent event streams at ``/api/realtime/stream/`` run on the event loop
+instead of each occupying a WSGI worker.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 from pathlib import Path
 import os
 import environ
+from celery.schedules import crontab
 
 #
 from datetime import timedelta
@@ -272,6 +273,12 @@ else:
 # Add this line after FIREBASE_CREDENTIALS_PATH
 FIREBASE_SERVICE_ACCOUNT_KEY = FIREBASE_CREDENTIALS_PATH
 
+# Push transport used by FirebaseManager. Point FCM_TRANSPORT at
+# api.firebase_utils.HTTPTransport and FCM_ENDPOINT at a fake FCM server
+# to exercise pushes locally.
+FCM_TRANSPORT = env('FCM_TRANSPORT', default='api.firebase_utils.FirebaseAdminTransport')
+FCM_ENDPOINT = env('FCM_ENDPOINT', default='')
+
 ######### debug 
 LOGGING = {
     'version': 1,
@@ -335,5 +342,93 @@ STORAGES = {
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
+CELERY_TASK_ALWAYS_EAGER = env.bool('CELERY_TASK_ALWAYS_EAGER', default=False)
+CELERY_RESULT_SERIALIZER = 'json'
+# Chords (api.tasks.process_post_images) need somewhere to collect results
+CELERY_RESULT_BACKEND = env('CELERY_RESULT_BACKEND', default=CELERY_BROKER_URL)
+CELERY_RESULT_EXPIRES = 3600
+
+CELERY_BEAT_SCHEDULE = {
+    'prune-device-tokens': {
+        'task': 'api.tasks.prune_device_tokens',
+        'schedule': crontab(hour=3, minute=0),
+    },
+    'purge-staged-uploads': {
+        'task': 'api.tasks.purge_staged_uploads',
+        'schedule': crontab(minute=30),
+    },
+    'purge-orphaned-images': {
+        'task': 'api.tasks.purge_orphaned_images',
+        'schedule': crontab(hour=4, minute=0),
+    },
+}
+
+# S3 client shared per process (api/s3.py). Set AWS_S3_ENDPOINT_URL to use a
+# local S3-compatible server such as MinIO or moto_server
+AWS_S3_ENDPOINT_URL = env('AWS_S3_ENDPOINT_URL', default=None)
+AWS_S3_REGION_NAME = env('AWS_S3_REGION_NAME', default='us-east-1')
+S3_MAX_POOL_CONNECTIONS = env.int('S3_MAX_POOL_CONNECTIONS', default=20)
+
+# Image variants (api/images.py): every upload is stored at each width below
+# that is narrower than the image, plus the image itself capped at
+# IMAGE_MAX_WIDTH, in each format
+MEDIA_BUCKET_NAME = env('AWS_STORAGE_BUCKET_NAME', default='travelmingle-media')
+IMAGE_VARIANT_WIDTHS = [320, 640, 1024]
+IMAGE_MAX_WIDTH = env.int('IMAGE_MAX_WIDTH', default=1600)
+IMAGE_VARIANT_FORMATS = ['jpeg', 'webp']
+IMAGE_QUALITY = {'jpeg': 80, 'webp': 75}
+# Width of the inline blurred preview returned with each post image
+IMAGE_PLACEHOLDER_WIDTH = 32
+# Deduplicated image assets no post uses any more are deleted once they have
+# gone this long without being uploaded again
+IMAGE_ORPHAN_GRACE = env.int('IMAGE_ORPHAN_GRACE', default=24 * 3600)  # seconds
+
+# Uploaded images are staged here and only a reference goes through the
+# broker. 'local' needs UPLOAD_SPOOL_DIR on a volume shared with the Celery
+# workers; 's3' stages under UPLOAD_STAGING_PREFIX in UPLOAD_STAGING_BUCKET
+UPLOAD_STAGING = env('UPLOAD_STAGING', default='local')
+UPLOAD_SPOOL_DIR = env('UPLOAD_SPOOL_DIR', default=os.path.join(BASE_DIR, 'spool', 'uploads'))
+UPLOAD_STAGING_BUCKET = env('UPLOAD_STAGING_BUCKET', default='travelmingle-media')
+UPLOAD_STAGING_PREFIX = env('UPLOAD_STAGING_PREFIX', default='staging/')
+UPLOAD_STAGING_MAX_AGE = env.int('UPLOAD_STAGING_MAX_AGE', default=6 * 3600)  # seconds
+
+# Direct uploads: clients PUT images straight to UPLOAD_STAGING_BUCKET through
+# presigned URLs (uploads/presign/) and then report them complete
+UPLOAD_DIRECT = env.bool('UPLOAD_DIRECT', default=True)
+UPLOAD_PRESIGN_EXPIRES = env.int('UPLOAD_PRESIGN_EXPIRES', default=15 * 60)  # seconds
+UPLOAD_MAX_BYTES = env.int('UPLOAD_MAX_BYTES', default=20 * 1024 * 1024)
+UPLOAD_MAX_FILES = env.int('UPLOAD_MAX_FILES', default=20)
+
+# Realtime streams (api/realtime.py). Notifications and post media events are
+# published by Celery workers, so they need RedisBroker to reach the ASGI
+# processes serving streams. InProcessBroker only reaches clients of the
+# publishing process, which is enough when tasks run eagerly
+REALTIME_BROKER = env(
+    'REALTIME_BROKER',
+    default='api.realtime.InProcessBroker' if CELERY_TASK_ALWAYS_EAGER else 'api.realtime.RedisBroker')
+REALTIME_REDIS_URL = env('REALTIME_REDIS_URL', default=CELERY_BROKER_URL)
+REALTIME_HEARTBEAT = env.int('REALTIME_HEARTBEAT', default=15)  # seconds
+# Lifetime of the signed tickets browsers pass to realtime/stream/ (realtime/ticket/)
+REALTIME_TICKET_TTL = env.int('REALTIME_TICKET_TTL', default=60)  # seconds
+
+# Home timeline: number of posts kept per user in the materialized feed
+HOME_TIMELINE_DEPTH = env.int('HOME_TIMELINE_DEPTH', default=500)
+
+# Notifications: likes/collects/follows are merged into one unread row per
+# post within this window, and its push is sent at most once per cooldown
+NOTIFICATION_COALESCE_WINDOW = timedelta(
+    hours=env.int('NOTIFICATION_COALESCE_HOURS', default=24))
+NOTIFICATION_PUSH_COOLDOWN = env.int('NOTIFICATION_PUSH_COOLDOWN', default=300)  # seconds
+
+# Shared cache (push rate limits); use a redis:// CACHE_URL when running
+# several Celery workers so they see the same limits
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
+# Device tokens: pruned after this many consecutive push failures, or when no
+# push has succeeded for this many days (FCM expires tokens after 270 days)
+DEVICE_MAX_FAILURES = env.int('DEVICE_MAX_FAILURES', default=5)
+DEVICE_TOKEN_STALE_DAYS = env.int('DEVICE_TOKEN_STALE_DAYS', default=270)
 
 
@@ -26,3 +26,23 @@ class Message {
     );
   }
 }
+
+/// One window of a conversation, oldest message first, with the cursors
+/// for loading older (`before`) and newer (`after`) messages.
+class MessageWindow {
+  final List<Message> messages;
+  final String? before;
+  final String? after;
+
+  MessageWindow({required this.messages, this.before, this.after});
+
+  factory MessageWindow.fromJson(Map<String, dynamic> json) {
+    return MessageWindow(
+      messages: (json['messages'] as List)
+          .map((message) => Message.fromJson(message))
+          .toList(),
+      before: json['before'],
+      after: json['after'],
+    );
+  }
+}
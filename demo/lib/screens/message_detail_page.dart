@@ -19,10 +19,16 @@ class _MessageDetailPageState extends State<MessageDetailPage> {
   final ApiService _apiService = ApiService();
   final TextEditingController _messageController = TextEditingController();
   final ScrollController _scrollController = ScrollController();
-  List<dynamic> messages = [];
+  List<Message> messages = [];
   bool _isLoading = true;
   bool _sendingMessage = false;
 
+  // Cursors around the loaded messages: `before` loads older history
+  // (null once the start is reached), `after` loads newer messages
+  String? _olderCursor;
+  String? _newerCursor;
+  bool _loadingOlder = false;
+
   // Stream subscriptions
   StreamSubscription? _firebaseMessageSubscription;
 
@@ -33,6 +39,9 @@ class _MessageDetailPageState extends State<MessageDetailPage> {
     // Initial fetch of messages
     _fetchMessages();
 
+    // Load older history when scrolled to the top
+    _scrollController.addListener(_onScroll);
+
     // Listen for new messages from Firebase
     _firebaseMessageSubscription =
         FirebaseMessagingService().messageStream.listen(_handleFirebaseMessage);
@@ -60,8 +69,8 @@ class _MessageDetailPageState extends State<MessageDetailPage> {
     // Only refresh if this message is from the user we're chatting with
     if (senderId == widget.userId.toString()) {
       if (mounted) {
-        print("🔄 Refreshing messages for this chat");
-        _fetchMessages();
+        print("🔄 Loading new messages for this chat");
+        _fetchNewMessages();
       }
     }
   }
@@ -73,13 +82,13 @@ class _MessageDetailPageState extends State<MessageDetailPage> {
         await _apiService.getCurrentUserId();
       }
 
-      List<Message> fetchedMessages =
-          await _apiService.fetchMessages(widget.userId);
+      final window = await _apiService.fetchMessages(widget.userId);
 
       if (mounted) {
         setState(() {
-          messages = fetchedMessages
-            ..sort((a, b) => a.timestamp.compareTo(b.timestamp));
+          messages = window.messages;
+          _olderCursor = window.before;
+          _newerCursor = window.after;
           _isLoading = false;
         });
       }
@@ -95,6 +104,64 @@ class _MessageDetailPageState extends State<MessageDetailPage> {
     }
   }
 
+  // Append messages newer than the loaded ones
+  Future<void> _fetchNewMessages() async {
+    if (_newerCursor == null) return _fetchMessages();
+
+    try {
+      final window = await _apiService.fetchMessages(widget.userId,
+          after: _newerCursor);
+      if (!mounted || window.messages.isEmpty) return;
+
+      final loadedIds = messages.map((message) => message.id).toSet();
+      setState(() {
+        messages.addAll(
+            window.messages.where((message) => !loadedIds.contains(message.id)));
+        _newerCursor = window.after;
+      });
+      WidgetsBinding.instance.addPostFrameCallback((_) => _scrollToBottom());
+    } catch (e) {
+      print("Error fetching new messages: $e");
+    }
+  }
+
+  void _onScroll() {
+    if (_scrollController.position.pixels <=
+        _scrollController.position.minScrollExtent + 50) {
+      _loadOlderMessages();
+    }
+  }
+
+  // Prepend the window before the oldest loaded message, keeping the
+  // visible messages in place
+  Future<void> _loadOlderMessages() async {
+    if (_loadingOlder || _olderCursor == null) return;
+    _loadingOlder = true;
+
+    try {
+      final window = await _apiService.fetchMessages(widget.userId,
+          before: _olderCursor);
+      if (!mounted) return;
+
+      final distanceFromBottom = _scrollController.position.maxScrollExtent -
+          _scrollController.position.pixels;
+      setState(() {
+        messages.insertAll(0, window.messages);
+        _olderCursor = window.before;
+      });
+      WidgetsBinding.instance.addPostFrameCallback((_) {
+        if (_scrollController.hasClients) {
+          _scrollController.jumpTo(
+              _scrollController.position.maxScrollExtent - distanceFromBottom);
+        }
+      });
+    } catch (e) {
+      print("Error loading older messages: $e");
+    } finally {
+      _loadingOlder = false;
+    }
+  }
+
   // This method is now only called when explicitly requested by the user
   Future<void> _markMessagesAsRead() async {
     try {
@@ -167,7 +234,7 @@ class _MessageDetailPageState extends State<MessageDetailPage> {
           widget.userId, _messageController.text.trim());
 
       _messageController.clear();
-      await _fetchMessages(); // Refresh message list after sending
+      await _fetchNewMessages(); // Append the sent message
     } catch (e) {
       print("Error sending message: $e");
     }
@@ -1146,15 +1146,24 @@ class ApiService {
   }
 
   // **2. Fetch Messages with a User**
-  Future<List<Message>> fetchMessages(int otherUserId) async {
+  // Without a cursor returns the latest messages; pass `before` to load
+  // older ones and `after` to load messages newer than a previous window.
+  Future<MessageWindow> fetchMessages(int otherUserId,
+      {String? before, String? after}) async {
+    final query = {
+      'other_user_id': otherUserId.toString(),
+      if (before != null) 'before': before,
+      if (after != null) 'after': after,
+    };
     final response = await makeAuthenticatedRequest(
-      url: '$baseApiUrl/messages/?other_user_id=$otherUserId',
+      url: Uri.parse('$baseApiUrl/messages/')
+          .replace(queryParameters: query)
+          .toString(),
       method: 'GET',
     );
 
     if (response.statusCode == 200) {
-      List<dynamic> data = jsonDecode(response.body);
-      return data.map((json) => Message.fromJson(json)).toList();
+      return MessageWindow.fromJson(jsonDecode(response.body));
     } else {
       throw Exception("Failed to load messages");
     }